@@ -17,6 +17,7 @@ def run_experiment(
     experiment_name: str,
     custom_settings: dict = None,
     i_run: int = 0,
+    resume: bool = False,
 ):
     # Initialize the experiment
     experiment = Experiment(
@@ -33,9 +34,12 @@ def run_experiment(
     mcmc = MCMCSetup(data=data, experiment=experiment)
     mcmc.log_setup()
 
-    # Warm-up and run MCMC sampling
-    mcmc.warm_up()
-    mcmc.sample(run=i_run)
+    # Continue from the last checkpoint (if there is one) or warm-up and run MCMC sampling
+    if resume and mcmc.get_checkpoint_path(run=i_run).exists():
+        mcmc.sample(run=i_run, resume=True)
+    else:
+        mcmc.warm_up()
+        mcmc.sample(run=i_run)
 
     # Use the last sample as the new initial sample
     return mcmc.samples.last_sample
@@ -43,13 +47,14 @@ def run_experiment(
 
 def runner(args):
     """A wrapper for `run_experiment` to make it callable using the pool.map interface."""
-    i_run, n_clusters, config, experiment_name = args
+    i_run, n_clusters, config, experiment_name, resume = args
     # run_experiment(config, f"{experiment_name}/K{n_clusters}_{i_run}",
     run_experiment(
         config=config,
         experiment_name=experiment_name,
         custom_settings={"model": {"clusters": n_clusters}, "mcmc": {"runs": 1}},
         i_run=i_run,
+        resume=resume,
     )
 
 
@@ -58,6 +63,7 @@ def main(
     experiment_name: str = None,
     custom_settings: dict = None,
     processes: int = 1,
+    resume: bool = False,
 ):
     # Initialize the experiment
     experiment = Experiment(
@@ -76,7 +82,7 @@ def main(
 
     # Define configurations for each distinct sBayes run that needs to be executed
     run_configurations = product(
-        i_run_range, n_clusters_range, [config], [experiment.experiment_name]
+        i_run_range, n_clusters_range, [config], [experiment.experiment_name], [resume]
     )
 
     # Run all configurations sequentially or in parallel
@@ -116,6 +122,13 @@ def cli():
         help="The number of parallel processes.",
     )
 
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted experiment (with the same name) from the last checkpoints "
+             "(see `checkpoint_interval` in the mcmc config).",
+    )
+
     args = parser.parse_args()
     config = args.config
 
@@ -128,7 +141,7 @@ def cli():
             filetypes=(("json files", "*.json"), ("all files", "*.*")),
         )
 
-    main(config=config, experiment_name=args.name, processes=args.threads)
+    main(config=config, experiment_name=args.name, processes=args.threads, resume=args.resume)
 
 
 if __name__ == "__main__":
@@ -20,7 +20,7 @@ except ImportError:
 from pydantic import BaseModel, Extra, Field
 from pydantic import root_validator, ValidationError
 from pydantic import FilePath, DirectoryPath
-from pydantic import PositiveInt, PositiveFloat, confloat, NonNegativeFloat
+from pydantic import PositiveInt, PositiveFloat, confloat, conint, conlist, NonNegativeFloat
 
 from sbayes.util import fix_relative_path, decompose_config_path, PathLike
 from sbayes.util import update_recursive
@@ -284,6 +284,10 @@ class OperatorsConfig(BaseConfig):
     source: NonNegativeFloat = 10.0
     """Frequency at which the assignments of observations to mixture components are changed."""
 
+    confounding_effects_all_groups: bool = False
+    """If `true`, each Gibbs step on the confounding effects resamples all groups of a confounder
+    at once (instead of a single random group)."""
+
 
 class WarmupConfig(BaseConfig):
 
@@ -296,6 +300,29 @@ class WarmupConfig(BaseConfig):
     """The number parallel chains used in the warm-up phase."""
 
 
+class MC3Config(BaseConfig):
+
+    """Configuration of Metropolis-Coupled Markov Chain Monte Carlo (MC3) parameters."""
+
+    activate: bool = False
+    """If `true`, use Metropolis-Coupled Markov Chain Monte Carlo (MC3)."""
+
+    chains: PositiveInt = 4
+    """The number of MC3 chains (one cold chain and `chains - 1` heated chains)."""
+
+    swap_interval: PositiveInt = 1000
+    """The number of MCMC steps between two swap proposals."""
+
+    swap_attempts: PositiveInt = 1
+    """The number of swaps proposed (between random pairs of adjacent chains) at every swap interval."""
+
+    temperature_diff: PositiveFloat = 0.05
+    """The difference between the temperatures of two adjacent chains."""
+
+    exponential_temperatures: bool = False
+    """If `true`, temperatures increase exponentially ((1+temperature_diff)^i) instead of linearly (1+i*temperature_diff)."""
+
+
 class MCMCConfig(BaseConfig):
 
     """Configuration of MCMC parameters."""
@@ -318,8 +345,22 @@ class MCMCConfig(BaseConfig):
     grow_to_adjacent: confloat(ge=0, le=1) = 0.8
     """The fraction of grow-steps that only propose adjacent languages as candidates to be added to an area."""
 
+    processes: PositiveInt = 1
+    """The number of worker processes used to run the MCMC chains (e.g. the warm-up chains) in parallel."""
+
+    checkpoint_interval: Optional[PositiveInt] = None
+    """The number of logged samples between two checkpoints of the sampler state. An interrupted
+    run can be continued from the last checkpoint with the `--resume` option. By default, no 
+    checkpoints are written."""
+
+    delayed_acceptance: bool = False
+    """If `true`, candidates of the cluster operators are first accepted or rejected based on the cluster size prior, the geo-prior
+    and the proposal ratio alone. The likelihood is only evaluated for candidates passing this first
+    stage. The second stage corrects for the first one, so that the posterior is unchanged."""
+
     operators: OperatorsConfig = Field(default_factory=OperatorsConfig)
     warmup: WarmupConfig = Field(default_factory=WarmupConfig)
+    mc3: MC3Config = Field(default_factory=MC3Config)
 
     @root_validator
     def validate_sample_spacing(cls, values):
@@ -333,6 +374,10 @@ class DataConfig(BaseConfig):
 
     """Information on the data for an sBayes analysis."""
 
+    class Precisions(str, Enum):
+        FLOAT64 = "float64"
+        FLOAT32 = "float32"
+
     features: RelativeFilePath
     """Path to the CSV file with features used for the analysis."""
 
@@ -342,11 +387,71 @@ class DataConfig(BaseConfig):
     projection: str = "epsg:4326"
     """String identifier of the projection in which locations are given."""
 
+    distance_precision: Precisions = Precisions.FLOAT64
+    """Floating point precision of the distance matrix between all objects. `float32` halves 
+    the memory of the matrix (which grows quadratically with the number of objects)."""
+
+    cache: bool = False
+    """If `true`, the preprocessed data (encoded features, confounders, network and distances) 
+    is cached in a binary file next to the features file and re-used by runs with the same 
+    input files and projection."""
+
+
+class LikelihoodLoggingConfig(BaseConfig):
+
+    """Configuration of the likelihood file (likelihood_K*.h5), which contains the
+    likelihood of each observation in each logged sample (e.g. for WAIC or LOO)."""
+
+    class Compressions(str, Enum):
+        ZLIB = "zlib"
+        BLOSC_ZLIB = "blosc:zlib"
+        BLOSC_LZ4 = "blosc:lz4"
+        BLOSC_ZSTD = "blosc:zstd"
+        BLOSC_BLOSCLZ = "blosc:blosclz"
+
+    class Precisions(str, Enum):
+        FLOAT32 = "float32"
+        FLOAT16 = "float16"
+
+    complib: Compressions = Compressions.BLOSC_ZLIB
+    """The compression library (`blosc:lz4` is much faster than the `zlib` codecs)."""
+
+    complevel: conint(ge=0, le=9) = 9
+    """The compression level (0 disables compression)."""
+
+    checksum: bool = True
+    """Whether to store a checksum (fletcher32) for each chunk of the likelihood file."""
+
+    precision: Precisions = Precisions.FLOAT32
+    """Floating point precision of the stored likelihood values. `float16` halves the file 
+    size, but is only accurate to about 3 significant digits and rounds likelihood values 
+    below ~6e-8 to zero."""
+
+    thinning: PositiveInt = 1
+    """Only every n-th logged sample is written to the likelihood file."""
+
+    buffer_size: PositiveInt = 1
+    """The number of samples collected in memory before they are written to the file."""
+
+    chunk_shape: Optional[conlist(PositiveInt, min_items=2, max_items=2)] = None
+    """The shape of the chunks in the likelihood file as [samples, observations]. Tall 
+    chunks (e.g. [1000, 100]) make reading single observations across all samples faster. 
+    Per default the chunk shape is chosen by pytables."""
+
 
 class ResultsConfig(BaseConfig):
 
     """Information on where and how results are written."""
 
+    class SampleFormats(str, Enum):
+        TEXT = "text"
+        HDF5 = "hdf5"
+
+    class ClustersEncodings(str, Enum):
+        TEXT = "text"
+        PACKED = "packed"
+        PACKED_ZLIB = "packed_zlib"
+
     path: RelativeDirectoryPath = Field(
         default_factory=lambda: RelativeDirectoryPath.fix_path("./results")
     )
@@ -355,6 +460,25 @@ class ResultsConfig(BaseConfig):
     log_file: bool = True
     """Whether to write log-messages to a file."""
 
+    sample_format: SampleFormats = SampleFormats.TEXT
+    """Format of the logged samples: `text` writes the tab-separated stats_K*.txt and 
+    clusters_K*.txt files, `hdf5` writes all samples to a binary samples_K*.h5 file."""
+
+    clusters_encoding: ClustersEncodings = ClustersEncodings.TEXT
+    """Encoding of the clusters file for the `text` sample format: `text` writes one bit-string 
+    per cluster (clusters_K*.txt), `packed` writes bit-packed binary rows (clusters_K*.bin) 
+    and `packed_zlib` additionally compresses them with zlib."""
+
+    async_writer: bool = False
+    """If `true`, samples are formatted and written to the results files in a background
+    thread, so that the MCMC does not wait for slow file systems."""
+
+    async_queue_size: PositiveInt = 16
+    """The maximum number of samples waiting to be written by the background thread. If the
+    queue is full, the MCMC waits until the background thread caught up."""
+
+    likelihood: LikelihoodLoggingConfig = Field(default_factory=LikelihoodLoggingConfig)
+
 
 class SettingsForLinguists(BaseConfig):
 
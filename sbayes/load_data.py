@@ -2,10 +2,15 @@
 # -*- coding: utf-8 -*-
 """ Imports the real world data """
 from __future__ import annotations
+import hashlib
+import json
+import os
+import pickle
 import pyproj
 from dataclasses import dataclass, field
 from logging import Logger
 from collections import OrderedDict
+from pathlib import Path
 from typing import Optional, TypeVar, Type
 
 try:
@@ -31,6 +36,9 @@ StateName = TypeVar('StateName', bound=str)
 ConfounderName = TypeVar('ConfounderName', bound=str)
 GroupName = TypeVar('GroupName', bound=str)
 
+DATA_CACHE_VERSION = 1
+"""Version of the preprocessed-data cache format (part of the cache key)."""
+
 
 @dataclass
 class Objects:
@@ -60,20 +68,12 @@ class Objects:
 
     @classmethod
     def from_dataframe(cls: Type[S], data: pd.DataFrame) -> S:
-        n_objects = data.shape[0]
         try:
-            x = data["x"]
-            y = data["y"]
+            locations = data[["x", "y"]].to_numpy(dtype=float)
             id_ext = data["id"].tolist()
         except KeyError:
             raise KeyError("The csv must contain columns `x`, `y` and `id`")
 
-        locations = np.zeros((n_objects, 2))
-        for i in range(n_objects):
-            # Define location tuples
-            locations[i, 0] = float(x[i])
-            locations[i, 1] = float(y[i])
-
         objects_dict = {
             "locations": locations,
             "id": id_ext,
@@ -94,11 +94,18 @@ class Features:
     feature_and_state_names: OrderedDict[FeatureName, list[StateName]] = field(init=False)
     # TODO This could replace names and state_names
 
+    state_index: NDArray[int] = field(init=False)  # shape: (n_objects, n_features)
+    # Compact encoding of `values`: the index of the observed state or -1 for NA
+
     def __post_init__(self):
         object.__setattr__(self, 'feature_and_state_names', OrderedDict())
         for f, states_names_f in zip(self.names, self.state_names):
             self.feature_and_state_names[f] = states_names_f
 
+        dtype = np.int8 if self.values.shape[-1] <= np.iinfo(np.int8).max else np.int16
+        state_index = np.where(self.values.any(axis=-1), self.values.argmax(axis=-1), -1)
+        object.__setattr__(self, 'state_index', state_index.astype(dtype))
+
     def __getitem__(self, key: str) -> NDArray | list | int:
         return getattr(self, key)
 
@@ -212,6 +219,7 @@ class Data:
         projection: Optional[str] = "epsg:4326",
         geo_costs: Literal["from_data"] | PathLike = "from_data",
         logger: Logger = None,
+        distance_dtype: str = "float64",
     ):
         self.objects = objects
         self.features = features
@@ -219,7 +227,7 @@ class Data:
         self.logger = logger
 
         self.crs = pyproj.CRS(projection)
-        self.network = ComputeNetwork(self.objects, crs=self.crs)
+        self.network = ComputeNetwork(self.objects, crs=self.crs, dtype=distance_dtype)
 
         if geo_costs == "from_data":
             self.geo_cost_matrix = self.network.dist_mat
@@ -228,11 +236,26 @@ class Data:
                 object_names=self.objects.id, file=geo_costs, logger=self.logger
             )
 
+    def __getstate__(self) -> dict:
+        # The logger is specific to the current experiment
+        state = self.__dict__.copy()
+        state["logger"] = None
+        return state
+
     @classmethod
     def from_config(cls: Type[S], config: SBayesConfig, logger=None) -> S:
         if logger:
             cls.log_loading(logger)
 
+        # Re-use the preprocessed data of a previous run with the same inputs
+        cache_path = get_data_cache_path(config) if config.data.cache else None
+        if cache_path is not None and cache_path.exists():
+            data = read_data_cache(cache_path)
+            data.logger = logger
+            if logger:
+                logger.info(f"Preprocessed data read from {cache_path}.")
+            return data
+
         # Load objects, features, confounders
         objects, features, confounders = read_features_from_csv(
             data_path=config.data.features,
@@ -242,15 +265,23 @@ class Data:
         )
 
         # Create a Data object using __init__
-        return cls(
+        data = cls(
             objects=objects,
             features=features,
             confounders=confounders,
             projection=config.data.projection,
             geo_costs=config.model.prior.geo.costs,
             logger=logger,
+            distance_dtype=config.data.distance_precision.value,
         )
 
+        if cache_path is not None:
+            write_data_cache(data, cache_path)
+            if logger:
+                logger.info(f"Preprocessed data written to {cache_path}.")
+
+        return data
+
     @classmethod
     def from_experiment(cls: Type[S], experiment: Experiment) -> S:
         return cls.from_config(experiment.config, logger=experiment.logger)
@@ -282,6 +313,47 @@ class Data:
 #     )
 
 
+def get_data_cache_path(config: SBayesConfig) -> Path:
+    """Return the path of the preprocessed-data cache for the given config. The file name
+    contains a hash of all inputs of the preprocessing (the content of the data files, the
+    projection and the confounders), so that changed inputs never hit a stale cache."""
+    key = hashlib.sha256(f"sbayes-data-cache-v{DATA_CACHE_VERSION}".encode())
+
+    input_files = [config.data.features, config.data.feature_states]
+    if config.model.prior.geo.costs != "from_data":
+        input_files.append(config.model.prior.geo.costs)
+    for path in input_files:
+        content = Path(path).read_bytes()
+        key.update(len(content).to_bytes(8, "little"))
+        key.update(content)
+
+    settings = {
+        "projection": config.data.projection,
+        "distance_precision": config.data.distance_precision.value,
+        "confounders": config.model.confounders,
+    }
+    key.update(json.dumps(settings).encode())
+
+    cache_dir = Path(config.data.features).parent / ".sbayes_cache"
+    return cache_dir / f"data_{key.hexdigest()[:32]}.pkl"
+
+
+def read_data_cache(cache_path: PathLike) -> Data:
+    with open(cache_path, "rb") as cache_file:
+        return pickle.load(cache_file)
+
+
+def write_data_cache(data: Data, cache_path: PathLike):
+    """Write the preprocessed data to a binary file. The file is written under a temporary
+    name first, so that parallel runs never read an incomplete cache."""
+    cache_path = Path(cache_path)
+    cache_path.parent.mkdir(exist_ok=True)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as cache_file:
+        pickle.dump(data, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+
+
 def read_features_from_csv(
     data_path: PathLike,
     feature_states_path: PathLike,
@@ -3,13 +3,15 @@
 
 """ Setup of the MCMC process """
 from __future__ import annotations
+from pathlib import Path
 
 from sbayes.sampling.sbayes_sampling import ClusterMCMC, ClusterMCMCWarmup
 from sbayes.sampling.state import Sample
 from sbayes.model import Model
 from sbayes.sampling.loggers import ResultsLogger, ParametersCSVLogger, ClustersLogger, LikelihoodLogger, \
-    OperatorStatsLogger
+    OperatorStatsLogger, ClusterMatcher, SamplesHDF5Logger, PackedClustersLogger, AsyncSampleWriter
 from sbayes.experiment_setup import Experiment
+from sbayes.config.config import ResultsConfig
 from sbayes.load_data import Data
 
 
@@ -46,6 +48,9 @@ MCMC SETUP
 ##########################################
 MCMC with {mcmc_cfg.steps} steps and {mcmc_cfg.samples} samples
 Warm-up: {wu_cfg.warmup_chains} chains exploring the parameter space in {wu_cfg.warmup_steps} steps
+Chains are run in {mcmc_cfg.processes} process(es)
+Delayed acceptance: {"on" if mcmc_cfg.delayed_acceptance else "off"}
+MC3: {f"{mcmc_cfg.mc3.chains} chains swapping every {mcmc_cfg.mc3.swap_interval} steps" if mcmc_cfg.mc3.activate else "off"}
 Ratio of cluster steps (growing, shrinking, swapping clusters): {op_cfg.clusters}
 Ratio of weight steps (changing weights): {op_cfg.weights}
 Ratio of cluster_effect steps (changing probabilities in clusters): {op_cfg.cluster_effect}
@@ -54,12 +59,15 @@ Ratio of confounding_effects steps (changing probabilities in confounders): {op_
             self.logger.info(f'Ratio of source steps (changing source component assignment): {op_cfg.source}')
         self.logger.info('\n')
 
-    def sample(self, initial_sample: Sample | None = None, run: int = 1):
+    def sample(self, initial_sample: Sample | None = None, run: int = 1, resume: bool = False):
         mcmc_config = self.config.mcmc
 
         if initial_sample is None:
             initial_sample = self.sample_from_warm_up
 
+        if resume:
+            self.logger.info(f'Resuming the MCMC run from the checkpoint {self.get_checkpoint_path(run)}')
+
         sample_loggers = self.get_sample_loggers(run=run)
 
         self.sampler = ClusterMCMC(
@@ -72,9 +80,14 @@ Ratio of confounding_effects steps (changing probabilities in confounders): {op_
             initial_size=mcmc_config.init_objects_per_cluster,
             sample_from_prior=mcmc_config.sample_from_prior,
             logger=self.logger,
+            n_processes=mcmc_config.processes,
+            delayed_acceptance=mcmc_config.delayed_acceptance,
+            checkpoint_path=self.get_checkpoint_path(run),
+            checkpoint_interval=mcmc_config.checkpoint_interval,
+            **self.get_mc3_arguments(),
         )
 
-        self.sampler.generate_samples(mcmc_config.steps, mcmc_config.samples)
+        self.sampler.generate_samples(mcmc_config.steps, mcmc_config.samples, resume=resume)
 
         self.samples = self.sampler.statistics  # TODO do we still need this?
         self.sampler.print_statistics()
@@ -92,6 +105,8 @@ Ratio of confounding_effects steps (changing probabilities in confounders): {op_
             initial_size=mcmc_config.init_objects_per_cluster,
             sample_from_prior=mcmc_config.sample_from_prior,
             logger=self.logger,
+            n_processes=mcmc_config.processes,
+            delayed_acceptance=mcmc_config.delayed_acceptance,
         )
 
         self.sample_from_warm_up = warmup.generate_samples(n_steps=0,
@@ -99,22 +114,77 @@ Ratio of confounding_effects steps (changing probabilities in confounders): {op_
                                                            warm_up=True,
                                                            warm_up_steps=mcmc_config.warmup.warmup_steps)
 
-    def get_sample_loggers(self, run=1) -> list[ResultsLogger]:
+    def get_mc3_arguments(self) -> dict:
+        mc3_config = self.config.mcmc.mc3
+        if not mc3_config.activate:
+            return {}
+        return dict(
+            n_chains=mc3_config.chains,
+            mc3=True,
+            swap_period=mc3_config.swap_interval,
+            chain_swaps=mc3_config.swap_attempts,
+            temperature_diff=mc3_config.temperature_diff,
+            exponential_temperatures=mc3_config.exponential_temperatures,
+        )
+
+    def get_checkpoint_path(self, run=1) -> Path:
+        k = self.model.n_clusters
+        return self.path_results / f'K{k}' / f'checkpoint_K{k}_{run}.pkl'
+
+    def get_sample_loggers(self, run=1) -> list[ResultsLogger | AsyncSampleWriter]:
         k = self.model.n_clusters
         base_dir = self.path_results / f'K{k}'
         base_dir.mkdir(exist_ok=True)
         params_path = base_dir / f'stats_K{k}_{run}.txt'
         clusters_path = base_dir / f'clusters_K{k}_{run}.txt'
+        samples_path = base_dir / f'samples_K{k}_{run}.h5'
         likelihood_path = base_dir / f'likelihood_K{k}_{run}.h5'
         op_stats_path = base_dir / f'operator_stats_K{k}_{run}.txt'
 
-        sample_loggers = [
-            ParametersCSVLogger(params_path, self.data, self.model),
-            ClustersLogger(clusters_path, self.data, self.model),
-            OperatorStatsLogger(op_stats_path, self.data, self.model, operators=[])
-        ]
+        if self.config.results.sample_format == ResultsConfig.SampleFormats.HDF5:
+            sample_loggers = [
+                SamplesHDF5Logger(samples_path, self.data, self.model),
+            ]
+        else:
+            # Both loggers share one matcher, so that cluster labels are aligned once per sample
+            cluster_matcher = ClusterMatcher()
+            clusters_encoding = self.config.results.clusters_encoding
+            if clusters_encoding == ResultsConfig.ClustersEncodings.TEXT:
+                clusters_logger = ClustersLogger(clusters_path, self.data, self.model,
+                                                 cluster_matcher=cluster_matcher)
+            else:
+                clusters_logger = PackedClustersLogger(
+                    clusters_path.with_suffix('.bin'), self.data, self.model,
+                    cluster_matcher=cluster_matcher,
+                    compress=(clusters_encoding == ResultsConfig.ClustersEncodings.PACKED_ZLIB),
+                )
+            sample_loggers = [
+                ParametersCSVLogger(params_path, self.data, self.model, cluster_matcher=cluster_matcher),
+                clusters_logger,
+            ]
 
         if not self.config.mcmc.sample_from_prior:
-            sample_loggers.append(LikelihoodLogger(likelihood_path, self.data, self.model))
+            lh_config = self.config.results.likelihood
+            sample_loggers.append(LikelihoodLogger(
+                likelihood_path, self.data, self.model,
+                complib=lh_config.complib.value,
+                complevel=lh_config.complevel,
+                checksum=lh_config.checksum,
+                precision=lh_config.precision.value,
+                thinning=lh_config.thinning,
+                buffer_size=lh_config.buffer_size,
+                chunk_shape=lh_config.chunk_shape,
+            ))
+
+        if self.config.results.async_writer:
+            # Write samples in a background thread
+            sample_loggers = [
+                AsyncSampleWriter(sample_loggers, max_queue_size=self.config.results.async_queue_size)
+            ]
+
+        # The operator statistics are written synchronously (they are read from the operators)
+        sample_loggers.append(
+            OperatorStatsLogger(op_stats_path, self.data, self.model, operators=[])
+        )
 
         return sample_loggers
@@ -3,6 +3,8 @@ from sbayes.model.likelihood import (
     Likelihood,
     update_weights,
     normalize_weights,
+    lookup_state_probs,
+    count_group_states,
 )
 from sbayes.model.prior import (
     Prior,
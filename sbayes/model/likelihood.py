@@ -10,7 +10,7 @@ except ImportError:
 import numpy as np
 from numpy.typing import NDArray
 
-from sbayes.sampling.state import Sample, ArrayParameter
+from sbayes.sampling.state import Sample, StateCounts, ObjectsNode
 from sbayes.load_data import Data
 
 
@@ -30,18 +30,29 @@ class Likelihood(object):
     Attributes:
         features (np.array): The values for all sites and features.
             shape: (n_objects, n_features, n_categories)
+        state_index (np.array): The index of the observed state for all sites and
+            features (-1 for missing observations).
+            shape: (n_objects, n_features)
         confounders (dict): Assignment of objects to confounders. For each confounder (c) one np.array
             with shape: (n_groups(c), n_objects)
         shapes (ModelShapes): A dataclass with shape information for building the Likelihood and Prior objects
         na_features (np.array): A boolean array indicating missing observations
             shape: (n_objects, n_features)
+        confounder_group_index (dict): The index of the group of each object for each
+            confounder (-1 for objects without a group). For each confounder one np.array
+            with shape: (n_objects,)
     """
 
     def __init__(self, data: Data, shapes: ModelShapes):
         self.features = data.features.values
+        self.state_index = data.features.state_index
         self.confounders = data.confounders
         self.shapes = shapes
-        self.na_features = (np.sum(self.features, axis=-1) == 0)
+        self.na_features = (self.state_index < 0)
+        self.confounder_group_index = {
+            conf: get_group_index(confounder.group_assignment)
+            for conf, confounder in self.confounders.items()
+        }
 
     def __call__(self, sample, caching=True):
         """Compute the likelihood of all sites. The likelihood is defined as a mixture of areal and confounding effects.
@@ -59,25 +70,105 @@ class Likelihood(object):
         # Compute the weights of the mixture component in each feature and site
         weights = update_weights(sample, caching=caching)
 
-        # Compute the total log-likelihood
-        observation_lhs = self.get_observation_lhs(component_lhs, weights, sample.source)
-        sample.observation_lhs = observation_lhs
-        log_lh = np.sum(np.log(observation_lhs))
+        # Update the likelihood of the observations of all affected objects and the
+        # total log-likelihood
+        cache = sample.cache.observation_lhs
+        if not caching or cache.is_outdated():
+            cluster_index = sample.cache.component_likelihoods.cluster_index
+            rows = self.get_changed_objects(sample, cache, cluster_index, caching=caching)
+            source = None if sample.source is None else sample.source.value[rows]
+            with cache.edit(rows=rows) as observation_lhs:
+                observation_lhs[rows] = self.get_observation_lhs(
+                    component_lhs[rows], weights[rows], source
+                )
+                cache.update_log_lh(rows)
+                cache.cluster_index = cluster_index
 
-        return log_lh
+        sample.observation_lhs = cache.value.ravel()
+        return cache.log_lh
 
     @staticmethod
     def get_observation_lhs(
         all_lh: NDArray,                # shape: (n_objects, n_features, n_components)
         weights: NDArray[float],        # shape: (n_objects, n_features, n_components)
-        source: ArrayParameter | None,  # shape: (n_objects, n_features, n_components)
+        source: NDArray[bool] | None,   # shape: (n_objects, n_features, n_components)
     ) -> NDArray[float]:                # shape: (n_objects, n_features)
         """Combine likelihood from the selected source distributions."""
         if source is None:
-            return np.sum(weights * all_lh, axis=2).ravel()
+            return np.sum(weights * all_lh, axis=2)
         else:
-            is_source = np.where(source.value.ravel())
-            return all_lh.ravel()[is_source]
+            return all_lh[source].reshape(source.shape[:2])
+
+    def get_changed_objects(
+        self,
+        sample: Sample,
+        cache: ObjectsNode,
+        cluster_index: NDArray[int],  # shape: (n_objects,)
+        caching=True,
+    ) -> NDArray[int] | slice:
+        """Find the objects affected by changes of the inputs of `cache` since its last
+        update: the members of changed clusters and confounder groups (including the
+        objects that left a changed cluster) and the objects with a changed source. If all
+        objects are affected (e.g. by changed weights), a full slice is returned."""
+        if not caching or cache.cluster_index is None:
+            return slice(None)
+        if cache.cleared:
+            return slice(None)
+        if 'weights' in cache.inputs and cache.ahead_of('weights'):
+            return slice(None)
+
+        n_clusters = sample.n_clusters
+        changed_clusters = cache.what_changed(['cluster_effect', 'clusters'])
+        changed_objects = [
+            get_group_members(cluster_index, changed_clusters, n_clusters),
+            get_group_members(cache.cluster_index, changed_clusters, n_clusters),
+        ]
+        for conf, confounder in self.confounders.items():
+            changed_groups = cache.what_changed(f'c_{conf}')
+            changed_objects.append(get_group_members(
+                self.confounder_group_index[conf], changed_groups, confounder.n_groups
+            ))
+        if 'source' in cache.inputs:
+            # The groups of the source are the objects
+            changed_source = cache.what_changed('source')
+            changed_objects.append(np.fromiter(changed_source, dtype=int, count=len(changed_source)))
+
+        return np.unique(np.concatenate(changed_objects))
+
+    def get_cluster_contributions(
+        self,
+        sample: Sample,
+        caching=True
+    ) -> NDArray[float]:  # shape: (n_clusters,)
+        """Compute the log-likelihood of the model restricted to each single cluster, i.e.
+        with all other clusters removed (marginalised over the source of each observation).
+        The contributions are derived from the cached component likelihoods and normalized
+        weights: objects outside the cluster use the weights of the confounding effects,
+        re-normalized without the cluster effect.
+            Args:
+                sample: A Sample object consisting of clusters and weights
+            Returns:
+                The log-likelihood contribution of each cluster
+        """
+        component_lhs = self.update_component_likelihoods(sample, caching=caching)
+        weights = update_weights(sample, caching=caching)
+
+        # Likelihood of each observation with and without the cluster effect
+        lh_with_cluster = np.sum(weights * component_lhs, axis=2)
+        conf_weights = weights[..., 1:]
+        lh_without_cluster = (np.sum(conf_weights * component_lhs[..., 1:], axis=2)
+                              / np.sum(conf_weights, axis=2))
+
+        # Sum the log-likelihood over features for each object
+        in_cluster = sample.clusters.any_cluster()
+        log_lh_with_cluster = np.sum(np.log(lh_with_cluster), axis=1)
+        log_lh_without_cluster = np.where(
+            in_cluster, np.sum(np.log(lh_without_cluster), axis=1), log_lh_with_cluster
+        )
+
+        # Only the objects in the cluster include the cluster effect
+        log_lh_diff = log_lh_with_cluster - log_lh_without_cluster
+        return np.sum(log_lh_without_cluster) + sample.clusters.value @ log_lh_diff
 
     def update_component_likelihoods(
         self,
@@ -95,22 +186,33 @@ class Likelihood(object):
                 assert np.all(x == self.update_component_likelihoods(sample, caching=False))
             return x
 
-        with cache.edit() as component_likelihood:
+        cluster_index = get_group_index(sample.clusters.value)
+        changed_clusters = cache.what_changed(['cluster_effect', 'clusters'], caching)
+        changed_groups = {conf: cache.what_changed(f'c_{conf}', caching)
+                          for conf in self.confounders}
+
+        # In a transaction, only the rows of the affected objects are recorded
+        if cache.undo_log is not None:
+            rows = self.get_changed_objects(sample, cache, cluster_index, caching=caching)
+        else:
+            rows = slice(None)
+
+        with cache.edit(rows=rows) as component_likelihood:
             # TODO: Not sure whether a context manager is the best way to do this. Discuss!
             # Update component likelihood for cluster effects:
             compute_component_likelihood(
-                features=self.features,
+                state_index=self.state_index,
                 probs=sample.cluster_effect.value,
-                groups=sample.clusters.value,
-                changed_groups=cache.what_changed(['cluster_effect', 'clusters'], caching),
+                group_index=cluster_index,
+                changed_groups=changed_clusters,
                 out=component_likelihood[..., 0],
             )
             if caching and CHECK_CACHING:
                 x = component_likelihood[..., 0].copy()
                 y = compute_component_likelihood(
-                    features=self.features,
+                    state_index=self.state_index,
                     probs=sample.cluster_effect.value,
-                    groups=sample.clusters.value,
+                    group_index=cluster_index,
                     changed_groups=cache.what_changed(['cluster_effect', 'clusters'], caching=False),
                     out=component_likelihood[..., 0],
                 )
@@ -119,46 +221,212 @@ class Likelihood(object):
             # Update component likelihood for confounding effects:
             for i, conf in enumerate(self.confounders, start=1):
                 compute_component_likelihood(
-                    features=self.features,
+                    state_index=self.state_index,
                     probs=sample.confounding_effects[conf].value,
-                    groups=sample.confounders[conf].group_assignment,
-                    changed_groups=cache.what_changed(f'c_{conf}', caching),
+                    group_index=self.confounder_group_index[conf],
+                    changed_groups=changed_groups[conf],
                     out=component_likelihood[..., i],
                 )
                 if caching and CHECK_CACHING:
                     x = component_likelihood[..., i].copy()
                     y: object = compute_component_likelihood(
-                        features=self.features,
+                        state_index=self.state_index,
                         probs=sample.confounding_effects[conf].value,
-                        groups=sample.confounders[conf].group_assignment,
+                        group_index=self.confounder_group_index[conf],
                         changed_groups=cache.what_changed(f'c_{conf}', caching=False),
                         out=component_likelihood[..., i],
                     )
                     assert np.all(x[~self.na_features] == y[~self.na_features])
 
             component_likelihood[self.na_features] = 1.
+            cache.cluster_index = cluster_index
 
         # cache.set_up_to_date()
 
         return cache.value
 
+    def update_cluster_state_counts(
+        self,
+        sample: Sample,
+        caching=True
+    ) -> NDArray[int]:  # shape: (n_clusters, n_features, n_states)
+        """Update the counts of observed states attributed to the cluster effect of each cluster."""
+        cache = sample.cache.cluster_state_counts
+        if caching and not cache.is_outdated():
+            return cache.value
+
+        if caching and cache.counted_groups is not None and not cache.what_changed('clusters'):
+            cluster_index = cache.counted_groups
+        else:
+            cluster_index = get_group_index(sample.clusters.value)
+
+        return update_state_counts(
+            cache=cache,
+            state_index=self.state_index,
+            group_index=cluster_index,
+            source=sample.source.value[..., 0],
+            changed_objects=cache.what_changed('source') if caching else None,
+        )
+
+    def update_confounder_state_counts(
+        self,
+        sample: Sample,
+        conf: str,
+        caching=True
+    ) -> NDArray[int]:  # shape: (n_groups, n_features, n_states)
+        """Update the counts of observed states attributed to the confounding effect of each
+        group of confounder `conf`."""
+        cache = sample.cache.confounder_state_counts[conf]
+        if caching and not cache.is_outdated():
+            return cache.value
+
+        i_component = list(self.confounders).index(conf) + 1
+        return update_state_counts(
+            cache=cache,
+            state_index=self.state_index,
+            group_index=self.confounder_group_index[conf],
+            source=sample.source.value[..., i_component],
+            changed_objects=cache.what_changed('source') if caching else None,
+        )
+
+
+def get_group_index(
+    groups: NDArray[bool],  # shape: (n_groups, n_objects)
+) -> NDArray[int]:  # shape: (n_objects,)
+    """Find the index of the group each object belongs to (-1 for objects without group).
+    Assumes that each object belongs to at most one group.
+
+    == Usage ===
+    >>> get_group_index(np.array([[True, False, False], [False, False, True]]))
+    array([ 0, -1,  1])
+    """
+    return np.where(groups.any(axis=0), np.argmax(groups, axis=0), -1)
+
+
+def get_group_members(
+    group_index: NDArray[int],  # shape: (n_objects,)
+    groups: set[int],
+    n_groups: int,
+) -> NDArray[int]:
+    """Find the objects that belong to any of the given groups.
+
+    == Usage ===
+    >>> get_group_members(np.array([0, -1, 1, 0]), {0}, n_groups=2)
+    array([0, 3])
+    """
+    # The last entry catches objects without group
+    is_member = np.zeros(n_groups + 1, dtype=bool)
+    is_member[list(groups)] = True
+    return np.flatnonzero(is_member[group_index])
+
 
 def compute_component_likelihood(
-    features: NDArray[bool],
-    probs: NDArray[float],
-    groups: NDArray[bool],  # (n_groups, n_sites)
+    state_index: NDArray[int],  # shape: (n_objects, n_features)
+    probs: NDArray[float],  # shape: (n_groups, n_features, n_states)
+    group_index: NDArray[int],  # shape: (n_objects,)
     changed_groups: set[int],
     out: NDArray[float]
 ) -> NDArray[float]:  # shape: (n_objects, n_features)
-    out[~groups.any(axis=0), :] = 0.
-    for i in changed_groups:
-        g = groups[i]
-        f_g = features[g, :, :]
-        p_g = probs[i, :, :]
-        out[g, :] = np.einsum('ijk,jk->ij', f_g, p_g)
+    out[group_index < 0, :] = 0.
+    if not changed_groups:
+        return out
+
+    # Select all objects in changed groups
+    objects = get_group_members(group_index, changed_groups, n_groups=len(probs))
+
+    # Look up the probability of each observed state in one pass
+    out[objects, :] = lookup_state_probs(probs, group_index[objects], state_index[objects])
     return out
 
 
+def lookup_state_probs(
+    probs: NDArray[float],  # shape: (n_groups, n_features, n_states)
+    group_index: NDArray[int],  # shape: (n_objects,)
+    state_index: NDArray[int],  # shape: (n_objects, n_features)
+) -> NDArray[float]:  # shape: (n_objects, n_features)
+    """Look up the probability of the observed states of each object under the
+    distribution of its group (0 for missing observations). This is equivalent to the dot
+    product of the one-hot encoded features with the probabilities of the group, but it
+    does not touch the states axis.
+
+    == Usage ===
+    >>> probs = np.array([[[0.2, 0.8], [0.6, 0.4]], [[0.9, 0.1], [0.5, 0.5]]])
+    >>> lookup_state_probs(probs, np.array([1, 0]), np.array([[0, -1], [1, 0]]))
+    array([[0.9, 0. ],
+           [0.8, 0.6]])
+    """
+    _, n_features, n_states = probs.shape
+    flat_index = (group_index[:, np.newaxis] * n_features + np.arange(n_features)) * n_states
+    p = np.take(probs, flat_index + np.maximum(state_index, 0))
+    return np.where(state_index < 0, 0., p)
+
+
+def count_group_states(
+    state_index: NDArray[int],  # shape: (n_objects, n_features)
+    group_index: NDArray[int],  # shape: (n_objects,)
+    mask: NDArray[bool],  # shape: (n_objects, n_features)
+    n_groups: int,
+    n_states: int,
+) -> NDArray[int]:  # shape: (n_groups, n_features, n_states)
+    """Count how often each state is observed in each feature and group, considering only
+    the observations selected by `mask` (missing observations and objects without a
+    group are ignored).
+
+    == Usage ===
+    >>> state_index = np.array([[0, 1], [2, -1], [0, 1]])
+    >>> mask = np.array([[True, True], [True, True], [False, True]])
+    >>> count_group_states(state_index, np.array([0, 0, 1]), mask, 2, 3)
+    array([[[1, 0, 1],
+            [0, 1, 0]],
+    <BLANKLINE>
+           [[0, 0, 0],
+            [0, 1, 0]]])
+    """
+    n_features = state_index.shape[1]
+    observed = mask & (state_index >= 0) & (group_index >= 0)[:, np.newaxis]
+    objects, features = np.nonzero(observed)
+    flat_index = (group_index[objects] * n_features + features) * n_states + state_index[observed]
+    counts = np.bincount(flat_index, minlength=n_groups * n_features * n_states)
+    return counts.reshape((n_groups, n_features, n_states))
+
+
+def update_state_counts(
+    cache: StateCounts,
+    state_index: NDArray[int],  # shape: (n_objects, n_features)
+    group_index: NDArray[int],  # shape: (n_objects,)
+    source: NDArray[bool],  # shape: (n_objects, n_features)
+    changed_objects: set[int] | None,
+) -> NDArray[int]:  # shape: (n_groups, n_features, n_states)
+    """Update the state counts of each group in `cache`. Only objects in `changed_objects`
+    or with a changed group are recounted (if `changed_objects` is None, or nothing was
+    counted before, all counts are recomputed)."""
+    n_groups, _, n_states = cache.shape
+
+    if changed_objects is None or cache.counted_source is None:
+        with cache.edit() as counts:
+            counts[...] = count_group_states(state_index, group_index, source, n_groups, n_states)
+        cache.counted_groups = group_index.copy()
+        cache.counted_source = source.copy()
+        cache.shared_snapshot = False
+        return cache.value
+
+    objects = np.union1d(
+        np.fromiter(changed_objects, dtype=int, count=len(changed_objects)),
+        np.flatnonzero(group_index != cache.counted_groups),
+    )
+    with cache.edit_snapshot() as (counted_groups, counted_source):
+        with cache.edit() as counts:
+            # Remove the old and add the new contributions of the changed objects
+            counts -= count_group_states(state_index[objects], counted_groups[objects],
+                                         counted_source[objects], n_groups, n_states)
+            counts += count_group_states(state_index[objects], group_index[objects],
+                                         source[objects], n_groups, n_states)
+        counted_groups[objects] = group_index[objects]
+        counted_source[objects] = source[objects]
+
+    return cache.value
+
+
 def update_weights(sample: Sample, caching=True) -> NDArray[float]:
     """Compute the normalized weights of each component at each site.
     Args:
@@ -171,8 +439,16 @@ def update_weights(sample: Sample, caching=True) -> NDArray[float]:
     cache = sample.cache.weights_normalized
 
     if (not caching) or cache.is_outdated():
-        w_normed = normalize_weights(sample.weights.value, sample.cache.has_components.value)
-        cache.update_value(w_normed)
+        has_components = sample.cache.has_components.value
+        if (not caching) or (cache.has_components is None) or cache.ahead_of('weights'):
+            w_normed = normalize_weights(sample.weights.value, has_components)
+            cache.update_value(w_normed)
+        else:
+            # Only the clusters changed: re-normalize the objects with changed components
+            objects = np.flatnonzero(np.any(has_components != cache.has_components, axis=1))
+            with cache.edit(rows=objects) as w_normed:
+                w_normed[objects] = normalize_weights(sample.weights.value, has_components[objects])
+        cache.has_components = has_components.copy()
 
     return cache.value
 
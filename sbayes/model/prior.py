@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+from dataclasses import dataclass
 from typing import List, Dict, Sequence, Callable, Optional, OrderedDict
 import json
 
@@ -9,12 +10,14 @@ import numpy as np
 from numpy.typing import NDArray
 
 import scipy.stats as stats
-from scipy.sparse.csgraph import minimum_spanning_tree, csgraph_from_dense
+from scipy.special import gammaln, xlogy
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree
 
 from sbayes.model.likelihood import update_weights, ModelShapes
 from sbayes.sampling.state import Sample
-from sbayes.util import (compute_delaunay, n_smallest_distances, log_multinom,
-                         dirichlet_logpdf, log_expit, PathLike)
+from sbayes.util import (compute_delaunay, n_smallest_distances, log_multinom, log_binom,
+                         log_expit, PathLike)
 from sbayes.config.config import PriorConfig, DirichletPriorConfig, GeoPriorConfig, ClusterSizePriorConfig
 from sbayes.load_data import Data, ComputeNetwork, GroupName, ConfounderName, StateName, FeatureName
 
@@ -68,11 +71,8 @@ class Prior:
         Returns:
             The (log)prior of the current sample
         """
-        log_prior = 0
-
         # Sum all prior components (in log-space)
-        log_prior += self.size_prior(sample, caching=caching)
-        log_prior += self.geo_prior(sample, caching=caching)
+        log_prior = self.cluster_prior(sample, caching=caching)
         log_prior += self.prior_weights(sample, caching=caching)
         log_prior += self.prior_cluster_effect(sample, caching=caching)
         for k, v in self.prior_confounding_effects.items():
@@ -87,6 +87,35 @@ class Prior:
 
         return log_prior
 
+    def cluster_prior(self, sample: Sample, caching=True) -> float:
+        """Compute the prior of the clusters alone (size and geo-prior), which is cheap
+        compared to the full posterior.
+        Args:
+            sample: A Sample object consisting of clusters, weights, areal and confounding effects
+        Returns:
+            The (log)prior of the clusters in the current sample
+        """
+        return self.size_prior(sample, caching=caching) + self.geo_prior(sample, caching=caching)
+
+    def get_cluster_contributions(self, sample: Sample, caching=True) -> NDArray[float]:
+        """Compute the log-prior of the model restricted to each single cluster, i.e. with
+        all other clusters removed. The source prior is not included.
+        Args:
+            sample: A Sample object consisting of clusters, weights, areal and confounding effects
+        Returns:
+            The (log)prior contribution of each cluster. shape: (n_clusters,)
+        """
+        # The priors on weights and confounding effects are shared by all clusters
+        log_prior = self.prior_weights(sample, caching=caching)
+        for k, v in self.prior_confounding_effects.items():
+            log_prior += v(sample, caching=caching)
+
+        # Size, geo and cluster effect priors are evaluated per cluster
+        log_prior += self.size_prior.single_cluster_priors(sample)
+        log_prior += self.geo_prior.single_cluster_priors(sample, caching=caching)
+        log_prior += self.prior_cluster_effect.single_cluster_priors(sample)
+        return log_prior
+
     def get_setup_message(self):
         """Compile a set-up message for logging."""
         setup_msg = self.geo_prior.get_setup_message()
@@ -177,6 +206,14 @@ class DirichletPrior:
             )
         return concentration
 
+    def pad_concentration(self, concentration: Concentration) -> NDArray[float]:
+        """Convert the ragged list of concentration parameters into an array with shape
+        (n_features, n_states), which is 0 for states that are not applicable."""
+        padded = np.zeros(self.shapes.states_per_feature.shape)
+        for f, conc_f in enumerate(concentration):
+            padded[f, self.shapes.states_per_feature[f]] = conc_f
+        return padded
+
     def parse_attributes(self):
         raise NotImplementedError()
 
@@ -192,6 +229,8 @@ class DirichletPrior:
 class ConfoundingEffectsPrior(DirichletPrior):
 
     conf: ConfounderName
+    padded_concentration: dict[GroupName, NDArray[float]]
+    log_normalizer: dict[GroupName, float]
 
     def __init__(self, *args, conf: ConfounderName, **kwargs):
         super(ConfoundingEffectsPrior, self).__init__(*args, **kwargs)
@@ -209,6 +248,14 @@ class ConfoundingEffectsPrior(DirichletPrior):
             else:
                 raise ValueError(self.invalid_prior_message(self.config[group].type))
 
+        self.padded_concentration = {
+            group: self.pad_concentration(conc) for group, conc in self.concentration.items()
+        }
+        self.log_normalizer = {
+            group: dirichlet_log_normalizer(conc, self.shapes.states_per_feature)
+            for group, conc in self.padded_concentration.items()
+        }
+
     def __call__(self, sample: Sample, caching=True) -> float:
         """"Calculate the log PDF of the confounding effects prior.
 
@@ -225,18 +272,24 @@ class ConfoundingEffectsPrior(DirichletPrior):
             return cache.value.sum()
 
         group_names = sample.confounders[self.conf].group_names
+        changed_groups = sorted(cache.what_changed(f'c_{self.conf}', caching=caching))
+        dirichlet_groups = []
         with cache.edit() as cached_priors:
-            for i_group in cache.what_changed(f'c_{self.conf}', caching=caching):
-                group = group_names[i_group]
-
-                if self.config[group].type is self.PriorType.UNIFORM:
+            for i_group in changed_groups:
+                if self.config[group_names[i_group]].type is self.PriorType.UNIFORM:
                     cached_priors[i_group] = 0.0
-                    continue
-
-                cached_priors[i_group] = compute_group_effect_prior(
-                    group_effect=parameter.value[i_group],
-                    concentration=self.concentration[group],
+                else:
+                    dirichlet_groups.append(i_group)
+
+            # Evaluate the Dirichlet prior of all changed groups at once
+            if dirichlet_groups:
+                cached_priors[dirichlet_groups] = compute_group_effect_prior(
+                    group_effect=parameter.value[dirichlet_groups],
+                    concentration=np.array([self.padded_concentration[group_names[i]]
+                                            for i in dirichlet_groups]),
                     applicable_states=self.shapes.states_per_feature,
+                    log_normalizer=np.array([self.log_normalizer[group_names[i]]
+                                             for i in dirichlet_groups]),
                 )
 
         return cache.value.sum()
@@ -257,6 +310,9 @@ class ConfoundingEffectsPrior(DirichletPrior):
 
 class ClusterEffectPrior(DirichletPrior):
 
+    padded_concentration: NDArray[float]
+    log_normalizer: float
+
     def parse_attributes(self):
         self.prior_type = self.config.type
         if self.prior_type is self.PriorType.UNIFORM:
@@ -264,6 +320,10 @@ class ClusterEffectPrior(DirichletPrior):
         else:
             raise ValueError(self.invalid_prior_message(self.prior_type))
 
+        self.padded_concentration = self.pad_concentration(self.concentration)
+        self.log_normalizer = dirichlet_log_normalizer(self.padded_concentration,
+                                                       self.shapes.states_per_feature)
+
     def __call__(self, sample: Sample, caching=True) -> float:
         """Compute the prior for the areal effect (or load from cache).
         Args:
@@ -281,17 +341,29 @@ class ClusterEffectPrior(DirichletPrior):
         if self.prior_type is self.PriorType.UNIFORM:
             pass
         else:
-            for i_cluster in range(sample.n_clusters):
-                log_p += compute_group_effect_prior(
-                    group_effect=parameter.value[i_cluster],
-                    concentration=self.concentration,
-                    applicable_states=self.shapes.states_per_feature,
-                )
+            log_p = np.sum(compute_group_effect_prior(
+                group_effect=parameter.value,
+                concentration=self.padded_concentration,
+                applicable_states=self.shapes.states_per_feature,
+                log_normalizer=self.log_normalizer,
+            ))
 
         cache.update_value(log_p)
         # return np.sum(cache.value)
         return log_p
 
+    def single_cluster_priors(self, sample: Sample) -> NDArray[float]:
+        """Compute the prior of the cluster effect of each cluster separately."""
+        if self.prior_type is self.PriorType.UNIFORM:
+            return np.zeros(sample.n_clusters)
+        else:
+            return compute_group_effect_prior(
+                group_effect=sample.cluster_effect.value,
+                concentration=self.padded_concentration,
+                applicable_states=self.shapes.states_per_feature,
+                log_normalizer=self.log_normalizer,
+            )
+
     def get_setup_message(self):
         """Compile a set-up message for logging."""
         return f'Prior on cluster effect: {self.prior_type.value}\n'
@@ -393,7 +465,21 @@ class ClusterSizePrior:
             return cache.value
 
         sizes = np.sum(sample.clusters.value, axis=-1)
+        logp = self.compute_log_prior(sizes)
+
+        cache.update_value(logp)
+        return logp
+
+    def single_cluster_priors(self, sample: Sample) -> NDArray[float]:
+        """Compute the size prior of each cluster separately (as if it was the only one)."""
+        sizes = np.sum(sample.clusters.value, axis=-1)
+        if self.prior_type is self.PriorType.UNIFORM_SIZE:
+            return -log_binom(self.shapes.n_sites, sizes)
+        else:
+            return np.array([self.compute_log_prior(sizes[[i]]) for i in range(len(sizes))])
 
+    def compute_log_prior(self, sizes: NDArray[int]) -> float:
+        """Compute the log-probability of a set of clusters with the given sizes."""
         if self.prior_type is self.PriorType.UNIFORM_SIZE:
             # P(size)   =   uniform
             # P(zone | size)   =   1 / |{clusters of size k}|   =   1 / (n choose k)
@@ -413,7 +499,6 @@ class ClusterSizePrior:
         else:
             raise ValueError(self.invalid_prior_message(self.prior_type))
 
-        cache.update_value(logp)
         return logp
 
     def get_setup_message(self):
@@ -462,11 +547,10 @@ class GeoPrior(object):
         self.parse_attributes(config)
 
     def parse_attributes(self, config: GeoPriorConfig):
-        if self.prior_type is config.Types.COST_BASED:
+        if self.prior_type in (config.Types.COST_BASED, config.Types.DIAMETER_BASED):
             if self.cost_matrix is None:
                 ValueError('`cost_based` geo-prior requires a cost_matrix.')
 
-            self.prior_type = self.PriorTypes.COST_BASED
             self.scale = config.rate
             self.aggregation_policy = config.aggregation
             self.aggregator = self.AGGREGATORS[self.aggregation_policy]
@@ -506,29 +590,38 @@ class GeoPrior(object):
         """
         cache = sample.cache.geo_prior
         if caching and not cache.is_outdated():
-            return cache.value
+            return cache.value.sum()
 
-        if self.prior_type is self.PriorTypes.UNIFORM:
-            geo_prior = 0.
-        elif self.prior_type is self.PriorTypes.COST_BASED:
-            geo_prior = compute_cost_based_geo_prior(
-                clusters=sample.clusters.value,
-                cost_mat=self.cost_matrix,
-                aggregator=self.aggregator,
-                probability_function=self.probability_function,
-            )
-        elif self.prior_type is self.TYPES.DIAMETER_BASED:
-            geo_prior = compute_diameter_based_geo_prior(
-                clusters=sample.clusters.value,
-                cost_mat=self.cost_matrix,
-                aggregator=self.aggregator,
-                probability_function=self.probability_function,
-            )
-        else:
-            raise ValueError('geo_prior must be either \"uniform\" or \"cost_based\".')
+        # Only recompute the geo-prior of clusters that changed since the last call
+        changed = sorted(cache.what_changed('clusters', caching=caching))
+        with cache.edit() as cached_priors:
+            if self.prior_type is self.PriorTypes.UNIFORM:
+                cached_priors[changed] = 0.
+            elif self.prior_type is self.PriorTypes.COST_BASED:
+                # Update the spanning trees of changed clusters (or rebuild them without caching)
+                with sample.cache.geo_prior_trees.edit() as trees:
+                    for i in changed:
+                        if caching and trees[i] is not None:
+                            trees[i] = trees[i].update(sample.clusters.value[i], self.cost_matrix)
+                        else:
+                            trees[i] = SpanningTree.from_cluster(sample.clusters.value[i], self.cost_matrix)
+                        cached_priors[i] = self.probability_function(trees[i].aggregate(self.aggregator))
+            elif self.prior_type is self.PriorTypes.DIAMETER_BASED:
+                cached_priors[changed] = compute_diameter_based_geo_prior(
+                    clusters=sample.clusters.value[changed],
+                    cost_mat=self.cost_matrix,
+                    aggregator=self.aggregator,
+                    probability_function=self.probability_function,
+                )
+            else:
+                raise ValueError('geo_prior must be either \"uniform\" or \"cost_based\".')
+
+        return cache.value.sum()
 
-        cache.update_value(geo_prior)
-        return geo_prior
+    def single_cluster_priors(self, sample: Sample, caching=True) -> NDArray[float]:
+        """Compute the geo-prior of each cluster separately (using the per-cluster cache)."""
+        self(sample, caching=caching)
+        return sample.cache.geo_prior.value.copy()
 
     def invalid_prior_message(self, s):
         valid_types = ','.join(self.PriorTypes)
@@ -609,12 +702,13 @@ def compute_diameter_based_geo_prior(
         probability_function: Function mapping aggregate distances to log-probabilities
 
     Returns:
-        float: the log geo-prior of the cluster
+        The log geo-prior of each cluster.
+            shape: (n_clusters,)
     """
-    log_prior = 0.0
-    for z in clusters:
+    log_prior = np.zeros(len(clusters))
+    for i, z in enumerate(clusters):
         cost_mat_z = cost_mat[z][:, z]
-        log_prior += probability_function(cost_mat_z.max())
+        log_prior[i] = probability_function(cost_mat_z.max())
 
     return log_prior
 
@@ -624,62 +718,236 @@ def compute_cost_based_geo_prior(
     cost_mat: NDArray,        # shape: (n_objects, n_objects)
     aggregator: Aggregator,
     probability_function: Callable[[float], float],
-) -> float:
+) -> NDArray[float]:
     """ This function computes the geo prior for the sum of all distances of the mst of a zone
     Args:
-        clusters: The current cluster (boolean array)
+        clusters: The current clusters (boolean array)
         cost_mat: The cost matrix between locations
         aggregator: The aggregation policy, defining how the single edge
             costs are combined into one joint cost for the area.
         probability_function: Function mapping aggregate distances to log-probabilities
 
     Returns:
-        float: the log geo-prior of the cluster
+        The log geo-prior of each cluster.
+            shape: (n_clusters,)
     """
-    log_prior = 0.0
-    for z in clusters:
-        cost_mat_z = cost_mat[z][:, z]
+    log_prior = np.zeros(len(clusters))
+    for i, z in enumerate(clusters):
+        mst = SpanningTree.from_cluster(z, cost_mat)
+        log_prior[i] = probability_function(mst.aggregate(aggregator))
+
+    return log_prior
+
+
+@dataclass(frozen=True)
+class SpanningTree:
+
+    """Minimum spanning tree of the objects in a cluster, which can be updated when a
+    single object is added to or removed from the cluster. Instances are immutable
+    (updates return a new tree), so they can be shared between copies of a sample.
+
+    Zero-cost edges are part of the tree (they are needed to keep it connected), but
+    they are ignored when aggregating the edge costs, as in the original MST prior.
+    """
+
+    members: NDArray[bool]  # shape: (n_objects,)
+    edges: NDArray[int]     # shape: (n_members - 1, 2)
+    costs: NDArray[float]   # shape: (n_members - 1,)
 
-        if cost_mat_z.shape[0] > 1:
-            graph = csgraph_from_dense(cost_mat_z, null_value=np.inf)
-            mst = minimum_spanning_tree(graph)
+    @classmethod
+    def from_cluster(cls, cluster: NDArray[bool], cost_mat: NDArray[float]) -> SpanningTree:
+        """Compute the minimum spanning tree of a cluster from scratch."""
+        idx = np.flatnonzero(cluster)
+        if len(idx) < 2:
+            raise ValueError("Too few locations to compute distance.")
+
+        costs = cost_mat[np.ix_(idx, idx)]
+        costs = np.minimum(costs, costs.T)
+        rows, cols = np.triu_indices(len(idx), k=1)
+        graph = coo_matrix((edge_weights(costs[rows, cols]), (rows, cols)), shape=costs.shape)
+        mst = minimum_spanning_tree(graph).tocoo()
+        return cls(
+            members=cluster.copy(),
+            edges=idx[np.column_stack((mst.row, mst.col))],
+            costs=costs[mst.row, mst.col],
+        )
 
-            # When there are zero costs between languages the MST might be 0
-            if mst.nnz > 0:
-                distances = mst.tocsr()[mst.nonzero()]
+    def update(self, cluster: NDArray[bool], cost_mat: NDArray[float]) -> SpanningTree:
+        """Return the minimum spanning tree of `cluster`, updating this tree if the
+        cluster differs from its members by a single object."""
+        diff = np.flatnonzero(cluster != self.members)
+        if len(diff) == 0:
+            return self
+        elif len(diff) == 1 and cluster.sum() > 1 and self.members.sum() > 1:
+            i = diff[0]
+            if cluster[i]:
+                return self.add_object(i, cost_mat)
             else:
-                distances = [0.0]
+                return self.remove_object(i, cost_mat)
         else:
-            raise ValueError("Too few locations to compute distance.")
+            return self.from_cluster(cluster, cost_mat)
+
+    def add_object(self, i: int, cost_mat: NDArray[float]) -> SpanningTree:
+        """Insert object `i`: the new MST only uses the old tree edges and the new edges
+        between `i` and the current members."""
+        old_idx = np.flatnonzero(self.members)
+        k = len(old_idx)
+
+        # Local indices of the old members are their rank, the new object gets index k
+        local_edges = np.searchsorted(old_idx, self.edges)
+        new_costs = np.minimum(cost_mat[i, old_idx], cost_mat[old_idx, i])
+        graph = coo_matrix(
+            (edge_weights(np.concatenate((self.costs, new_costs))),
+             (np.concatenate((local_edges[:, 0], np.arange(k))),
+              np.concatenate((local_edges[:, 1], np.full(k, k))))),
+            shape=(k + 1, k + 1),
+        )
+        mst = minimum_spanning_tree(graph).tocoo()
+
+        idx = np.append(old_idx, i)
+        edges = idx[np.column_stack((mst.row, mst.col))]
+        members = self.members.copy()
+        members[i] = True
+        return SpanningTree(members=members, edges=edges, costs=symmetric_costs(cost_mat, edges))
+
+    def remove_object(self, i: int, cost_mat: NDArray[float]) -> SpanningTree:
+        """Remove object `i`: the remaining tree edges stay in the MST, the components
+        left after removing `i` are reconnected by the cheapest cross-component edges."""
+        members = self.members.copy()
+        members[i] = False
+        incident = np.any(self.edges == i, axis=1)
+        edges = self.edges[~incident]
+        costs = self.costs[~incident]
+        if np.count_nonzero(incident) <= 1:
+            # Removing a leaf does not change the rest of the tree
+            return SpanningTree(members=members, edges=edges, costs=costs)
+
+        # Find the components of the tree without `i`
+        idx = np.flatnonzero(members)
+        k = len(idx)
+        local_edges = np.searchsorted(idx, edges)
+        labels = connected_components(local_edges, k)
+
+        # The remaining tree edges stay in the MST, so the components only need to be
+        # reconnected by the cheapest edges between them. Every cross edge has at least
+        # one end outside the largest component, so we only need to scan these rows.
+        n_components = np.count_nonzero(incident)
+        outside = np.flatnonzero(labels != np.argmax(np.bincount(labels)))
+        cross_costs = np.minimum(cost_mat[np.ix_(idx[outside], idx)],
+                                 cost_mat[np.ix_(idx, idx[outside])].T)
+
+        # Candidate edges: cheapest edge from each outside object to every other component
+        candidates = []
+        for c in range(n_components):
+            in_c = np.flatnonzero(labels == c)
+            rows = np.flatnonzero(labels[outside] != c)
+            cols = np.argmin(cross_costs[np.ix_(rows, in_c)], axis=1)
+            candidates.append((cross_costs[rows, in_c[cols]], outside[rows], in_c[cols]))
+        candidate_costs, sources, targets = map(np.concatenate, zip(*candidates))
+
+        # Kruskal's algorithm on the components
+        component = np.arange(n_components)
+        new_edges = []
+        for e in np.argsort(candidate_costs, kind='stable'):
+            c1 = component[labels[sources[e]]]
+            c2 = component[labels[targets[e]]]
+            if c1 != c2:
+                component[component == c2] = c1
+                new_edges.append((idx[sources[e]], idx[targets[e]]))
+                if len(new_edges) == n_components - 1:
+                    break
+
+        new_edges = np.array(new_edges, dtype=edges.dtype)
+        return SpanningTree(
+            members=members,
+            edges=np.concatenate((edges, new_edges)),
+            costs=np.concatenate((costs, symmetric_costs(cost_mat, new_edges))),
+        )
 
-        agg_distance = aggregator(distances)
-        log_prior += probability_function(agg_distance)
+    def aggregate(self, aggregator: Aggregator) -> float:
+        """Aggregate the non-zero edge costs of the tree. The costs are sorted, so that
+        the result does not depend on how the tree was constructed."""
+        costs = np.sort(self.costs[self.costs > 0])
+        if len(costs) == 0:
+            return aggregator([0.0])
+        return aggregator(costs)
 
-    return log_prior
 
+def edge_weights(costs: NDArray[float]) -> NDArray[float]:
+    """Convert edge costs to weights for `minimum_spanning_tree`, which drops zero
+    entries. Zero costs are replaced by the smallest positive float, which keeps the
+    edges without changing their order."""
+    return np.where(costs == 0, np.finfo(float).tiny, costs)
 
-def compute_group_effect_prior(
-        group_effect: NDArray[float],  # shape: (n_features, n_states)
-        concentration: List[NDArray],  # shape: (n_applicable_states[f],) for f in features
-        applicable_states: List[NDArray],  # shape: (n_applicable_states[f],) for f in features
+
+def connected_components(edges: NDArray[int], n_nodes: int) -> NDArray[int]:
+    """Label the connected components of a graph by propagating the minimum node index
+    along the edges (with pointer jumping, so that long paths converge quickly).
+
+    == Usage ===
+    >>> connected_components(np.array([[0, 2], [3, 4], [2, 1]]), 6)
+    array([0, 0, 0, 1, 1, 2])
+    """
+    labels = np.arange(n_nodes)
+    while True:
+        new_labels = labels.copy()
+        edge_labels = np.minimum(labels[edges[:, 0]], labels[edges[:, 1]])
+        np.minimum.at(new_labels, edges[:, 0], edge_labels)
+        np.minimum.at(new_labels, edges[:, 1], edge_labels)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    return np.unique(labels, return_inverse=True)[1]
+
+
+def symmetric_costs(cost_mat: NDArray[float], edges: NDArray[int]) -> NDArray[float]:
+    """The cost of undirected edges, i.e. the cheaper of the two directions."""
+    return np.minimum(cost_mat[edges[:, 0], edges[:, 1]], cost_mat[edges[:, 1], edges[:, 0]])
+
+
+def dirichlet_log_normalizer(
+    concentration: NDArray[float],  # shape: (n_features, n_states)
+    applicable_states: NDArray[bool],  # shape: (n_features, n_states)
 ) -> float:
+    """Compute the log normalising constant of the Dirichlet distributions of all
+    features, i.e. the sum of -log(B(alpha_f)) over features f.
+
+    == Usage ===
+    >>> concentration = np.array([[1., 1., 0.], [2., 2., 2.]])
+    >>> log_norm = dirichlet_log_normalizer(concentration, concentration > 0)
+    >>> np.isclose(log_norm, np.log(1) + np.log(5 * 4 * 3 * 2))
+    True
+    """
+    alpha_sums = np.sum(np.where(applicable_states, concentration, 0.), axis=-1)
+    return np.sum(gammaln(alpha_sums)) - np.sum(gammaln(concentration[applicable_states]))
+
+
+def compute_group_effect_prior(
+        group_effect: NDArray[float],  # shape: (*batch_shape, n_features, n_states)
+        concentration: NDArray[float],  # shape: (*batch_shape, n_features, n_states)
+        applicable_states: NDArray[bool],  # shape: (n_features, n_states)
+        log_normalizer: float | NDArray[float] = None,  # shape: batch_shape
+) -> float | NDArray[float]:  # shape: batch_shape
     """" This function evaluates the prior on probability vectors in a cluster or confounder group.
     Args:
-        group_effect: The group effect for a confounder
-        concentration: List of Dirichlet concentration parameters.
-        applicable_states: List of available states per feature
+        group_effect: The group effect for a confounder (or a batch of group effects)
+        concentration: Dirichlet concentration parameters, padded with zeros for
+            non-applicable states.
+        applicable_states: Applicable states per feature
+        log_normalizer: The precomputed log normalising constant of the Dirichlet
+            distributions (see `dirichlet_log_normalizer`). Computed if not provided.
     Returns:
-        The prior log-pdf of the confounding effect for each feature
+        The prior log-pdf of the group effect, summed over all features
     """
-    n_features, n_states = group_effect.shape
-
-    log_p = 0.0
-    for f in range(n_features):
-        states_f = applicable_states[f]
-        conf_group = group_effect[f, states_f]
-        log_p += dirichlet_logpdf(x=conf_group, alpha=concentration[f])
+    if log_normalizer is None:
+        log_normalizer = np.vectorize(dirichlet_log_normalizer, signature='(f,s),(f,s)->()')(
+            concentration, applicable_states
+        )
 
-    return log_p
+    alpha_minus_one = np.where(applicable_states, concentration - 1., 0.)
+    return log_normalizer + np.sum(xlogy(alpha_minus_one, group_effect), axis=(-2, -1))
 
 
 if __name__ == '__main__':
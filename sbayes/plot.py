@@ -43,7 +43,6 @@ from sbayes.results import Results
 from sbayes.util import add_edge, compute_delaunay, set_defaults
 from sbayes.util import fix_relative_path
 from sbayes.util import gabriel_graph_from_delaunay
-from sbayes.util import parse_cluster_columns
 from sbayes.util import read_data_csv
 from sbayes.util import PathLike
 from sbayes.load_data import Objects
@@ -180,39 +179,8 @@ class Plot:
     # <experiment_path>/clusters_<scenario>.txt
     @staticmethod
     def read_clusters(txt_path):
-        result = []
-
-        with open(txt_path, 'r') as f_sample:
-
-            # This makes len(result) = number of clusters (flipped array)
-
-            # Split the sample
-            # len(byte_results) equals the number of samples
-            byte_results = (f_sample.read()).split('\n')
-
-            # Get the number of clusters
-            n_clusters = len(byte_results[0].split('\t'))
-
-            # Append empty arrays to result, so that len(result) = n_clusters
-            for i in range(n_clusters):
-                result.append([])
-
-            # Process each sample
-            for sample in byte_results:
-
-                # Exclude empty lines
-                if len(sample) > 0:
-
-                    # Parse each sample
-                    # len(parsed_result) equals the number of clusters
-                    # parse_cluster_columns.shape equals (n_clusters, n_sites)
-                    parsed_sample = parse_cluster_columns(sample)
-
-                    # Add each item in parsed_cluster_columns to the corresponding array in result
-                    for j in range(len(parsed_sample)):
-                        result[j].append(parsed_sample[j])
-
-        return result
+        # len(result) = number of clusters, each of shape (n_samples, n_sites)
+        return list(Results.read_clusters(txt_path))
 
     @staticmethod
     def read_dictionary(dataframe: pd.DataFrame, search_key: str) -> typ.Dict[str, NDArray]:
@@ -233,6 +201,7 @@ class Plot:
                 parameters_path=stats_path,
                 burn_in=self.config['map']['content']['burn_in'],
                 # TODO move burn_in to results section of config
+                lazy=True,
             )
 
             self.results[model_name] = results
@@ -12,7 +12,7 @@ import random
 from typing import Sequence
 
 import numpy as np
-from numpy.typing import NDArray
+from numpy.typing import NDArray, DTypeLike
 import pyproj
 
 from sbayes.util import compute_delaunay, read_costs_from_csv, PathLike
@@ -86,12 +86,77 @@ def load_canvas(config, logger=None):
     return sites, site_names
 
 
+DISTANCE_BLOCK_SIZE = 2**22
+"""The maximum number of distances computed in one vectorized block (bounds the memory
+used for temporary arrays)."""
+
+
+def compute_distance_matrix(
+    locations: NDArray[float],
+    geodesic: bool = False,
+    dtype: DTypeLike = np.float64,
+    block_size: int = DISTANCE_BLOCK_SIZE,
+) -> NDArray[float]:
+    """Compute the pairwise distances between all locations. The matrix is computed in
+    blocks of rows, each vectorized over all columns and only for the upper triangle.
+
+    Args:
+        locations: The locations as (x, y) coordinates or, for geodesic distances, as
+            (longitude, latitude) in degrees.
+            shape: (n_locations, 2)
+        geodesic: Whether to compute geodesic distances (in meters, on the WGS84
+            ellipsoid) instead of Euclidean distances.
+        dtype: The floating point type of the distance matrix.
+        block_size: The maximum number of distances computed in one block.
+
+    Returns:
+        The symmetric distance matrix.
+            shape: (n_locations, n_locations)
+
+    == Usage ===
+    >>> compute_distance_matrix(np.array([[0., 0.], [3., 4.], [0., 4.]]), block_size=2)
+    array([[0., 5., 4.],
+           [5., 0., 3.],
+           [4., 3., 0.]])
+    >>> dist_mat = compute_distance_matrix(np.array([[0., 0.], [1., 0.]]), geodesic=True,
+    ...                                    dtype=np.float32)
+    >>> dist_mat.dtype, int(dist_mat[0, 1])
+    (dtype('float32'), 111319)
+    """
+    n = len(locations)
+    dist_mat = np.zeros((n, n), dtype=dtype)
+    geod = pyproj.Geod(ellps="WGS84") if geodesic else None
+
+    rows_per_block = max(1, block_size // max(n, 1))
+    for i_start in range(0, n, rows_per_block):
+        i_end = min(i_start + rows_per_block, n)
+
+        # Distances from the rows in the block to all columns from `i_start` onwards
+        start, end = np.broadcast_arrays(locations[i_start:i_end, None, :], locations[None, i_start:, :])
+        if geodesic:
+            _, _, dist = geod.inv(start[..., 0].ravel(), start[..., 1].ravel(),
+                                  end[..., 0].ravel(), end[..., 1].ravel())
+            dist = dist.reshape(start.shape[:2])
+        else:
+            dist = np.linalg.norm(start - end, axis=-1)
+
+        # Fill the block and its mirror image (the diagonal block is symmetrized from its upper triangle)
+        k = i_end - i_start
+        diagonal_block = np.triu(dist[:, :k])
+        dist_mat[i_start:i_end, i_start:i_end] = diagonal_block + np.triu(diagonal_block, 1).T
+        dist_mat[i_start:i_end, i_end:] = dist[:, k:]
+        dist_mat[i_end:, i_start:i_end] = dist[:, k:].T
+
+    return dist_mat
+
+
 class ComputeNetwork:
 
     def __init__(
             self,
             sites,
-            crs=None):
+            crs=None,
+            dtype: DTypeLike = np.float64):
         """Convert a set of sites into a network.
 
         This function converts a set of language locations, with their attributes,
@@ -100,23 +165,13 @@ class ComputeNetwork:
 
         Args:
             sites(typ.Union[dict, 'Objects']): a dict of sites with keys "locations", "id"
+            crs(pyproj.CRS): the coordinate reference system of the locations (if given,
+                geodesic distances are computed)
+            dtype: the floating point type of the distance matrix
         Returns:
             dict: a network
 
         """
-        if crs is not None:
-            try:
-                import cartopy
-                if cartopy.__version__ >= '0.18.0':
-                    from cartopy.geodesic import Geodesic
-                else:
-                    from cartopy.crs import Geodesic
-
-            except ImportError as e:
-                print("Using a coordinate reference system (crs) requires the ´cartopy´ library:")
-                print("pip install cartopy")
-                raise e
-
         # Define vertices
         vertices = sites['id']
         locations = sites['locations']
@@ -131,17 +186,15 @@ class ComputeNetwork:
         adj_mat = delaunay.tocsr()
 
         if crs is None:
-            loc = np.asarray(sites['locations'])
-            diff = loc[:, None] - loc
-            dist_mat = np.linalg.norm(diff, axis=-1)
+            loc = np.asarray(sites['locations'], dtype=float)
+            dist_mat = compute_distance_matrix(loc, dtype=dtype)
         else:
             transformer = pyproj.transformer.Transformer.from_crs(
                 crs_from=crs, crs_to=pyproj.crs.CRS("epsg:4326"))
             w_locations = np.vstack(
                 transformer.transform(locations[:, 0], locations[:, 1])
             ).T
-            geod = Geodesic()
-            dist_mat = np.array([geod.inverse(location, w_locations)[:, 0] for location in w_locations])
+            dist_mat = compute_distance_matrix(w_locations, geodesic=True, dtype=dtype)
 
         self.vertices = vertices
         self.edges = edges
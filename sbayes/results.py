@@ -1,11 +1,16 @@
 from __future__ import annotations
+from functools import cached_property
+import os
 from typing import Sequence, TypeVar
+import zlib
 
 import numpy as np
 from numpy.typing import NDArray
 import pandas as pd
+import tables
 
-from sbayes.util import PathLike, parse_cluster_columns
+from sbayes.util import PathLike, PACKED_CLUSTERS_MAGIC, PACKED_CLUSTERS_HEADER, \
+    parse_packed_clusters_header
 
 
 TResults = TypeVar("TResults", bound="Results")
@@ -16,11 +21,14 @@ class Results:
     """
     Class for reading, storing, summarizing results of a sBayes analysis.
 
+    Model parameters are parsed from the parameters data-frame on first access.
+
     Attributes:
         clusters (NDArray[bool]): Array containing samples of clusters.
             shape: (n_clusters, n_samples, n_sites)
         parameters (pd.DataFrame): Data-frame containing sample information about parameters
                                    and likelihood, prior and posterior probabilities.
+        column_names (list[str]): The names of all columns in the parameters data-frame.
         groups_by_confounders (dict[str, list[str]): A list of groups for each confounder.
     """
 
@@ -43,44 +51,87 @@ class Results:
         burn_in: float = 0.1,
     ):
         clusters, parameters = self.drop_burnin(clusters, parameters, burn_in)
-        self.clusters = clusters
-        self.parameters = parameters
+        self._clusters = clusters
+        self._parameters = parameters
+        self.parse_names(list(parameters.columns))
+
+    def parse_names(self, column_names: list[str]):
+        """Parse confounder, group, cluster, feature and state names from the column names
+        of the parameters data-frame."""
+        self.column_names = column_names
+        self.column_index = ColumnIndex(column_names)
+        self.groups_by_confounders = self.column_index.groups_by_confounder
+        self.cluster_names = self.column_index.cluster_names
+        self.feature_names = self.column_index.feature_names
+        self.feature_states = self.column_index.feature_states
 
-        self.groups_by_confounders = self.get_groups_by_confounder(parameters.columns)
-        self.cluster_names = self.get_cluster_names(parameters.columns)
+    @property
+    def clusters(self) -> NDArray[bool]:
+        return self._clusters
 
-        # Parse feature, state, family and area names
-        self.feature_names, self.feature_states = extract_features_and_states(
-            parameters=parameters, prefix=f"areal_{self.cluster_names[0]}"
-        )
+    @property
+    def parameters(self) -> pd.DataFrame:
+        return self._parameters
 
-        # The sample index
-        self.sample_id = self.parameters["Sample"].to_numpy(dtype=int)
-
-        # Model parameters
-        self.weights = self.parse_weights(self.parameters)
-        self.areal_effect = self.parse_areal_effect(self.parameters)
-        self.confounding_effects = self.parse_confounding_effects(self.parameters)
-        # self.weights = Results.read_dictionary(self.parameters, "w_")
-        # self.areal_effect = Results.read_dictionary(self.parameters, "areal_")
-        # self.confounding_effects = {
-        #     conf: Results.read_dictionary(self.parameters, f"{conf}_")
-        #     for conf in self.groups_by_confounders
-        # }
-
-        # Posterior, likelihood, prior
-        self.posterior = self.parameters["posterior"].to_numpy(dtype=float)
-        self.likelihood = self.parameters["likelihood"].to_numpy(dtype=float)
-        self.prior = self.parameters["prior"].to_numpy(dtype=float)
-
-        # Posterior, likelihood, prior contribution per area
-        self.posterior_single_clusters = Results.read_dictionary(
-            self.parameters, "post_"
-        )
-        self.likelihood_single_clusters = Results.read_dictionary(
-            self.parameters, "lh_"
-        )
-        self.prior_single_clusters = Results.read_dictionary(self.parameters, "prior_")
+    def get_columns(self, columns: Sequence[str]) -> pd.DataFrame:
+        """Return a data-frame with only the given columns of the parameters."""
+        return self.parameters.iloc[:, self.column_index.get_positions(columns)]
+
+    def get_column(self, column: str, dtype: type = float) -> NDArray:
+        return self.get_columns([column])[column].to_numpy(dtype=dtype)
+
+    def select_columns(self, component: str) -> pd.DataFrame:
+        """Return a data-frame with all parameter columns of `component`, i.e. all columns
+        with the name format '{component}_...'."""
+        return self.get_columns(self.column_index.columns_by_component.get(component, []))
+
+    @cached_property
+    def sample_id(self) -> NDArray[int]:
+        return self.get_column("Sample", dtype=int)
+
+    # Model parameters
+
+    @cached_property
+    def weights(self) -> dict[str, NDArray]:
+        return self.parse_weights(self.select_columns("w"))
+
+    @cached_property
+    def areal_effect(self) -> dict[str, dict]:
+        return self.parse_areal_effect(self.select_columns("areal"))
+
+    @cached_property
+    def confounding_effects(self) -> dict[str, dict]:
+        columns = [c for conf in self.groups_by_confounders
+                   for c in self.column_index.columns_by_component[conf]]
+        return self.parse_confounding_effects(self.get_columns(columns))
+
+    # Posterior, likelihood, prior
+
+    @cached_property
+    def posterior(self) -> NDArray[float]:
+        return self.get_column("posterior")
+
+    @cached_property
+    def likelihood(self) -> NDArray[float]:
+        return self.get_column("likelihood")
+
+    @cached_property
+    def prior(self) -> NDArray[float]:
+        return self.get_column("prior")
+
+    # Posterior, likelihood, prior contribution per area
+
+    @cached_property
+    def posterior_single_clusters(self) -> dict[str, NDArray[float]]:
+        return Results.read_dictionary(self.select_columns("post"), "post_")
+
+    @cached_property
+    def likelihood_single_clusters(self) -> dict[str, NDArray[float]]:
+        return Results.read_dictionary(self.select_columns("lh"), "lh_")
+
+    @cached_property
+    def prior_single_clusters(self) -> dict[str, NDArray[float]]:
+        return Results.read_dictionary(self.select_columns("prior"), "prior_")
 
     @property
     def n_features(self) -> int:
@@ -88,11 +139,11 @@ class Results:
 
     @property
     def n_clusters(self) -> int:
-        return self.clusters.shape[0]
+        return len(self.cluster_names)
 
     @property
     def n_samples(self) -> int:
-        return self.clusters.shape[1]
+        return len(self.sample_id)
 
     @property
     def n_objects(self) -> int:
@@ -131,69 +182,215 @@ class Results:
         cls: type[TResults],
         clusters_path: PathLike,
         parameters_path: PathLike,
-        burn_in: float = 0.1
+        burn_in: float = 0.1,
+        lazy: bool = False,
     ) -> TResults:
+        """Read the results from a clusters file and a stats file. With `lazy=True`, the
+        files are only read when (and as far as) the results are accessed, see `LazyResults`."""
+        if lazy:
+            return LazyResults(clusters_path, parameters_path, burn_in=burn_in)
+
         clusters = cls.read_clusters(clusters_path)
         parameters = cls.read_stats(parameters_path)
         return cls(clusters, parameters, burn_in=burn_in)
 
+    @classmethod
+    def from_hdf5(
+        cls: type[TResults],
+        samples_path: PathLike,
+        burn_in: float = 0.1
+    ) -> TResults:
+        clusters, parameters = cls.read_hdf5(samples_path)
+        return cls(clusters, parameters, burn_in=burn_in)
+
     @staticmethod
-    def read_clusters(txt_path: PathLike) -> NDArray[bool]:
+    def read_hdf5(samples_path: PathLike) -> (NDArray[bool], pd.DataFrame):
+        """Read the clusters and parameters from a samples file written by the
+        SamplesHDF5Logger. The parameters are arranged in a data-frame with the same
+        columns as in a stats_<scenario>.txt file.
+
+        Args:
+            samples_path: path to the samples file (.h5)
+
+        Returns:
+            Boolean clusters array of shape (n_clusters, n_samples, n_sites) and the
+            parameters data-frame.
         """
+        with tables.open_file(samples_path, mode="r") as f:
+            attrs = f.root._v_attrs
+            n_objects = attrs.n_objects
+            feature_names = attrs.feature_names
+            state_names = attrs.state_names
+            groups_by_confounder = attrs.groups_by_confounder
+
+            packed_clusters = f.root.clusters.read()
+            clusters = np.unpackbits(packed_clusters, axis=-1, count=n_objects).astype(bool)
+            # shape: (n_samples, n_clusters, n_sites)
+
+            columns = {
+                "Sample": f.root.sample_id.read(),
+                "posterior": f.root.posterior.read(),
+                "likelihood": f.root.likelihood.read(),
+                "prior": f.root.prior.read(),
+            }
+            n_clusters = clusters.shape[1]
+
+            # Cluster sizes
+            cluster_sizes = np.count_nonzero(clusters, axis=-1)
+            for i in range(n_clusters):
+                columns[f"size_a{i}"] = cluster_sizes[:, i]
+
+            # Weights
+            weights = f.root.weights.read()
+            components = ["areal"] + list(groups_by_confounder.keys())
+            for i_f, feat in enumerate(feature_names):
+                for i_c, comp in enumerate(components):
+                    columns[f"w_{comp}_{feat}"] = weights[:, i_f, i_c]
+
+            # Areal effect
+            cluster_effect = f.root.cluster_effect.read()
+            for i_a in range(n_clusters):
+                for i_f, feat in enumerate(feature_names):
+                    for i_s, state in enumerate(state_names[i_f]):
+                        columns[f"areal_a{i_a+1}_{feat}_{state}"] = cluster_effect[:, i_a, i_f, i_s]
+
+            # Confounding effects
+            for conf, groups in groups_by_confounder.items():
+                conf_effect = f.get_node(f.root.confounding_effects, conf).read()
+                for i_g, g in enumerate(groups):
+                    for i_f, feat in enumerate(feature_names):
+                        for i_s, state in enumerate(state_names[i_f]):
+                            columns[f"{conf}_{g}_{feat}_{state}"] = conf_effect[:, i_g, i_f, i_s]
+
+            # lh, prior, posteriors per cluster
+            if "likelihood_single_clusters" in f.root:
+                lh = f.root.likelihood_single_clusters.read()
+                prior = f.root.prior_single_clusters.read()
+                for i in range(n_clusters):
+                    columns[f"post_a{i}"] = lh[:, i] + prior[:, i]
+                    columns[f"lh_a{i}"] = lh[:, i]
+                    columns[f"prior_a{i}"] = prior[:, i]
+
+        parameters = pd.DataFrame(columns)
+        return clusters.transpose((1, 0, 2)), parameters
+
+    @staticmethod
+    def read_clusters(clusters_path: PathLike, first_sample: int = 0) -> NDArray[bool]:
+        """Read the clusters file of a sbayes analysis. Both, the text format (bit-strings)
+        and the packed binary format (see `PackedClustersLogger`) are supported.
 
         Args:
-            txt_path:
+            clusters_path: path to the clusters file
+            first_sample: the index of the first sample to be read (e.g. to skip burn-in)
 
         Returns:
             Boolean clusters array of shape (n_clusters, n_samples, n_sites)
         """
-        clusters_list = []
-        with open(txt_path, "r") as f_sample:
-            # This makes len(result) = number of clusters (flipped array)
+        with open(clusters_path, "rb") as f:
+            magic = f.read(len(PACKED_CLUSTERS_MAGIC))
 
-            # Split the sample
-            # len(byte_results) equals the number of samples
-            byte_results = (f_sample.read()).split("\n")
+        if magic == PACKED_CLUSTERS_MAGIC:
+            return Results.read_packed_clusters(clusters_path, first_sample=first_sample)
+        else:
+            return Results.read_text_clusters(clusters_path, first_sample=first_sample)
 
-            # Get the number of clusters
-            n_clusters = len(byte_results[0].split("\t"))
+    @staticmethod
+    def read_text_clusters(txt_path: PathLike, first_sample: int = 0) -> NDArray[bool]:
+        """Read clusters from a text file with one line per sample, containing one
+        bit-string per cluster (separated by tabs). The file is memory-mapped, so that only
+        the requested samples are loaded into memory.
 
-            # Append empty arrays to result, so that len(result) = n_clusters
-            for i in range(n_clusters):
-                clusters_list.append([])
+        Args:
+            txt_path: path to the clusters file
+            first_sample: the index of the first sample to be read (e.g. to skip burn-in)
 
-            # Process each sample
-            for sample in byte_results:
-                if len(sample) == 0:
-                    continue
+        Returns:
+            Boolean clusters array of shape (n_clusters, n_samples, n_sites)
+        """
+        if os.path.getsize(txt_path) == 0:
+            return np.zeros((0, 0, 0), dtype=bool)
+
+        text = np.memmap(txt_path, dtype=np.uint8, mode="r")
+        line_length = int(np.argmax(text == ord("\n"))) + 1
+        n_samples = len(text) // line_length
+        if line_length == 1 or np.any(text[line_length - 1::line_length][:n_samples] != ord("\n")):
+            # Irregular line lengths: fall back to parsing the lines one by one
+            return Results.parse_text_clusters(txt_path, first_sample=first_sample)
+
+        # All lines have the same length: read the bits directly from the memory-map
+        lines = text[:n_samples * line_length].reshape((n_samples, line_length))[first_sample:]
+        is_bit = (lines[0] == ord("0")) | (lines[0] == ord("1"))
+        n_clusters = np.count_nonzero(lines[0] == ord("\t")) + 1
+        clusters = lines[:, is_bit] == ord("1")
+        clusters = clusters.reshape((len(lines), n_clusters, -1))
+        return clusters.transpose((1, 0, 2))
 
-                # Parse each sample
-                parsed_sample = parse_cluster_columns(sample)
-                # shape: (n_clusters, n_sites)
+    @staticmethod
+    def parse_text_clusters(txt_path: PathLike, first_sample: int = 0) -> NDArray[bool]:
+        """Read clusters from a text file line by line (see `read_text_clusters`)."""
+        with open(txt_path, "rb") as f:
+            lines = [line for line in f.read().splitlines() if line][first_sample:]
 
-                # Add each item in parsed_area_columns to the corresponding array in result
-                for j in range(len(parsed_sample)):
-                    clusters_list[j].append(parsed_sample[j])
+        if len(lines) == 0:
+            return np.zeros((0, 0, 0), dtype=bool)
 
-        return np.array(clusters_list, dtype=bool)
+        n_clusters = lines[0].count(b"\t") + 1
+        bits = b"".join(lines).replace(b"\t", b"")
+        clusters = np.frombuffer(bits, dtype=np.uint8) == ord("1")
+        clusters = clusters.reshape((len(lines), n_clusters, -1))
+        return clusters.transpose((1, 0, 2))
 
     @staticmethod
-    def read_stats(txt_path: PathLike) -> pd.DataFrame:
+    def read_packed_clusters(bin_path: PathLike, first_sample: int = 0) -> NDArray[bool]:
+        """Read clusters from a packed binary file (see `PackedClustersLogger`). A
+        truncated last sample (e.g. from a running analysis) is ignored. Uncompressed files
+        are memory-mapped, so that only the requested samples are loaded into memory.
+
+        Args:
+            bin_path: path to the clusters file
+            first_sample: the index of the first sample to be read (e.g. to skip burn-in)
+
+        Returns:
+            Boolean clusters array of shape (n_clusters, n_samples, n_sites)
+        """
+        with open(bin_path, "rb") as f:
+            header = f.read(PACKED_CLUSTERS_HEADER.size)
+            n_clusters, n_objects, compressed = parse_packed_clusters_header(header)
+            if compressed:
+                # A decompressor object also accepts incomplete streams
+                packed = zlib.decompressobj().decompress(f.read())
+                packed = np.frombuffer(packed, dtype=np.uint8)
+
+        if not compressed:
+            packed = np.memmap(bin_path, dtype=np.uint8, mode="r", offset=PACKED_CLUSTERS_HEADER.size)
+
+        n_bytes = -(-n_objects // 8)
+        n_samples = len(packed) // (n_clusters * n_bytes)
+        packed = packed[:n_samples * n_clusters * n_bytes].reshape((n_samples, n_clusters, n_bytes))
+        clusters = np.unpackbits(packed[first_sample:], axis=-1, count=n_objects).astype(bool)
+        return clusters.transpose((1, 0, 2))
+
+    @staticmethod
+    def read_stats(
+        txt_path: PathLike,
+        columns: Sequence[str] = None,
+        n_rows: int = None,
+    ) -> pd.DataFrame:
         """Read stats for results files (<experiment_path>/stats_<scenario>.txt).
 
         Args:
             txt_path: path to results file
+            columns: optional subset of columns to be read (all by default)
+            n_rows: optional number of rows to be read (all by default)
         """
-        return pd.read_csv(txt_path, delimiter="\t")
+        return pd.read_csv(txt_path, delimiter="\t", usecols=columns, nrows=n_rows)
 
     @staticmethod
     def read_dictionary(dataframe, search_key):
         """Helper function used for reading parameter dicts from pandas data-frame."""
-        param_dict = {}
-        for column_name in dataframe.columns:
-            if column_name.startswith(search_key):
-                param_dict[column_name] = dataframe[column_name].to_numpy(dtype=float)
-        return param_dict
+        columns = [c for c in dataframe.columns if c.startswith(search_key)]
+        values = dataframe[columns].to_numpy(dtype=float)
+        return {c: values[:, i] for i, c in enumerate(columns)}
 
     def parse_weights(self, parameters: pd.DataFrame) -> dict[str, NDArray]:
         """Parse weights array for each feature in a dictionary from the parameters
@@ -211,14 +408,11 @@ class Results:
         # the dimensions of weights for each feature.
         components = ["areal"] + list(self.groups_by_confounders.keys())
 
-        # Collect weights by feature
-        weights = {}
-        for f in self.feature_names:
-            weights[f] = np.column_stack(
-                [parameters[f"w_{c}_{f}"].to_numpy(dtype=float) for c in components]
-            )
-
-        return weights
+        # Read the weights of all features into one array and split it by feature
+        columns = [f"w_{c}_{f}" for f in self.feature_names for c in components]
+        values = parameters[columns].to_numpy(dtype=float)
+        values = values.reshape((len(values), self.n_features, len(components)))
+        return {f: values[:, i_f, :] for i_f, f in enumerate(self.feature_names)}
 
     def parse_probs(
         self,
@@ -237,11 +431,13 @@ class Results:
                 shape for each feature f: (n_states_f,)
         """
 
-        param = {}
-        for i_f, f in enumerate(self.feature_names):
-            param[f] = np.column_stack(
-                [parameters[f"{prefix}_{f}_{s}"] for s in self.feature_states[i_f]]
-            )
+        # Read the probabilities of all features into one array and split it by feature
+        columns = self.column_index.get_probs_columns(prefix)
+        values = parameters[columns].to_numpy(dtype=float)
+        param = dict(zip(
+            self.feature_names,
+            np.split(values, self.column_index.feature_offsets[1:-1], axis=1)
+        ))
 
         assert len(param) == self.n_features
         return param
@@ -302,71 +498,151 @@ class Results:
         """Create a dictionary containing all confounder names as keys and a list of
         corresponding group names as values. The dictionary is extracted from the column
         names in a csv file of logged sbayes parameters."""
+        return ColumnIndex(column_names).groups_by_confounder
 
-        groups_by_confounder = {}
+    @staticmethod
+    def get_cluster_names(column_names) -> list[str]:
+        return ColumnIndex(column_names).cluster_names
 
-        # We use to weights columns to find confounder names
-        for key in column_names:
-            # Skip if not a weights column
-            if not key.startswith("w_"):
-                continue
+    def get_states_for_feature_name(self, f: str) -> list[str]:
+        return self.feature_states[self.column_index.feature_index[f]]
 
-            # Second part of key in weights columns defines the confounder name
-            _, conf, _ = key.split("_", maxsplit=2)
 
-            # Skip areal effects
-            if conf == "areal":
-                continue
+class ColumnIndex:
 
-            # Skip already added
-            if conf in groups_by_confounder:
-                continue
+    """Index of the column names in a csv file of logged sbayes parameters. The column
+    names are parsed once and grouped by component (the part of the name up to the first
+    `_`, e.g. `w`, `areal` or a confounder name), so that the parsers in `Results` can look
+    up the columns of a parameter without scanning all column names.
 
-            # Otherwise, remember the confounder name and initialize the group name list
-            groups_by_confounder[conf] = []
+    Attributes:
+        column_names (list[str]): The names of all columns.
+        positions (dict[str, int]): The position of each column.
+        columns_by_component (dict[str, list[str]]): The columns of each component.
+        groups_by_confounder (dict[str, list[str]]): A list of groups for each confounder.
+        cluster_names (list[str]): The names of the clusters.
+        feature_names (list[str]): The names of the features.
+        feature_states (list[list[str]]): The state names for each feature.
+        feature_index (dict[str, int]): The index of each feature name.
+        feature_offsets (NDArray[int]): Start offset of each feature in a list of all
+            feature-state columns (with a final entry for the total number of states).
+
+    == Usage ===
+    >>> index = ColumnIndex(["Sample", "w_areal_f1", "w_fam_f1", "areal_a0_f1_A",
+    ...                      "areal_a0_f1_B", "fam_x_f1_A", "fam_x_f1_B"])
+    >>> index.groups_by_confounder
+    {'fam': ['x']}
+    >>> index.cluster_names, index.feature_names, index.feature_states
+    (['a0'], ['f1'], [['A', 'B']])
+    >>> index.get_probs_columns("fam_x")
+    ['fam_x_f1_A', 'fam_x_f1_B']
+    """
 
-        # Collect the group names from the parameter columns of each confounder
-        for conf in groups_by_confounder:
-            for key in column_names:
-                # Skip columns that are not on this confounder
-                if not key.startswith(f"{conf}_"):
-                    continue
+    def __init__(self, column_names: Sequence[str]):
+        self.column_names = list(column_names)
+        self.positions = {c: i for i, c in enumerate(self.column_names)}
+
+        self.columns_by_component = {}
+        for c in self.column_names:
+            component, _, _ = c.partition("_")
+            self.columns_by_component.setdefault(component, []).append(c)
+
+        # The weights columns (format 'w_{component}_{feature}') define the confounders
+        self.groups_by_confounder = {}
+        for c in self.columns_by_component.get("w", []):
+            _, conf, _ = c.split("_", maxsplit=2)
+            if conf != "areal":
+                self.groups_by_confounder.setdefault(conf, [])
+
+        # The effect columns (format '{component}_{group}_{feature}_{state}') define the
+        # groups of each confounder and the clusters
+        for conf, groups in self.groups_by_confounder.items():
+            groups += self.get_groups(conf)
+        self.cluster_names = self.get_groups("areal")
+
+        # The areal effect of the first cluster contains each feature-state exactly once
+        self.feature_names, self.feature_states = extract_features_and_states(
+            column_names=self.columns_by_component.get("areal", []),
+            prefix=f"areal_{self.cluster_names[0]}"
+        )
+        self.feature_index = {f: i_f for i_f, f in enumerate(self.feature_names)}
+        self.feature_offsets = np.cumsum([0] + [len(states) for states in self.feature_states])
+
+    def get_groups(self, component: str) -> list[str]:
+        """List the (unique) group names in the effect columns of `component`."""
+        groups = {}
+        for c in self.columns_by_component.get(component, []):
+            _, group, _ = c.split("_", maxsplit=2)
+            groups[group] = None
+        return list(groups)
+
+    def get_positions(self, columns: Sequence[str]) -> list[int]:
+        return [self.positions[c] for c in columns]
+
+    def get_probs_columns(self, prefix: str) -> list[str]:
+        """List the columns of a categorical probability parameter, i.e. the columns
+        '{prefix}_{feature}_{state}' for all features and states."""
+        return [f"{prefix}_{f}_{s}"
+                for f, states in zip(self.feature_names, self.feature_states)
+                for s in states]
+
+
+class LazyResults(Results):
+
+    """Results of a sBayes analysis that are read from the files on demand: Only the column
+    names are read up front. Columns of the parameters file are loaded when a parameter is
+    first accessed, and the clusters file is memory-mapped when `clusters` is accessed
+    (skipping the burn-in samples).
+    """
 
-                # Second part of key contains the group name
-                _, group, _ = key.split("_", maxsplit=2)
+    def __init__(
+        self,
+        clusters_path: PathLike,
+        parameters_path: PathLike,
+        burn_in: float = 0.1,
+    ):
+        self.clusters_path = clusters_path
+        self.parameters_path = parameters_path
+        self._clusters = None
+        self._columns: dict[str, pd.Series] = {}
 
-                # Skip if already added
-                if group in groups_by_confounder[conf]:
-                    continue
+        # The number of samples is defined by the `Sample` column
+        sample_column = self.read_stats(parameters_path, columns=["Sample"])["Sample"]
+        self.burn_in_index = int(burn_in * len(sample_column))
+        self._columns["Sample"] = sample_column.iloc[self.burn_in_index:]
 
-                # Otherwise, remember the group name
-                groups_by_confounder[conf].append(group)
+        column_names = list(self.read_stats(parameters_path, n_rows=0).columns)
+        self.parse_names(column_names)
 
-        return groups_by_confounder
+    @property
+    def clusters(self) -> NDArray[bool]:
+        if self._clusters is None:
+            self._clusters = self.read_clusters(self.clusters_path, first_sample=self.burn_in_index)
+        return self._clusters
 
-    @staticmethod
-    def get_cluster_names(column_names) -> list[str]:
-        area_names = []
-        for key in column_names:
-            if not key.startswith("areal_"):
-                continue
-            _, area, _ = key.split("_", maxsplit=2)
-            if area not in area_names:
-                area_names.append(area)
-        return area_names
+    @property
+    def parameters(self) -> pd.DataFrame:
+        return self.get_columns(self.column_names)
 
-    def get_states_for_feature_name(self, f: str) -> list[str]:
-        return self.feature_states[self.feature_names.index(f)]
+    def get_columns(self, columns: Sequence[str]) -> pd.DataFrame:
+        """Return a data-frame with only the given columns of the parameters. Columns that
+        were not accessed before are read from the parameters file."""
+        missing = [c for c in columns if c not in self._columns]
+        if missing:
+            new_columns = self.read_stats(self.parameters_path, columns=missing)
+            for c in missing:
+                self._columns[c] = new_columns[c].iloc[self.burn_in_index:]
+        return pd.DataFrame({c: self._columns[c] for c in columns})
 
 
 def extract_features_and_states(
-        parameters: pd.DataFrame,
+        column_names: Sequence[str],
         prefix: str
 ) -> (list[str], list[list[str]]):
     """Extract features names and state names of the given data-set.
 
     Args:
-        parameters: The data-frame of all logged parameters from a sbayes analysis.
+        column_names: The column names of all logged parameters from a sbayes analysis.
         prefix: The prefix identifying columns to be used.
 
     Returns:
@@ -374,22 +650,22 @@ def extract_features_and_states(
     """
     feature_names = []
     state_names = []
+    feature_index = {}
 
     # We look at all ´alpha´ columns, since they contain each feature-state exactly once.
-    columns = [c for c in parameters.columns if c.startswith(f"{prefix}_")]
+    columns = [c for c in column_names if c.startswith(f"{prefix}_")]
 
     for c in columns:
         # Column name format is '{prefix}_{featurename}_{statename}'
         f_s = c[len(prefix) + 1 :]
         f, _, s = f_s.partition("_")
 
-        # Add the feature name to the list (if not present)
-        if f not in feature_names:
+        # Add the feature name to the list (if not present) and find its index
+        if f not in feature_index:
+            feature_index[f] = len(feature_names)
             feature_names.append(f)
             state_names.append([])
-
-        # Find the index of feature f
-        i_f = feature_names.index(f)
+        i_f = feature_index[f]
 
         # Add state s to the state_names list of feature f
         state_names[i_f].append(s)
@@ -1,5 +1,8 @@
 from __future__ import annotations
 from typing import TextIO, Optional
+import queue
+import threading
+import zlib
 from abc import ABC, abstractmethod
 
 import numpy as np
@@ -8,9 +11,10 @@ import tables
 
 from sbayes.load_data import Data
 from sbayes.sampling.operators import Operator
-from sbayes.util import format_cluster_columns, get_best_permutation
+from sbayes.util import format_cluster_columns, get_best_permutation, pack_clusters, \
+    format_packed_clusters_header
 from sbayes.model import Model
-from sbayes.sampling.state import Sample, ModelCache
+from sbayes.sampling.state import Sample
 
 
 class ResultsLogger(ABC):
@@ -47,9 +51,162 @@ class ResultsLogger(ABC):
         # ´buffering=1´ activates line-buffering, i.e. flushing to file after each line
 
     def close(self):
+        if self.file is None:
+            # Nothing was written (e.g. no samples after resuming from a checkpoint)
+            return
         self.file.close()
         self.file = None
 
+    def get_checkpoint(self) -> dict:
+        """Flush the file and return the state that is required to continue writing to
+        it after resuming from a checkpoint (see `resume`)."""
+        if self.file is None:
+            # Nothing written yet
+            return {}
+        self.file.flush()
+        return {"position": self.file.tell(), "column_names": self.column_names}
+
+    def resume(self, checkpoint: dict):
+        """Re-open the file and discard everything written after the checkpoint, so that
+        new samples are appended seamlessly."""
+        if not checkpoint:
+            return
+        self.reopen(checkpoint["position"])
+        self.column_names = checkpoint["column_names"]
+
+    def reopen(self, position: int):
+        """Open the existing file, truncated at `position`, for appending."""
+        self.file = open(self.path, "r+", buffering=1)
+        self.file.truncate(position)
+        self.file.seek(position)
+
+
+class AsyncSampleWriter:
+
+    """The AsyncSampleWriter moves the work of a list of sample loggers (formatting, cluster
+    matching and writing to files) to a background thread. The sampler only enqueues a
+    snapshot of each sample (`Sample.copy`), which shares the parameters and the cached
+    values with the sample until either of them is edited (copy-on-write). If the queue
+    is full, `write_sample` blocks until the background thread caught up.
+
+    Errors raised in the background thread are re-raised in the sampling thread at the
+    next call of `write_sample`, `flush` or `close`."""
+
+    def __init__(self, loggers: list[ResultsLogger], max_queue_size: int = 16):
+        self.loggers = loggers
+        self.queue: queue.Queue[Optional[Sample]] = queue.Queue(maxsize=max_queue_size)
+        self.thread: Optional[threading.Thread] = None
+        self.error: Optional[BaseException] = None
+
+    def write_sample(self, sample: Sample):
+        self.raise_error()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="sample-writer", daemon=True)
+            self.thread.start()
+
+        # The snapshot shares the parameters and cached values with `sample` (copy-on-write),
+        # only the observation likelihoods are copied
+        self.queue.put(sample.copy())
+
+    def run(self):
+        while True:
+            sample = self.queue.get()
+            try:
+                if sample is None:
+                    return
+                # After an error, skip the remaining samples (the error is reported once)
+                if self.error is None:
+                    for logger in self.loggers:
+                        logger.write_sample(sample)
+            except BaseException as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """Wait until all enqueued samples are written."""
+        self.queue.join()
+        self.raise_error()
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+        for logger in self.loggers:
+            if logger.file is not None:
+                logger.close()
+
+        self.raise_error()
+
+    def get_checkpoint(self) -> list[dict]:
+        self.flush()
+        return [logger.get_checkpoint() for logger in self.loggers]
+
+    def resume(self, checkpoint: list[dict]):
+        for logger, logger_checkpoint in zip(self.loggers, checkpoint):
+            logger.resume(logger_checkpoint)
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("Writing samples failed in the background thread.") from error
+
+
+class ClusterMatcher:
+
+    """Aligns the cluster labels of consecutive samples with the clusters logged so far.
+    A single matcher can be shared between several loggers, so that the best permutation
+    is computed (and `cluster_sum` updated) only once per sample."""
+
+    def __init__(self):
+        self.cluster_sum: Optional[npt.NDArray[int]] = None
+        self._last_step: Optional[int] = None
+        self._last_permutation: Optional[tuple[int]] = None
+
+    def get_permutation(self, sample: Sample) -> tuple[int]:
+        if self._last_step is not None and sample.i_step == self._last_step:
+            # Already matched this sample (e.g. for another logger)
+            return self._last_permutation
+
+        if self.cluster_sum is None:
+            self.cluster_sum = np.zeros((sample.n_clusters, sample.n_objects), dtype=int)
+
+        # Compute the best matching permutation
+        permutation = get_best_permutation(sample.clusters.value, self.cluster_sum)
+
+        # Update cluster_sum for matching future samples
+        self.cluster_sum += sample.clusters.value[permutation, :]
+
+        self._last_step = sample.i_step
+        self._last_permutation = permutation
+        return permutation
+
+    def get_checkpoint(self) -> dict:
+        return {"cluster_sum": self.cluster_sum}
+
+    def resume(self, checkpoint: dict):
+        self.cluster_sum = checkpoint["cluster_sum"]
+        self._last_step = None
+        self._last_permutation = None
+
+
+def get_cluster_contributions(
+    model: Model,
+    sample: Sample,
+    permutation: Optional[tuple[int]] = None,
+) -> (npt.NDArray[float], npt.NDArray[float]):
+    """Evaluate the likelihood and prior of a model that contains only one of the clusters
+    (for each cluster separately, optionally in the order given by `permutation`). The
+    contributions are derived from the caches of the sample."""
+    lh = model.likelihood.get_cluster_contributions(sample)
+    prior = model.prior.get_cluster_contributions(sample)
+    if permutation is not None:
+        lh = lh[list(permutation)]
+        prior = prior[list(permutation)]
+    return lh, prior
+
 
 class ParametersCSVLogger(ResultsLogger):
 
@@ -63,12 +220,13 @@ class ParametersCSVLogger(ResultsLogger):
         log_contribution_per_cluster: bool = True,
         float_format: str = "%.12g",
         match_clusters: bool = True,
+        cluster_matcher: Optional[ClusterMatcher] = None,
     ):
         super().__init__(*args)
         self.float_format = float_format
         self.log_contribution_per_cluster = log_contribution_per_cluster
         self.match_clusters = match_clusters
-        self.cluster_sum: Optional[npt.NDArray[int]] = None
+        self.cluster_matcher = cluster_matcher or ClusterMatcher()
 
         # For logging single cluster likelihood values we do not want to use the sampled
         # source arrays
@@ -85,9 +243,6 @@ class ParametersCSVLogger(ResultsLogger):
         if sample.n_clusters <= 1:
             self.match_clusters = False
 
-        # Initialize cluster_sum array for matching
-        self.cluster_sum = np.zeros((sample.n_clusters, sample.n_objects), dtype=int)
-
         # Cluster sizes
         for i in range(sample.n_clusters):
             column_names.append(f"size_a{i}")
@@ -139,16 +294,14 @@ class ParametersCSVLogger(ResultsLogger):
 
         if self.match_clusters:
             # Compute the best matching permutation
-            permutation = get_best_permutation(sample.clusters.value, self.cluster_sum)
+            permutation = self.cluster_matcher.get_permutation(sample)
 
             # Permute parameters
             cluster_effect = sample.cluster_effect.value[permutation, :, :]
             clusters = sample.clusters.value[permutation, :]
-
-            # Update cluster_sum for matching future samples
-            self.cluster_sum += clusters
         else:
             # Unpermuted parameters
+            permutation = None
             cluster_effect = sample.cluster_effect.value
             clusters = sample.clusters.value
 
@@ -197,22 +350,28 @@ class ParametersCSVLogger(ResultsLogger):
 
         # lh, prior, posteriors
         if self.log_contribution_per_cluster:
-            sample_single_cluster = sample.copy()
-            sample_single_cluster._source = None
-
+            lh, prior = get_cluster_contributions(self.model, sample, permutation)
             for i in range(sample.n_clusters):
-                sample_single_cluster.clusters._value = clusters[[i], :]
-                sample_single_cluster.cluster_effect._value = cluster_effect[[i],...]
-                sample_single_cluster.cache = ModelCache(sample_single_cluster)
-                lh = self.model.likelihood(sample_single_cluster, caching=False)
-                prior = self.model.prior(sample_single_cluster, caching=False)
-                row[f"lh_a{i}"] = lh
-                row[f"prior_a{i}"] = prior
-                row[f"post_a{i}"] = lh + prior
+                row[f"lh_a{i}"] = lh[i]
+                row[f"prior_a{i}"] = prior[i]
+                row[f"post_a{i}"] = lh[i] + prior[i]
 
         row_str = "\t".join([self.float_format % row[k] for k in self.column_names])
         self.file.write(row_str + "\n")
 
+    def get_checkpoint(self) -> dict:
+        checkpoint = super().get_checkpoint()
+        if checkpoint:
+            checkpoint["match_clusters"] = self.match_clusters
+            checkpoint["cluster_matcher"] = self.cluster_matcher.get_checkpoint()
+        return checkpoint
+
+    def resume(self, checkpoint: dict):
+        super().resume(checkpoint)
+        if checkpoint:
+            self.match_clusters = checkpoint["match_clusters"]
+            self.cluster_matcher.resume(checkpoint["cluster_matcher"])
+
 
 class ClustersLogger(ResultsLogger):
 
@@ -223,61 +382,332 @@ class ClustersLogger(ResultsLogger):
         self,
         *args,
         match_clusters: bool = True,
+        cluster_matcher: Optional[ClusterMatcher] = None,
     ):
         super().__init__(*args)
         self.match_clusters = match_clusters
-        self.cluster_sum: Optional[npt.NDArray[int]] = None
+        self.cluster_matcher = cluster_matcher or ClusterMatcher()
 
     def write_header(self, sample: Sample):
         if sample.n_clusters <= 1:
             # Nothing to match
             self.match_clusters = False
 
-        self.cluster_sum = np.zeros((sample.n_clusters, sample.n_objects), dtype=int)
-
     def _write_sample(self, sample):
         if self.match_clusters:
             # Compute best matching perm
-            permutation = get_best_permutation(sample.clusters.value, self.cluster_sum)
+            permutation = self.cluster_matcher.get_permutation(sample)
 
             # Permute clusters
             clusters = sample.clusters.value[permutation, :]
-
-            # Update cluster_sum for matching future samples
-            self.cluster_sum += clusters
         else:
             clusters = sample.clusters.value
 
         row = format_cluster_columns(clusters)
         self.file.write(row + "\n")
 
+    def get_checkpoint(self) -> dict:
+        checkpoint = super().get_checkpoint()
+        if checkpoint:
+            checkpoint["match_clusters"] = self.match_clusters
+            checkpoint["cluster_matcher"] = self.cluster_matcher.get_checkpoint()
+        return checkpoint
+
+    def resume(self, checkpoint: dict):
+        super().resume(checkpoint)
+        if checkpoint:
+            self.match_clusters = checkpoint["match_clusters"]
+            self.cluster_matcher.resume(checkpoint["cluster_matcher"])
+
+
+class PackedClustersLogger(ClustersLogger):
+
+    """The PackedClustersLogger is a compact binary alternative to the ClustersLogger. Each
+    sample is written as one row of bit-packed clusters (see `pack_clusters`), optionally
+    compressed as a zlib stream. The stream is flushed after every sample, so that the file
+    can be read while the MCMC is running."""
+
+    def __init__(self, *args, compress: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compress = compress
+        self.compressor = None
+
+    def open(self):
+        self.file = open(self.path, "wb")
+        if self.compress:
+            self.compressor = zlib.compressobj()
+
+    def write_header(self, sample: Sample):
+        super().write_header(sample)
+        header = format_packed_clusters_header(
+            n_clusters=sample.n_clusters,
+            n_objects=sample.n_objects,
+            compressed=self.compress,
+        )
+        self.file.write(header)
+
+    def _write_sample(self, sample):
+        if self.match_clusters:
+            permutation = self.cluster_matcher.get_permutation(sample)
+            clusters = sample.clusters.value[permutation, :]
+        else:
+            clusters = sample.clusters.value
+
+        row = pack_clusters(clusters)
+        if self.compressor is not None:
+            row = self.compressor.compress(row) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.file.write(row)
+        self.file.flush()
+
+    def close(self):
+        if self.compressor is not None:
+            self.file.write(self.compressor.flush())
+            self.compressor = None
+        super().close()
+
+    def get_checkpoint(self) -> dict:
+        if self.compressor is not None:
+            # A full flush makes the following data independent of the compressor history
+            self.file.write(self.compressor.flush(zlib.Z_FULL_FLUSH))
+        return super().get_checkpoint()
+
+    def reopen(self, position: int):
+        self.file = open(self.path, "r+b")
+        self.file.truncate(position)
+        self.file.seek(position)
+        if self.compress:
+            # Continue the zlib stream with raw deflate blocks (no second zlib header)
+            self.compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+
+
+class SamplesHDF5Logger(ResultsLogger):
+
+    """The SamplesHDF5Logger is a binary alternative to the ParametersCSVLogger and the
+    ClustersLogger. All parameters and statistics are written as typed arrays to a pytables
+    file (.h5), with one row per sample. Clusters are bit-packed along the objects axis.
+    The file can be read with `Results.from_hdf5`."""
+
+    FILTERS = tables.Filters(complevel=5, complib="blosc:zlib", shuffle=True, fletcher32=True)
+
+    def __init__(
+        self,
+        *args,
+        log_contribution_per_cluster: bool = True,
+        match_clusters: bool = True,
+        cluster_matcher: Optional[ClusterMatcher] = None,
+    ):
+        super().__init__(*args)
+        self.log_contribution_per_cluster = log_contribution_per_cluster
+        self.match_clusters = match_clusters
+        self.cluster_matcher = cluster_matcher or ClusterMatcher()
+        self.arrays: dict[str, tables.EArray] = {}
+
+        # For logging single cluster likelihood values we do not want to use the sampled
+        # source arrays
+        self.model.sample_source = False
+        self.model.prior.sample_source = False
+
+    def open(self):
+        self.file = tables.open_file(self.path, mode="w")
+
+    def write_header(self, sample: Sample):
+        # No need for matching if only 1 cluster (or no clusters at all)
+        if sample.n_clusters <= 1:
+            self.match_clusters = False
+
+        # Meta-data required to interpret the arrays
+        attrs = self.file.root._v_attrs
+        attrs.n_objects = sample.n_objects
+        attrs.n_clusters = sample.n_clusters
+        attrs.feature_names = [str(f) for f in self.data.features.names]
+        attrs.state_names = [[str(s) for s in states] for states in self.data.features.state_names]
+        attrs.groups_by_confounder = {
+            conf.name: [str(g) for g in conf.group_names]
+            for conf in self.data.confounders.values()
+        }
+
+        n_clusters = sample.n_clusters
+        n_features = sample.n_features
+        n_states = sample.n_states
+        n_bytes = -(-sample.n_objects // 8)
+        self.create_array("sample_id", tables.Int64Col(), ())
+        self.create_array("posterior", tables.Float64Col(), ())
+        self.create_array("likelihood", tables.Float64Col(), ())
+        self.create_array("prior", tables.Float64Col(), ())
+        self.create_array("clusters", tables.UInt8Col(), (n_clusters, n_bytes))
+        self.create_array("weights", tables.Float64Col(), (n_features, sample.n_components))
+        self.create_array("cluster_effect", tables.Float64Col(), (n_clusters, n_features, n_states))
+        conf_group = self.file.create_group(self.file.root, "confounding_effects")
+        for conf in self.data.confounders.values():
+            self.create_array(conf.name, tables.Float64Col(),
+                              (conf.n_groups, n_features, n_states), where=conf_group)
+
+        if self.log_contribution_per_cluster:
+            self.create_array("likelihood_single_clusters", tables.Float64Col(), (n_clusters,))
+            self.create_array("prior_single_clusters", tables.Float64Col(), (n_clusters,))
+
+    def create_array(self, name: str, atom: tables.Atom, shape: tuple, where=None):
+        """Create an extendable array with one row per sample. The array is registered
+        under its path in the file, e.g. `confounding_effects/family`."""
+        array = self.file.create_earray(
+            where=where or self.file.root,
+            name=name,
+            atom=atom,
+            filters=self.FILTERS,
+            shape=(0, *shape),
+        )
+        self.arrays[array._v_pathname.lstrip("/")] = array
+
+    def _write_sample(self, sample: Sample):
+        if self.match_clusters:
+            permutation = self.cluster_matcher.get_permutation(sample)
+            cluster_effect = sample.cluster_effect.value[permutation, :, :]
+            clusters = sample.clusters.value[permutation, :]
+        else:
+            permutation = None
+            cluster_effect = sample.cluster_effect.value
+            clusters = sample.clusters.value
+
+        row = {
+            "sample_id": sample.i_step,
+            "posterior": sample.last_lh + sample.last_prior,
+            "likelihood": sample.last_lh,
+            "prior": sample.last_prior,
+            "clusters": np.packbits(clusters, axis=-1),
+            "weights": sample.weights.value,
+            "cluster_effect": cluster_effect,
+        }
+        for conf in self.data.confounders:
+            row[f"confounding_effects/{conf}"] = sample.confounding_effects[conf].value
+
+        if self.log_contribution_per_cluster:
+            lh, prior = get_cluster_contributions(self.model, sample, permutation)
+            row["likelihood_single_clusters"] = lh
+            row["prior_single_clusters"] = prior
+
+        for name, value in row.items():
+            self.arrays[name].append(np.asarray(value)[None, ...])
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        self.arrays = {}
+
+    def get_checkpoint(self) -> dict:
+        if self.file is None:
+            return {}
+        self.file.flush()
+        return {
+            "n_rows": self.arrays["sample_id"].nrows,
+            "match_clusters": self.match_clusters,
+            "cluster_matcher": self.cluster_matcher.get_checkpoint(),
+        }
+
+    def resume(self, checkpoint: dict):
+        if not checkpoint:
+            return
+        self.file = tables.open_file(self.path, mode="a")
+        for array in self.file.walk_nodes(self.file.root, classname="EArray"):
+            array.truncate(checkpoint["n_rows"])
+            self.arrays[array._v_pathname.lstrip("/")] = array
+        self.match_clusters = checkpoint["match_clusters"]
+        self.cluster_matcher.resume(checkpoint["cluster_matcher"])
+
 
 class LikelihoodLogger(ResultsLogger):
 
     """The LikelihoodLogger continually writes the likelihood of each observation (one per
-     site and feature) as a flattened array to a pytables file (.h5)."""
+     site and feature) as a flattened array to a pytables file (.h5).
 
-    def __init__(self, *args, **kwargs):
+     Only every `thinning`-th sample is written and `buffer_size` rows are collected before
+     each append to the file."""
+
+    def __init__(
+        self,
+        *args,
+        complib: str = "blosc:zlib",
+        complevel: int = 9,
+        checksum: bool = True,
+        precision: str = "float32",
+        thinning: int = 1,
+        buffer_size: int = 1,
+        chunk_shape: Optional[tuple[int, int]] = None,
+        **kwargs,
+    ):
         self.logged_likelihood_array = None
         super().__init__(*args, **kwargs)
+        is_blosc = complib.startswith("blosc")
+        self.filters = tables.Filters(
+            complevel=complevel,
+            complib=complib,
+            shuffle=not is_blosc,
+            bitshuffle=is_blosc,
+            fletcher32=checksum,
+        )
+        self.dtype = np.dtype(precision)
+        self.thinning = thinning
+        self.buffer_size = buffer_size
+        self.chunk_shape = None if chunk_shape is None else tuple(chunk_shape)
+
+        self.buffer: list[npt.NDArray[float]] = []
+        self.n_samples_seen = 0
 
     def open(self):
         self.file = tables.open_file(self.path, mode="w")
 
     def write_header(self, sample: Sample):
+        n_observations = sample.n_objects * sample.n_features
+        chunk_shape = self.chunk_shape
+        if chunk_shape is not None:
+            chunk_shape = (chunk_shape[0], min(chunk_shape[1], n_observations))
+
         # Create the likelihood array
         self.logged_likelihood_array = self.file.create_earray(
             where=self.file.root,
             name="likelihood",
-            atom=tables.Float32Col(),
-            filters=tables.Filters(
-                complevel=9, complib="blosc:zlib", bitshuffle=True, fletcher32=True
-            ),
-            shape=(0, sample.n_objects * sample.n_features),
+            atom=tables.Atom.from_dtype(self.dtype),
+            filters=self.filters,
+            shape=(0, n_observations),
+            chunkshape=chunk_shape,
         )
+        self.logged_likelihood_array.attrs.thinning = self.thinning
 
     def _write_sample(self, sample: Sample):
-        self.logged_likelihood_array.append(sample.observation_lhs[None, ...])
+        if self.n_samples_seen % self.thinning == 0:
+            self.buffer.append(sample.observation_lhs.astype(self.dtype))
+            if len(self.buffer) >= self.buffer_size:
+                self.flush()
+        self.n_samples_seen += 1
+
+    def flush(self):
+        if self.buffer:
+            self.logged_likelihood_array.append(np.stack(self.buffer))
+            self.buffer = []
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+        super().close()
+
+    def get_checkpoint(self) -> dict:
+        if self.file is None:
+            return {}
+        self.flush()
+        self.file.flush()
+        return {
+            "n_rows": self.logged_likelihood_array.nrows,
+            "n_samples_seen": self.n_samples_seen,
+        }
+
+    def resume(self, checkpoint: dict):
+        if not checkpoint:
+            return
+        self.file = tables.open_file(self.path, mode="a")
+        self.logged_likelihood_array = self.file.root.likelihood
+        self.logged_likelihood_array.truncate(checkpoint["n_rows"])
+        self.n_samples_seen = checkpoint["n_samples_seen"]
 
 
 class OperatorStatsLogger(ResultsLogger):
@@ -329,3 +759,7 @@ class OperatorStatsLogger(ResultsLogger):
 
     def _write_sample(self, sample: Sample):
         pass
+
+    def get_checkpoint(self) -> dict:
+        # The file is re-written completely for each sample
+        return {}
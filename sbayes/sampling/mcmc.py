@@ -4,18 +4,24 @@ from __future__ import annotations
 import logging
 import math as _math
 import abc as _abc
+import os as _os
+import pickle as _pickle
 import random as _random
 import time as _time
+import multiprocessing as _mp
+import traceback as _traceback
 import numpy as _np
 from copy import copy
 import typing as typ
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from pathlib import Path
 
 import numpy as np
+from numpy.typing import NDArray
 
 from sbayes.model import Model
 from sbayes.load_data import Data
-from sbayes.sampling.loggers import ResultsLogger, OperatorStatsLogger
+from sbayes.sampling.loggers import ResultsLogger, OperatorStatsLogger, AsyncSampleWriter
 from sbayes.sampling.operators import Operator
 from sbayes.config.config import OperatorsConfig
 
@@ -77,6 +83,10 @@ class MCMCStats:
     n_samples: int = 0
     last_sample = None
 
+    # MC3 swap statistics for each pair of adjacent temperatures
+    swap_attempts: typ.List[int] = field(default_factory=list)
+    swap_accepts: typ.List[int] = field(default_factory=list)
+
     @property
     def time_per_sample(self) -> float:
         return self.sampling_time / self.n_samples
@@ -85,6 +95,11 @@ class MCMCStats:
     def acceptance_rate(self) -> float:
         return self.total_accepts / self.n_samples
 
+    @property
+    def swap_acceptance_rates(self) -> typ.List[float]:
+        return [acc / att if att > 0 else _np.nan
+                for acc, att in zip(self.swap_accepts, self.swap_attempts)]
+
 
 class MCMC(_abc.ABC):
 
@@ -110,14 +125,20 @@ class MCMC(_abc.ABC):
             model: Model,
             data: Data,
             operators: OperatorsConfig,
-            sample_loggers: typ.List[ResultsLogger],
+            sample_loggers: typ.List[ResultsLogger | AsyncSampleWriter],
             n_chains: int = 1,
             mc3: bool = False,
             swap_period: int = None,
             chain_swaps: int = None,
+            temperature_diff: float = 0.05,
+            exponential_temperatures: bool = False,
             sample_from_prior: bool = False,
             show_screen_log: bool = False,
             logger: logging.Logger = None,
+            n_processes: int = 1,
+            checkpoint_path: Path = None,
+            checkpoint_interval: int = None,
+            delayed_acceptance: bool = False,
             **kwargs
     ):
         # The model and data defining the posterior distribution
@@ -129,6 +150,17 @@ class MCMC(_abc.ABC):
         self.chain_idx = list(range(self.n_chains))
         self.sample_from_prior = sample_from_prior
 
+        # Metropolis-coupled MCMC: chains are heated according to a temperature ladder and
+        # periodically swap temperatures. Only the cold chain (temperature 1) is logged.
+        self.mc3 = mc3
+        self.swap_period = swap_period
+        self.chain_swaps = chain_swaps
+        if mc3:
+            self.temperature = get_temperature_ladder(n_chains, temperature_diff,
+                                                      exponential=exponential_temperatures)
+        else:
+            self.temperature = _np.ones(self.n_chains)
+
         # Copy posterior instance for each chain
         self.posterior_per_chain: typ.List[Model] = [copy(model) for _ in range(self.n_chains)]
 
@@ -140,7 +172,9 @@ class MCMC(_abc.ABC):
 
         # Initialize statistics
         self.statistics = MCMCStats(
-            operator_stats={name: OperatorStats(name) for name in self.callable_operators}
+            operator_stats={name: OperatorStats(name) for name in self.callable_operators},
+            swap_attempts=[0] * (self.n_chains - 1),
+            swap_accepts=[0] * (self.n_chains - 1),
         )
 
         # State attributes
@@ -150,6 +184,18 @@ class MCMC(_abc.ABC):
         self.show_screen_log = show_screen_log
         self.t_start = _time.time()
 
+        # Number of worker processes to run the chains in (1 means no parallelization)
+        self.n_processes = n_processes
+        self.chain_workers: ChainWorkers | None = None
+
+        # The full sampler state is written to `checkpoint_path` every `checkpoint_interval`
+        # logged samples (None means no checkpoints)
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+
+        # Screen cluster candidates on the cheap cluster priors before evaluating the likelihood
+        self.delayed_acceptance = delayed_acceptance
+
         if logger is None:
             import logging
             self.logger = logging.getLogger()
@@ -177,6 +223,16 @@ class MCMC(_abc.ABC):
         sample.last_prior = log_prior
         return log_prior
 
+    def cluster_prior(self, sample, chain):
+        """Compute the (log) prior of the clusters of a sample (size and geo-prior), which is
+        used in the first stage of delayed acceptance.
+        Args:
+            sample (Sample): The current sample.
+            chain (int): The current chain.
+        Returns:
+            float: The (log) prior of the clusters"""
+        return self.posterior_per_chain[chain].prior.cluster_prior(sample=sample)
+
     def likelihood(self, sample, chain):
         """Compute the (log) likelihood of the given sample.
 
@@ -195,7 +251,8 @@ class MCMC(_abc.ABC):
 
         if self.CHECK_CACHING and (sample.i_step < 1000) and (sample.i_step % 10 == 0):
             log_lh_stable = self.posterior_per_chain[chain].likelihood(sample=sample, caching=False)
-            assert log_lh == log_lh_stable, f'{log_lh} != {log_lh_stable}'
+            # The cached log-likelihood is updated incrementally and can differ by rounding
+            assert _math.isclose(log_lh, log_lh_stable, rel_tol=1e-9), f'{log_lh} != {log_lh_stable}'
 
         sample.last_lh = log_lh
         return log_lh
@@ -219,7 +276,7 @@ class MCMC(_abc.ABC):
             The operator objects with a proposal function and weights
         """
 
-    def generate_samples(self, n_steps, n_samples, warm_up=False, warm_up_steps=None):
+    def generate_samples(self, n_steps, n_samples, warm_up=False, warm_up_steps=None, resume=False):
         """Run the MCMC sampling procedure with Metropolis Hastings rejection step and options for multiple chains. \
         Samples are returned, statistics saved in self.statistics.
         Args:
@@ -227,6 +284,7 @@ class MCMC(_abc.ABC):
             n_samples (int): The number of samples
             warm_up (bool): Warm-up run or real sampling?
             warm_up_steps (int): Number of warm-up steps
+            resume (bool): Continue the run from the checkpoint at `self.checkpoint_path`?
         Returns:
             list: The generated samples
         """
@@ -234,14 +292,22 @@ class MCMC(_abc.ABC):
         # Generate samples using MCMC with several chains
         sample = [None] * self.n_chains
 
-        # Generate initial samples
-        for c in self.chain_idx:
+        if resume:
+            # Restore the samples and the sampler state from the last checkpoint
+            checkpoint = self.read_checkpoint()
+            sample = checkpoint["sample"]
+            i_first = self.restore_checkpoint(checkpoint)
+        else:
+            checkpoint = None
+
+            # Generate initial samples
+            for c in self.chain_idx:
 
-            sample[c] = self.generate_initial_sample(c)
+                sample[c] = self.generate_initial_sample(c)
 
-            # Compute the (log)-likelihood and the prior for each sample
-            self._ll[c] = self.likelihood(sample[c], c)
-            self._prior[c] = self.prior(sample[c], c)
+                # Compute the (log)-likelihood and the prior for each sample
+                self._ll[c] = self.likelihood(sample[c], c)
+                self._prior[c] = self.prior(sample[c], c)
 
         # # Probability of operators is different if there are zero clusters
         # if self.n_clusters == 0:
@@ -257,18 +323,22 @@ class MCMC(_abc.ABC):
         # Function is called in warmup-mode
         if warm_up:
             print("Tuning parameters in warm-up...")
-            for i_warmup in range(warm_up_steps):
-                warmup_progress = (i_warmup / warm_up_steps) * 100
-                if warmup_progress % 10 == 0:
-                    print("warm-up", int(warmup_progress), "%")
-                for c in self.chain_idx:
-                    sample[c] = self.step(sample[c], c)
-                    sample[c].i_step = i_warmup
+            self.start_chain_workers(sample)
+
+            # Run the warm-up in segments between the progress messages
+            progress_steps = [i for i in range(warm_up_steps)
+                              if (i / warm_up_steps * 100) % 10 == 0]
+            for i_start, i_end in zip(progress_steps, progress_steps[1:] + [warm_up_steps]):
+                print("warm-up", int(i_start / warm_up_steps * 100), "%")
+                sample = self.run_steps(sample, i_start, i_end)
 
             # For the last sample find the best chain (highest posterior)
             posterior_samples = [self._ll[c] + self._prior[c] for c in self.chain_idx]
 
             best_chain = posterior_samples.index(max(posterior_samples))
+            if self.chain_workers is not None:
+                sample[best_chain] = self.chain_workers.get_samples([best_chain])[best_chain]
+                self.stop_chain_workers()
 
             # Return the best sample
             return sample[best_chain]
@@ -278,28 +348,53 @@ class MCMC(_abc.ABC):
             print("Sampling from posterior...")
             steps_per_sample = int(_np.ceil(n_steps / n_samples))
             t_start = _time.time()
-
-            for i_step in range(n_steps):
-                # Generate samples for each chain
-                for c in self.chain_idx:
-                    sample[c] = self.step(sample[c], c)
-                    sample[c].i_step = i_step
+            self.start_chain_workers(sample)
+
+            if checkpoint is None:
+                i_step = 0
+            else:
+                # Random states are restored after starting the workers (which draws seeds)
+                self.restore_random_states(checkpoint)
+                t_start -= checkpoint["sampling_time"]
+                i_step = i_first
+                print("Resuming from step", i_step)
+
+            while i_step < n_steps:
+                # Run all chains up to the next step at which we need to log or swap
+                i_next = self.next_event_step(i_step, steps_per_sample, n_steps)
+                log_sample = (i_next % steps_per_sample == 0)
+                last_step = (i_next % (n_steps-1) == 0 and i_next != 0)
+                fetch = [self.cold_chain] if (log_sample or last_step) else []
+                sample = self.run_steps(sample, i_step, i_next + 1, fetch=fetch)
+                i_step = i_next
 
                 # Log samples at fixed intervals
-                if i_step % steps_per_sample == 0:
+                if log_sample:
 
-                    # Log samples, but only from the first chain
-                    self.log_sample_statistics(sample[self.chain_idx[0]], c=self.chain_idx[0],
+                    # Log samples, but only from the cold chain
+                    self.log_sample_statistics(sample[self.cold_chain], c=self.cold_chain,
                                                sample_id=int(i_step/steps_per_sample))
 
                 # Print work status and likelihood at fixed intervals
                 if (i_step+1) % 1000 == 0:
                     self.print_screen_log(i_step+1, sample)
 
-                # Log the last sample of the first chain
-                if i_step % (n_steps-1) == 0 and i_step != 0:
-                    self.statistics.last_sample = sample[self.chain_idx[0]]
+                # Log the last sample of the cold chain
+                if last_step:
+                    self.statistics.last_sample = sample[self.cold_chain]
+
+                # Propose to swap the temperatures of chains at fixed intervals
+                if self.mc3 and (i_step+1) % self.swap_period == 0:
+                    self.swap_chains()
+
+                # Save the sampler state at fixed intervals (not needed after the last step)
+                if (log_sample and self.checkpoint_interval is not None and i_step < n_steps - 1
+                        and (i_step // steps_per_sample) % self.checkpoint_interval == 0):
+                    self.write_checkpoint(sample, i_step + 1, _time.time() - t_start)
 
+                i_step += 1
+
+            self.stop_chain_workers()
             t_end = _time.time()
             self.statistics.sampling_time = t_end - t_start
             self.statistics.n_samples = n_samples
@@ -308,6 +403,173 @@ class MCMC(_abc.ABC):
         for logger in self.sample_loggers:
             logger.close()
 
+    def write_checkpoint(self, sample: list[Sample], i_step: int, sampling_time: float):
+        """Write the complete state of the sampler (samples, likelihood and prior, MC3
+        temperatures, statistics, random states and the positions in the output files) to
+        `self.checkpoint_path`, so that the run can be continued at step `i_step`."""
+        if self.chain_workers is not None:
+            sample = list(sample)
+            for c, sample_c in self.chain_workers.get_samples(self.chain_idx).items():
+                sample[c] = sample_c
+            worker_random_states = self.chain_workers.get_random_states()
+        else:
+            worker_random_states = None
+
+        checkpoint = {
+            "i_step": i_step,
+            "sampling_time": sampling_time,
+            "sample": sample,
+            "ll": self._ll,
+            "prior": self._prior,
+            "temperature": self.temperature,
+            "statistics": self.statistics,
+            "operator_counts": {name: (op.accepts, op.rejects)
+                                for name, op in self.callable_operators.items()},
+            "loggers": [logger.get_checkpoint() for logger in self.sample_loggers],
+            "numpy_random_state": _np.random.get_state(),
+            "random_state": _random.getstate(),
+            "worker_random_states": worker_random_states,
+        }
+
+        # Replace the previous checkpoint only once the new one is completely written
+        tmp_path = self.checkpoint_path.with_name(self.checkpoint_path.name + '.tmp')
+        with open(tmp_path, 'wb') as checkpoint_file:
+            _pickle.dump(checkpoint, checkpoint_file)
+            checkpoint_file.flush()
+            _os.fsync(checkpoint_file.fileno())
+        _os.replace(tmp_path, self.checkpoint_path)
+
+    def read_checkpoint(self) -> dict:
+        with open(self.checkpoint_path, 'rb') as checkpoint_file:
+            return _pickle.load(checkpoint_file)
+
+    def restore_checkpoint(self, checkpoint: dict) -> int:
+        """Restore the state of the sampler from a checkpoint (see `write_checkpoint`). The
+        random states are restored separately (see `restore_random_states`).
+
+        Returns:
+            The index of the next MCMC step.
+        """
+        self._ll[:] = checkpoint["ll"]
+        self._prior[:] = checkpoint["prior"]
+        self.temperature[:] = checkpoint["temperature"]
+        self.statistics = checkpoint["statistics"]
+        for name, (accepts, rejects) in checkpoint["operator_counts"].items():
+            self.callable_operators[name].accepts = accepts
+            self.callable_operators[name].rejects = rejects
+
+        # Truncate the output files to the state of the checkpoint and continue writing
+        for logger, logger_checkpoint in zip(self.sample_loggers, checkpoint["loggers"]):
+            logger.resume(logger_checkpoint)
+
+        return checkpoint["i_step"]
+
+    def restore_random_states(self, checkpoint: dict):
+        _np.random.set_state(checkpoint["numpy_random_state"])
+        _random.setstate(checkpoint["random_state"])
+        worker_random_states = checkpoint["worker_random_states"]
+        if self.chain_workers is not None and worker_random_states is not None:
+            self.chain_workers.set_random_states(worker_random_states)
+
+    def next_event_step(self, i_step: int, steps_per_sample: int, n_steps: int) -> int:
+        """Find the next step (starting at `i_step`) after which a sample is logged, the
+        screen log is printed, chains are swapped or the run ends."""
+        next_sample = -(-i_step // steps_per_sample) * steps_per_sample
+        next_screen_log = -(-(i_step + 1) // 1000) * 1000 - 1
+        next_step = min(next_sample, next_screen_log, n_steps - 1)
+        if self.mc3:
+            next_swap = -(-(i_step + 1) // self.swap_period) * self.swap_period - 1
+            next_step = min(next_step, next_swap)
+        return next_step
+
+    @property
+    def cold_chain(self) -> int:
+        """The index of the chain which currently samples from the (unheated) posterior."""
+        return int(_np.argmin(self.temperature))
+
+    def swap_chains(self):
+        """Propose to swap the temperatures of chains with adjacent temperatures and
+        accept according to the Metropolis-Hastings criterion for MC3."""
+        for _ in range(self.chain_swaps):
+            # Chains sorted by temperature (cold to hot)
+            chains_by_temperature = _np.argsort(self.temperature)
+
+            # Pick a random pair of adjacent temperatures
+            i = _np.random.randint(self.n_chains - 1)
+            c1 = chains_by_temperature[i]
+            c2 = chains_by_temperature[i + 1]
+            t1 = self.temperature[c1]
+            t2 = self.temperature[c2]
+
+            # Only the (tempered) likelihood differs between the chains
+            log_ratio = (1/t1 - 1/t2) * (self._ll[c2] - self._ll[c1])
+
+            self.statistics.swap_attempts[i] += 1
+            if _math.log(_random.random()) < log_ratio:
+                self.temperature[c1] = t2
+                self.temperature[c2] = t1
+                self.statistics.swap_accepts[i] += 1
+
+    def run_steps(
+        self,
+        sample: list[Sample],
+        i_start: int,
+        i_end: int,
+        fetch: typ.Sequence[int] = (),
+    ) -> list[Sample]:
+        """Advance all chains by the MCMC steps `i_start` to `i_end` (exclusive).
+
+        Args:
+            sample: The current sample of each chain.
+            i_start: Index of the first step.
+            i_end: Index after the last step.
+            fetch: Chains for which the updated sample is required in the main process.
+                Only relevant when the chains are run in worker processes.
+        Returns:
+            The updated samples (samples of chains in worker processes which were not
+            fetched remain outdated).
+        """
+        if self.chain_workers is not None:
+            for c, sample_c in self.chain_workers.run_steps(i_start, i_end, fetch).items():
+                sample[c] = sample_c
+        else:
+            for i_step in range(i_start, i_end):
+                for c in self.chain_idx:
+                    sample[c] = self.step(sample[c], c)
+                    sample[c].i_step = i_step
+
+        return sample
+
+    def start_chain_workers(self, sample: list[Sample]):
+        """Move the chains to separate worker processes if parallel execution is enabled."""
+        if self.n_processes <= 1 or self.n_chains <= 1:
+            return
+
+        if _mp.current_process().daemon:
+            # Daemonic processes (e.g. in a multiprocessing.Pool) can not have children
+            self.logger.warning("Cannot start worker processes for the MCMC chains from "
+                                "within a daemonic process. Running the chains sequentially.")
+            return
+
+        self.chain_workers = ChainWorkers(self, self.n_processes)
+        self.chain_workers.set_samples(sample)
+
+    def get_worker_copy(self) -> MCMC:
+        """Create a copy of the sampler to be sent to a worker process. The copy contains
+        only what is needed to advance the chains (models, operators and settings), not the
+        logger, the sample loggers or the worker handles, which can not be pickled (as
+        required by the `spawn` and `forkserver` start methods)."""
+        worker_mcmc = copy(self)
+        worker_mcmc.logger = logging.getLogger(__name__)
+        worker_mcmc.sample_loggers = []
+        worker_mcmc.chain_workers = None
+        return worker_mcmc
+
+    def stop_chain_workers(self):
+        if self.chain_workers is not None:
+            self.chain_workers.close()
+            self.chain_workers = None
+
     def choose_operator(self) -> Operator:
         # Randomly choose one operator to propose a new sample
         step_weights = [w.weight for w in self.callable_operators.values()]
@@ -329,29 +591,62 @@ class MCMC(_abc.ABC):
             Sample: A Sample object consisting of clusters, weights, areal and confounding effects"""
         operator = self.choose_operator()
         step_function = operator['function']
+        temperature = self.temperature[c]
+        heated = (temperature != 1.)
 
-        candidate, log_q, log_q_back = step_function(sample, c=c)
+        # Operators modify the sample in place. Unless the step is always accepted (Gibbs
+        # operators in the cold chain), we record the changes to undo them on rejection.
+        in_transaction = heated or not operator.GIBBS
+        if in_transaction:
+            sample.begin_transaction()
 
-        # Compute the log-likelihood of the candidate
-        ll_candidate = self.likelihood(candidate, c)
+        delayed_acceptance = self.delayed_acceptance and operator.CLUSTER_OPERATOR
+        if delayed_acceptance:
+            cluster_prior_prev = self.cluster_prior(sample, c)
 
-        # Compute the prior of the candidate
-        prior_candidate = self.prior(candidate, c)
+        candidate, log_q, log_q_back = step_function(sample, c=c)
+        assert in_transaction or log_q == self.Q_GIBBS, \
+            f"Operator {operator['name']} is marked as Gibbs, but returned a hastings factor."
+
+        # Delayed acceptance: a first MH stage only considers the cluster priors and the
+        # proposal ratio. The second stage divides the full MH ratio by the first-stage
+        # ratio, so that the target distribution is unchanged.
+        first_stage_ratio = 0.
+        if delayed_acceptance and log_q != -_np.inf and log_q_back != -_np.inf:
+            first_stage_ratio = self.cluster_prior(candidate, c) - cluster_prior_prev - log_q + log_q_back
+            if first_stage_ratio < 0 and _math.log(_random.random()) >= first_stage_ratio:
+                log_q_back = self.Q_BACK_REJECT
 
         # Evaluate the metropolis-hastings ratio
         if log_q_back == -_np.inf:
+            # Rejected without evaluating the likelihood of the candidate
             accept = False
         elif log_q == -_np.inf:
-            accept = True
+            ll_candidate = self.likelihood(candidate, c)
+            prior_candidate = self.prior(candidate, c)
+
+            if heated:
+                # Gibbs proposals are drawn from the unheated conditional posterior. For a
+                # tempered likelihood (lh^(1/T)) the Hastings ratio reduces to:
+                mh_ratio = (1/temperature - 1) * (ll_candidate - self._ll[c])
+                accept = _math.log(_random.random()) < mh_ratio
+            else:
+                accept = True
         else:
+            ll_candidate = self.likelihood(candidate, c)
+            prior_candidate = self.prior(candidate, c)
             mh_ratio = self.metropolis_hastings_ratio(ll_new=ll_candidate, ll_prev=self._ll[c],
                                                       prior_new=prior_candidate, prior_prev=self._prior[c],
-                                                      log_q=log_q, log_q_back=log_q_back)
+                                                      log_q=log_q, log_q_back=log_q_back,
+                                                      temperature=temperature)
+            mh_ratio -= first_stage_ratio
 
             # Accept/reject according to MH-ratio and update
             accept = _math.log(_random.random()) < mh_ratio
 
         if accept:
+            if in_transaction:
+                candidate.commit()
             sample = candidate
             self._ll[c] = ll_candidate
             self._prior[c] = prior_candidate
@@ -359,6 +654,8 @@ class MCMC(_abc.ABC):
             self.statistics.operator_stats[operator['name']].accepts += 1
             operator.register_accept()
         else:
+            if in_transaction:
+                sample.rollback()
             self.statistics.operator_stats[operator['name']].rejects += 1
             operator.register_reject()
         return sample
@@ -373,7 +670,7 @@ class MCMC(_abc.ABC):
             prior_prev(float): the prior of the current sample
             log_q (float): the transition probability
             log_q_back (float): the back-probability
-            temperature(float): the temperature of the MCMC
+            temperature(float): the temperature of the MCMC chain (the likelihood is heated)
         Returns:
             (float): the metropolis-hastings ratio
         """
@@ -381,7 +678,7 @@ class MCMC(_abc.ABC):
         log_q_ratio = log_q - log_q_back
 
         prior_ratio = prior_new - prior_prev
-        mh_ratio = (ll_ratio * temperature) - log_q_ratio + prior_ratio
+        mh_ratio = (ll_ratio / temperature) - log_q_ratio + prior_ratio
 
         return mh_ratio
 
@@ -398,7 +695,7 @@ class MCMC(_abc.ABC):
     def print_screen_log(self, i_step, sample):
         i_step_str = str.ljust(str(i_step), 12)
 
-        likelihood = self.likelihood(sample[self.chain_idx[0]], self.chain_idx[0])
+        likelihood = self._ll[self.cold_chain]
         likelihood_str = str.ljust('log-likelihood:  %.2f' % likelihood, 36)
 
         time_per_million = (_time.time() - self.t_start) / (i_step + 1) * 1000000
@@ -413,3 +710,226 @@ class MCMC(_abc.ABC):
         self.logger.info(OperatorStats.get_log_message_header())
         for op_stats in self.statistics.operator_stats.values():
             self.logger.info(op_stats.get_log_message_row())
+
+        if self.mc3:
+            ladder = _np.sort(self.temperature)
+            self.logger.info("\n")
+            self.logger.info("MC3 CHAIN SWAPS")
+            self.logger.info("##########################################")
+            self.logger.info('\t'.join([str.ljust('TEMPERATURES', 20), str.ljust('ATTEMPTS', 8),
+                                         str.ljust('ACCEPTS', 8), 'ACC. RATE']))
+            for i, acc_rate in enumerate(self.statistics.swap_acceptance_rates):
+                temperatures_str = str.ljust('%.3f <-> %.3f' % (ladder[i], ladder[i+1]), 20)
+                attempts_str = str.ljust(str(self.statistics.swap_attempts[i]), 8)
+                accepts_str = str.ljust(str(self.statistics.swap_accepts[i]), 8)
+                acc_rate_str = '%.2f%%' % (100 * acc_rate)
+                self.logger.info('\t'.join([temperatures_str, attempts_str, accepts_str, acc_rate_str]))
+
+
+class ChainWorkers:
+
+    """Runs the chains of an MCMC sampler in separate worker processes. Each worker owns
+    a subset of the chains, including their samples, model copies and random number
+    generator. The main process only receives the samples it explicitly asks for (e.g.
+    for logging), the likelihood and prior of each chain and the operator statistics."""
+
+    def __init__(self, mcmc: MCMC, n_processes: int):
+        self.mcmc = mcmc
+        n_processes = min(n_processes, mcmc.n_chains)
+        self.chains_by_worker = [mcmc.chain_idx[i::n_processes] for i in range(n_processes)]
+
+        # Seeds are drawn from the global random state to keep runs reproducible
+        seeds = _np.random.randint(2**31, size=n_processes)
+
+        worker_mcmc = mcmc.get_worker_copy()
+        self.connections = []
+        self.processes = []
+        for chains, seed in zip(self.chains_by_worker, seeds):
+            connection, worker_connection = _mp.Pipe()
+            process = _mp.Process(
+                target=run_chain_worker,
+                args=(worker_mcmc, chains, int(seed), worker_connection),
+                daemon=True,
+            )
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def _send(self, worker: int, *message):
+        self.connections[worker].send(message)
+
+    def _receive(self, worker: int):
+        status, result = self.connections[worker].recv()
+        if status == 'error':
+            self.close()
+            raise RuntimeError(f'MCMC worker process failed:\n{result}')
+        return result
+
+    def set_samples(self, sample: list[Sample]):
+        """Send the current sample, likelihood and prior of each chain to its worker."""
+        for w, chains in enumerate(self.chains_by_worker):
+            states = {c: (sample[c], self.mcmc._ll[c], self.mcmc._prior[c]) for c in chains}
+            self._send(w, 'set', states)
+        for w in range(len(self.connections)):
+            self._receive(w)
+
+    def get_samples(self, chains: typ.Sequence[int]) -> dict[int, Sample]:
+        """Retrieve the current samples of the given chains from the workers."""
+        for w, worker_chains in enumerate(self.chains_by_worker):
+            self._send(w, 'get', [c for c in chains if c in worker_chains])
+        samples = {}
+        for w in range(len(self.connections)):
+            samples.update(self._receive(w))
+        return samples
+
+    def get_random_states(self) -> list[tuple]:
+        """Retrieve the states of the random number generators of all workers."""
+        for w in range(len(self.connections)):
+            self._send(w, 'get_random_state')
+        return [self._receive(w) for w in range(len(self.connections))]
+
+    def set_random_states(self, random_states: list[tuple]):
+        """Set the states of the random number generators of all workers."""
+        if len(random_states) != len(self.connections):
+            self.mcmc.logger.warning("The number of worker processes changed since the checkpoint. "
+                                     "The random states of the workers are not restored.")
+            return
+        for w, random_state in enumerate(random_states):
+            self._send(w, 'set_random_state', random_state)
+        for w in range(len(self.connections)):
+            self._receive(w)
+
+    def run_steps(self, i_start: int, i_end: int, fetch: typ.Sequence[int] = ()) -> dict[int, Sample]:
+        """Advance all chains in parallel and collect the results of the workers."""
+        for w, chains in enumerate(self.chains_by_worker):
+            temperatures = {c: self.mcmc.temperature[c] for c in chains}
+            self._send(w, 'run', i_start, i_end, [c for c in fetch if c in chains], temperatures)
+
+        samples = {}
+        statistics = self.mcmc.statistics
+        for w in range(len(self.connections)):
+            states, fetched, op_counts, total_accepts = self._receive(w)
+            for c, (ll, prior) in states.items():
+                self.mcmc._ll[c] = ll
+                self.mcmc._prior[c] = prior
+            samples.update(fetched)
+
+            # Merge the operator statistics of the worker into the main process
+            statistics.total_accepts += total_accepts
+            for name, (accepts, rejects) in op_counts.items():
+                statistics.operator_stats[name].accepts += accepts
+                statistics.operator_stats[name].rejects += rejects
+                self.mcmc.callable_operators[name].accepts += accepts
+                self.mcmc.callable_operators[name].rejects += rejects
+
+        return samples
+
+    def close(self):
+        for connection, process in zip(self.connections, self.processes):
+            if process.is_alive():
+                try:
+                    connection.send(('close',))
+                except (BrokenPipeError, OSError):
+                    pass
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+            connection.close()
+        self.connections = []
+        self.processes = []
+
+
+def run_chain_worker(mcmc: MCMC, chains: list[int], seed: int, connection):
+    """Main loop of a worker process, advancing the given `chains` of `mcmc` on request
+    of the main process (see ChainWorkers)."""
+    _np.random.seed(seed)
+    _random.seed(seed)
+
+    sample = {}
+    stats = mcmc.statistics
+    while True:
+        command, *args = connection.recv()
+        if command == 'close':
+            break
+
+        try:
+            if command == 'set':
+                for c, (sample_c, ll, prior) in args[0].items():
+                    sample[c] = sample_c
+                    mcmc._ll[c] = ll
+                    mcmc._prior[c] = prior
+                result = None
+
+            elif command == 'get':
+                result = {c: sample[c] for c in args[0]}
+
+            elif command == 'get_random_state':
+                result = (_np.random.get_state(), _random.getstate())
+
+            elif command == 'set_random_state':
+                numpy_random_state, random_state = args[0]
+                _np.random.set_state(numpy_random_state)
+                _random.setstate(random_state)
+                result = None
+
+            elif command == 'run':
+                i_start, i_end, fetch, temperatures = args
+                for c, temperature in temperatures.items():
+                    mcmc.temperature[c] = temperature
+
+                counts_before = {name: (s.accepts, s.rejects) for name, s in stats.operator_stats.items()}
+                total_accepts_before = stats.total_accepts
+
+                for i_step in range(i_start, i_end):
+                    for c in chains:
+                        sample[c] = mcmc.step(sample[c], c)
+                        sample[c].i_step = i_step
+
+                op_counts = {
+                    name: (s.accepts - counts_before[name][0], s.rejects - counts_before[name][1])
+                    for name, s in stats.operator_stats.items()
+                }
+                result = (
+                    {c: (mcmc._ll[c], mcmc._prior[c]) for c in chains},
+                    {c: sample[c] for c in fetch},
+                    op_counts,
+                    stats.total_accepts - total_accepts_before,
+                )
+
+            else:
+                raise ValueError(f'Unknown command `{command}`')
+
+        except Exception:
+            connection.send(('error', _traceback.format_exc()))
+            break
+
+        connection.send(('ok', result))
+
+    connection.close()
+
+
+def get_temperature_ladder(n_chains: int, temperature_diff: float, exponential: bool = False) -> NDArray[float]:
+    """Compute the temperatures of the chains in Metropolis-coupled MCMC. The first chain
+    is the cold chain (temperature 1), the others are increasingly heated.
+
+    Args:
+        n_chains: The number of chains.
+        temperature_diff: The difference between the temperatures of adjacent chains.
+        exponential: Whether temperatures increase exponentially (1+diff)^i instead of
+            linearly (1 + i*diff).
+    Returns:
+        The temperature of each chain.
+            shape: (n_chains,)
+
+    == Usage ===
+    >>> get_temperature_ladder(3, 0.5)
+    array([1. , 1.5, 2. ])
+    >>> get_temperature_ladder(3, 0.5, exponential=True)
+    array([1.  , 1.5 , 2.25])
+    """
+    i = _np.arange(n_chains)
+    if exponential:
+        return (1 + temperature_diff) ** i
+    else:
+        return 1 + i * temperature_diff
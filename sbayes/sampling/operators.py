@@ -12,8 +12,10 @@ import scipy.stats as stats
 
 from sbayes.load_data import ConfounderName
 from sbayes.sampling.state import Sample
-from sbayes.util import dirichlet_logpdf, normalize, get_neighbours
-from sbayes.model import Model, Likelihood, Prior, normalize_weights, update_weights
+from sbayes.util import dirichlet_logpdf, normalize, get_neighbours, sample_dirichlet
+from sbayes.model import (
+    Model, Likelihood, Prior, normalize_weights, update_weights, lookup_state_probs
+)
 from sbayes.preprocessing import sample_categorical
 from sbayes.config.config import OperatorsConfig
 
@@ -41,6 +43,15 @@ class Operator(ABC):
     REQUIRED_PARAMETERS: Sequence[str] = []
     """Parameters that need to be defined in `additional_parameters` for this operator type."""
 
+    GIBBS: bool = False
+    """Gibbs operators sample from the conditional posterior and are always accepted in
+    unheated chains. All other operators modify the sample in place, which requires an
+    open transaction (see `Sample.begin_transaction`) to undo rejected proposals."""
+
+    CLUSTER_OPERATOR: bool = False
+    """Cluster operators only change the clusters (and possibly the source), so that their
+    proposals can be screened on the cluster priors in delayed acceptance MCMC."""
+
     def __init__(self, weight: float, **kwargs):
         self.weight = weight
         self.additional_parameters = kwargs
@@ -61,7 +72,7 @@ class Operator(ABC):
 
     @abstractmethod
     def _propose(self, sample: Sample, **kwargs) -> tuple[Sample, float, float]:
-        """Propose a new state from the given one."""
+        """Propose a new state by modifying the given sample in place."""
         pass
 
     def __getitem__(self, key: str) -> Any:
@@ -148,8 +159,6 @@ class AlterWeights(DirichletOperator):
         Returns:
             Sample: The modified sample
         """
-        sample_new = sample.copy()
-
         # Randomly choose one of the features
         f_id = np.random.choice(range(sample.n_features))
 
@@ -171,10 +180,9 @@ class AlterWeights(DirichletOperator):
         w_new = w_new_t * w_curr.sum()
 
         # Update
-        with sample_new.weights.edit() as w:
-            w[f_id, weights_to_alter] = w_new
+        sample.weights.set_items((f_id, weights_to_alter), w_new)
 
-        return sample_new, log_q, log_q_back
+        return sample, log_q, log_q_back
 
 
 class AlterClusterEffect(DirichletOperator):
@@ -187,8 +195,6 @@ class AlterClusterEffect(DirichletOperator):
 
     def _propose(self, sample: Sample, **kwargs) -> tuple[Sample, float, float]:
         """Modifies the areal effect of one state, feature and cluster in the current sample."""
-        sample_new = sample.copy()
-
         # Randomly choose one of the clusters, one of the features and one of the states
         z_id = np.random.choice(range(sample.n_clusters))
         f_id = np.random.choice(range(sample.n_features))
@@ -214,10 +220,10 @@ class AlterClusterEffect(DirichletOperator):
         p_new = p_new_t * p_current.sum()
 
         # Update sample
-        with sample_new.cluster_effect.edit_group(z_id) as ce_z:
+        with sample.cluster_effect.edit_group(z_id) as ce_z:
             ce_z[f_id, states_to_alter] = p_new
 
-        return sample_new, log_q, log_q_back
+        return sample, log_q, log_q_back
 
 
 class AlterConfoundingEffects(DirichletOperator):
@@ -231,8 +237,6 @@ class AlterConfoundingEffects(DirichletOperator):
 
     def _propose(self, sample: Sample, **kwargs) -> tuple[Sample, float, float]:
         """This function modifies confounding effect [i] of one state and one feature in the current sample"""
-        sample_new = sample.copy()
-
         # Randomly choose one of the families and one of the features
         group_id = np.random.randint(0, sample.n_groups(self.confounder))
         f_id = np.random.choice(range(sample.n_features))
@@ -260,13 +264,16 @@ class AlterConfoundingEffects(DirichletOperator):
         p_new = p_new_t * p_current.sum()
 
         # Update sample
-        with sample_new.confounding_effects[self.confounder].edit_group(group_id) as group_effect:
+        with sample.confounding_effects[self.confounder].edit_group(group_id) as group_effect:
             group_effect[f_id, states_to_alter] = p_new
 
-        return sample_new, log_q, log_q_back
+        return sample, log_q, log_q_back
 
 
 class GibbsSampleSource(Operator):
+
+    GIBBS = True
+
     def __init__(
         self,
         weight: float,
@@ -280,6 +287,9 @@ class GibbsSampleSource(Operator):
         self.as_gibbs = as_gibbs
         self.sample_from_prior = sample_from_prior
 
+        # Only a Gibbs operator when used on its own (otherwise it returns a hastings factor)
+        self.GIBBS = as_gibbs
+
     def _propose(
         self,
         sample: Sample,
@@ -301,8 +311,7 @@ class GibbsSampleSource(Operator):
             p = self.calculate_source_posterior(sample, site_subset)
 
         # Sample the new source assignments
-        with sample.source.edit() as source:
-            source[site_subset] = sample_categorical(p=p, binary_encoding=True)
+        sample.source.set_items(site_subset, sample_categorical(p=p, binary_encoding=True))
 
         if self.as_gibbs:
             # This is a Gibbs operator, which should always be accepted
@@ -324,6 +333,9 @@ class GibbsSampleSource(Operator):
 
 
 class GibbsSampleWeights(Operator):
+
+    GIBBS = True
+
     def __init__(
         self,
         *args,
@@ -419,6 +431,9 @@ class GibbsSampleWeights(Operator):
 
 
 class GibbsSampleClusterEffect(Operator):
+
+    GIBBS = True
+
     def __init__(
         self,
         weight: float,
@@ -450,25 +465,15 @@ class GibbsSampleClusterEffect(Operator):
 
         if self.sample_from_prior:
             # To sample from prior we emulate an empty dataset
-            features = np.zeros((1, sample.n_features, sample.n_states))
+            counts = np.zeros((sample.n_features, sample.n_states))
         else:
             # Only consider observations that are attributed to the areal effect distribution
-            from_cluster = (
-                sample.source.value[..., 0]
-                & sample.clusters.value[i_cluster, :, np.newaxis]
-            )
-            features = (
-                from_cluster[..., np.newaxis] * self.get_likelihood(sample).features
-            )
+            likelihood = self.get_likelihood(sample)
+            counts = likelihood.update_cluster_state_counts(sample)[i_cluster]
 
-        # Resample cluster_effect according to these observations
+        # Resample cluster_effect according to these observations (all features at once)
         with sample.cluster_effect.edit_group(i_cluster) as cluster_effect:
-            for i_feat in range(sample.n_features):
-                s_idxs = self.applicable_states[i_feat]
-                feature_counts = np.nansum(features[:, i_feat, s_idxs], axis=0)
-                cluster_effect[i_feat, s_idxs] = np.random.dirichlet(
-                    alpha=1 + feature_counts
-                )
+            cluster_effect[...] = sample_dirichlet(1 + counts, self.applicable_states)
 
         return sample, self.Q_GIBBS, self.Q_BACK_GIBBS
 
@@ -477,6 +482,9 @@ class GibbsSampleClusterEffect(Operator):
 
 
 class GibbsSampleConfoundingEffects(Operator):
+
+    GIBBS = True
+
     def __init__(
         self,
         weight: float,
@@ -485,6 +493,7 @@ class GibbsSampleConfoundingEffects(Operator):
         model_by_chain: list[Model],
         applicable_states: NDArray[bool],
         sample_from_prior: bool = False,
+        all_groups: bool = False,
         **kwargs,
     ):
         super().__init__(weight=weight, **kwargs)
@@ -493,6 +502,7 @@ class GibbsSampleConfoundingEffects(Operator):
         self.applicable_states = applicable_states
         self.source_index = source_index
         self.sample_from_prior = sample_from_prior
+        self.all_groups = all_groups
 
     def _propose(
         self,
@@ -501,45 +511,44 @@ class GibbsSampleConfoundingEffects(Operator):
         **kwargs,
     ) -> tuple[Sample, float, float]:
         """Resample one confounding effects according to the conditional posterior distr.
+        If the operator was created with `all_groups=True` (and no `i_group` is given),
+        the effects of all groups of the confounder are resampled at once.
         Args:
             sample: The current sample with clusters and parameters
-            i_cluster: Index of the cluster to be changed
+            i_group: Index of the group to be changed
         Returns:
             The modified sample and forward and backward transition log-probabilities
         """
         conf = self.confounder
-        if i_group is None:
-            i_group = np.random.randint(0, sample.n_groups(conf))
-        group = sample.confounders[conf].group_names[i_group]
+        if self.all_groups and i_group is None:
+            groups = list(range(sample.n_groups(conf)))
+        else:
+            if i_group is None:
+                i_group = np.random.randint(0, sample.n_groups(conf))
+            groups = [i_group]
+        group_names = sample.confounders[conf].group_names
 
         if self.sample_from_prior:
             # To sample from prior we emulate an empty dataset
-            features = np.zeros((1, sample.n_features, sample.n_states))
+            counts = np.zeros((sample.n_groups(conf), sample.n_features, sample.n_states))
         else:
-            # Select subset of features
-            # features = self.features[:, feature_subset, :]
-            features = self.get_likelihood(sample).features
-
             # Only consider observations that are attributed to the relevant confounding effect and group
-            # from_group = (sample.source[:, feature_subset, source_i] &
-            from_group = (
-                sample.source.value[:, :, self.source_index]
-                & sample.confounders[conf].group_assignment[i_group, :, np.newaxis]
-            )
-            features = from_group[..., np.newaxis] * features
+            likelihood = self.get_likelihood(sample)
+            counts = likelihood.update_confounder_state_counts(sample, conf)
 
         # Get the prior pseudo-counts
         prior = self.get_prior(sample)
-        prior_counts = prior.prior_confounding_effects[conf].concentration[group]
-
-        # Resample confounding effect according to these observations
-        with sample.confounding_effects[conf].edit_group(i_group) as group_effect:
-            for i_feat in range(sample.n_features):
-                s_idxs = self.applicable_states[i_feat]
-                feature_counts = np.nansum(features[:, i_feat, s_idxs], axis=0)
-                group_effect[i_feat, s_idxs] = np.random.dirichlet(
-                    prior_counts[i_feat] + feature_counts
-                )
+        prior_counts = np.array([
+            prior.prior_confounding_effects[conf].padded_concentration[group_names[i]]
+            for i in groups
+        ])
+
+        # Resample the confounding effects according to these observations
+        new_effects = sample_dirichlet(prior_counts + counts[groups], self.applicable_states)
+        if self.all_groups and i_group is None:
+            sample.confounding_effects[conf].set_value(new_effects)
+        else:
+            sample.confounding_effects[conf].set_group(i_group, new_effects[0])
 
         return sample, self.Q_GIBBS, self.Q_BACK_GIBBS
 
@@ -552,6 +561,8 @@ class GibbsSampleConfoundingEffects(Operator):
 
 class _AlterCluster(Operator):
 
+    CLUSTER_OPERATOR = True
+
     def __init__(
         self,
         *args,
@@ -598,72 +609,43 @@ class _AlterCluster(Operator):
     def get_likelihood(self, sample):
         return self.model_by_chain[sample.chain].likelihood
 
-    def propose_new_sources(
-        self, sample_old: Sample, sample_new: Sample, changed_objects: list[int] | NDArray[int]
-    ) -> tuple[Sample, float, float]:
-        n_features = sample_old.n_features
+    SOURCE_PROPOSAL = "gibbs"
+    """How to propose the source of the changed objects (gibbs, prior or uniform)."""
 
-        MODE = "gibbs"
-
-        if MODE == "gibbs":
-            sample_new, log_q, log_q_back = self.gibbs_sample_source(
-                sample_new, sample_old, object_subset=changed_objects
-            )
-
-        elif MODE == "prior":
-            p = update_weights(sample_new)[changed_objects]
-            p_back = update_weights(sample_old)[changed_objects]
-            with sample_new.source.edit() as source:
-                source[changed_objects, :, :] = sample_categorical(p, binary_encoding=True)
-                log_q = np.log(p[source[changed_objects]]).sum()
-            log_q_back = np.log(p_back[sample_old.source.value[changed_objects]]).sum()
-
-        elif MODE == "uniform":
-            has_components_new = sample_new.cache.has_components.value
-            p = normalize(
-                np.tile(has_components_new[changed_objects, None, :], (1, n_features, 1))
-            )
-            with sample_new.source.edit() as source:
-                source[changed_objects, :, :] = sample_categorical(
-                    p, binary_encoding=True
-                )
-                log_q = np.log(p[source[changed_objects]]).sum()
-
-            has_components_old = sample_old.cache.has_components.value
-            p_back = normalize(
-                np.tile(has_components_old[changed_objects, None, :], (1, n_features, 1))
-            )
-            log_q_back = np.log(p_back[sample_old.source.value[changed_objects]]).sum()
-        else:
-            raise ValueError(f"Invalid mode `{MODE}`. Choose from (gibbs, prior and uniform)")
-
-        return sample_new, log_q, log_q_back
-
-    def gibbs_sample_source(
-        self,
-        sample_new: Sample,
-        sample_old: Sample,
-        object_subset: slice | list[int] | NDArray[int] = slice(None),
-    ) -> tuple[Sample, float, float]:
-        """Resample the observations to mixture components (their source)."""
-
-        if self.sample_from_prior:
+    def source_proposal(
+        self, sample: Sample, changed_objects: list[int] | NDArray[int]
+    ) -> NDArray[float]:  # shape: (n_changed_objects, n_features, n_components)
+        """Compute the proposal distribution for the source of the changed objects."""
+        if self.SOURCE_PROPOSAL == "gibbs" and not self.sample_from_prior:
+            return self.calculate_source_posterior(sample, changed_objects)
+        elif self.SOURCE_PROPOSAL in ("gibbs", "prior"):
             # If sampling from prior, the source posterior is equal to the weights
-            p = update_weights(sample_new)[object_subset]
-            p_back = update_weights(sample_old)[object_subset]
+            return update_weights(sample)[changed_objects]
+        elif self.SOURCE_PROPOSAL == "uniform":
+            has_components = sample.cache.has_components.value
+            return normalize(
+                np.tile(has_components[changed_objects, None, :], (1, sample.n_features, 1))
+            )
         else:
-            p = self.calculate_source_posterior(sample_new, object_subset)
-            p_back = self.calculate_source_posterior(sample_old, object_subset)
-
-        # Sample the new source assignments
-        with sample_new.source.edit() as s:
-            s[object_subset] = sample_categorical(p, binary_encoding=True)
+            raise ValueError(f"Invalid source proposal `{self.SOURCE_PROPOSAL}`. Choose "
+                             f"from (gibbs, prior and uniform)")
 
-        # Calculate transition probabilities
-        log_q = np.log(p[sample_new.source.value[object_subset]]).sum()
-        log_q_back = np.log(p_back[sample_old.source.value[object_subset]]).sum()
+    def source_log_q_back(
+        self, sample: Sample, changed_objects: list[int] | NDArray[int]
+    ) -> float:
+        """The log-probability of proposing the current source of the changed objects in
+        the inverse step. Needs to be called before the sample is modified."""
+        p_back = self.source_proposal(sample, changed_objects)
+        return np.log(p_back[sample.source.value[changed_objects]]).sum()
 
-        return sample_new, log_q, log_q_back
+    def propose_new_sources(
+        self, sample: Sample, changed_objects: list[int] | NDArray[int]
+    ) -> float:
+        """Resample the source of the changed objects in the (modified) sample and return
+        the log-probability of the proposal."""
+        p = self.source_proposal(sample, changed_objects)
+        sample.source.set_items(changed_objects, sample_categorical(p, binary_encoding=True))
+        return np.log(p[sample.source.value[changed_objects]]).sum()
 
     def calculate_source_posterior(
         self, sample: Sample, object_subset: slice | list[int] | NDArray[int] = slice(None)
@@ -688,12 +670,10 @@ class AlterClusterGibbsish(_AlterCluster):
         self,
         *args,
         adjacency_matrix,
-        features: NDArray[bool],
         **kwargs,
     ):
         super().__init__(*args, **kwargs)
         self.adjacency_matrix = adjacency_matrix
-        self.features = features
 
     def compute_cluster_posterior(
         self,
@@ -706,8 +686,10 @@ class AlterClusterGibbsish(_AlterCluster):
             n_available = np.count_nonzero(available)
             return 0.5*np.ones(n_available)
 
-        cluster_lh_z = inner1d(
-            self.features[available], sample.cluster_effect.value[i_cluster]
+        cluster_lh_z = lookup_state_probs(
+            probs=sample.cluster_effect.value[[i_cluster]],
+            group_index=np.zeros(np.count_nonzero(available), dtype=int),
+            state_index=likelihood.state_index[available],
         )
         all_lh = deepcopy(likelihood.update_component_likelihoods(sample)[available, :])
         all_lh[..., 0] = cluster_lh_z
@@ -785,9 +767,6 @@ class AlterClusterGibbsish(_AlterCluster):
         if np.sum(cluster) == model.max_size:
             return sample, self.Q_REJECT, self.Q_BACK_REJECT
 
-        # Otherwise create a new sample and continue with step:
-        sample_new = sample.copy()
-
         # Assign probabilities for each unoccupied object
         cluster_posterior = self.compute_cluster_posterior(
             sample, i_cluster, likelihood, np.ones(sample.n_objects, dtype=bool)
@@ -796,23 +775,23 @@ class AlterClusterGibbsish(_AlterCluster):
 
         # Draw new object according to posterior
         object_new = np.random.choice(sample.n_objects, p=p_add, replace=False)
-        sample_new.clusters.add_object(i_cluster, object_new)
+        resample_source = self.resample_source and sample.source is not None
+        if resample_source:
+            log_q_back_s = self.source_log_q_back(sample, [object_new])
+        sample.clusters.add_object(i_cluster, object_new)
 
         # The removal probability of an inverse step
-        shrink_candidates = self.shrink_candidates(sample_new, i_cluster)
+        shrink_candidates = self.shrink_candidates(sample, i_cluster)
         p_remove = normalize((1 - cluster_posterior) * shrink_candidates)
 
         log_q = np.log(p_add[object_new])
         log_q_back = np.log(p_remove[object_new])
 
-        if self.resample_source and sample.source is not None:
-            sample_new, log_q_s, log_q_back_s = self.propose_new_sources(
-                sample, sample_new, [object_new]
-            )
-            log_q += log_q_s
+        if resample_source:
+            log_q += self.propose_new_sources(sample, [object_new])
             log_q_back += log_q_back_s
 
-        return sample_new, log_q, log_q_back
+        return sample, log_q, log_q_back
 
     def shrink_cluster(self, sample: Sample) -> tuple[Sample, float, float]:
         # Choose a cluster
@@ -828,9 +807,6 @@ class AlterClusterGibbsish(_AlterCluster):
         if np.sum(cluster) == model.min_size:
             return sample, self.Q_REJECT, self.Q_BACK_REJECT
 
-        # Otherwise create a new sample and continue with step:
-        sample_new = sample.copy()
-
         # Assign probabilities for each unoccupied object
         cluster_posterior = self.compute_cluster_posterior(
             sample, i_cluster, likelihood, np.ones(sample.n_objects, dtype=bool)
@@ -840,29 +816,28 @@ class AlterClusterGibbsish(_AlterCluster):
         # Draw new object according to posterior
         # print(p_remove)
         object_remove = np.random.choice(sample.n_objects, p=p_remove, replace=False)
-        sample_new.clusters.remove_object(i_cluster, object_remove)
+        resample_source = self.resample_source and sample.source is not None
+        if resample_source:
+            log_q_back_s = self.source_log_q_back(sample, [object_remove])
+        sample.clusters.remove_object(i_cluster, object_remove)
 
         # The add probability of an inverse step
-        grow_candidates = self.grow_candidates(sample_new)
+        grow_candidates = self.grow_candidates(sample)
         p_add = normalize(cluster_posterior * grow_candidates)
 
         log_q = np.log(p_remove[object_remove])
         log_q_back = np.log(p_add[object_remove])
 
-        if self.resample_source and sample.source is not None:
-            sample_new, log_q_s, log_q_back_s = self.propose_new_sources(
-                sample, sample_new, [object_remove]
-            )
-            log_q += log_q_s
+        if resample_source:
+            log_q += self.propose_new_sources(sample, [object_remove])
             log_q_back += log_q_back_s
 
-        return sample_new, log_q, log_q_back
+        return sample, log_q, log_q_back
 
 
 class AlterClusterGibbsish2(AlterClusterGibbsish):
 
     def _propose(self, sample: Sample, **kwargs) -> tuple[Sample, float, float]:
-        sample_new = sample.copy()
         i_cluster = np.random.choice(range(sample.n_clusters))
         cluster_old = sample.clusters.value[i_cluster]
         available = self.available(sample, i_cluster)
@@ -895,23 +870,22 @@ class AlterClusterGibbsish2(AlterClusterGibbsish):
         q_back_per_site = p * cluster_old[available] + (1 - p) * (1 - cluster_old[available])
         log_q_back = np.log(q_back_per_site).sum()
 
-        with sample_new.clusters.edit_cluster(i_cluster) as c:
-            c[available] = cluster_new
+        changed = np.flatnonzero(available)[cluster_new != cluster_old[available]]
+        resample_source = self.resample_source and sample.source is not None
+        if resample_source:
+            log_q_back += self.source_log_q_back(sample, changed)
 
-        changed = np.where(cluster_old != sample_new.clusters.value[i_cluster])[0]
+        with sample.clusters.edit_cluster(i_cluster) as c:
+            c[available] = cluster_new
 
-        if self.resample_source and sample.source is not None:
-            sample_new, log_q_s, log_q_back_s = self.propose_new_sources(
-                sample, sample_new, changed
-            )
-            log_q += log_q_s
-            log_q_back += log_q_back_s
+        if resample_source:
+            log_q += self.propose_new_sources(sample, changed)
 
         # print('\t available:', n_available)
         # print('\t changed:', np.sum(cluster_new.astype(int) - cluster_old[available]))
-        # print('\t new size:', np.sum(sample_new.clusters.value[i_cluster]))
+        # print('\t new size:', np.sum(sample.clusters.value[i_cluster]))
 
-        return sample_new, log_q, log_q_back
+        return sample, log_q, log_q_back
 
 
 class AlterCluster(_AlterCluster):
@@ -998,7 +972,6 @@ class AlterCluster(_AlterCluster):
 
     def grow_cluster(self, sample: Sample) -> tuple[Sample, float, float]:
         """Grow a clusters in the current sample (i.e. add a new site to one cluster)."""
-        sample_new = sample.copy()
         occupied = sample.clusters.any_cluster()
 
         # Randomly choose one of the clusters to modify
@@ -1027,7 +1000,10 @@ class AlterCluster(_AlterCluster):
 
         # Choose a random candidate and add it to the cluster
         object_add = np.random.choice(candidates.nonzero()[0])
-        sample_new.clusters.add_object(z_id, object_add)
+        if self.resample_source:
+            assert sample.source is not None
+            log_q_back_s = self.source_log_q_back(sample, [object_add])
+        sample.clusters.add_object(z_id, object_add)
 
         # Transition probability when growing
         q_non_connected = 1 / np.count_nonzero(~occupied)
@@ -1044,19 +1020,13 @@ class AlterCluster(_AlterCluster):
         log_q_back = np.log(q_back)
 
         if self.resample_source:
-            assert sample.source is not None
-            sample_new, log_q_s, log_q_back_s = self.propose_new_sources(
-                sample, sample_new, [object_add]
-            )
-            log_q += log_q_s
+            log_q += self.propose_new_sources(sample, [object_add])
             log_q_back += log_q_back_s
 
-        return sample_new, log_q, log_q_back
+        return sample, log_q, log_q_back
 
     def shrink_cluster(self, sample: Sample) -> tuple[Sample, float, float]:
         """Shrink a cluster in the current sample (i.e. remove one object from one cluster)."""
-        sample_new = sample.copy()
-
         # Randomly choose one of the clusters to modify
         z_id = np.random.choice(range(sample.clusters.n_clusters))
         cluster_current = sample.clusters.value[z_id, :]
@@ -1070,13 +1040,16 @@ class AlterCluster(_AlterCluster):
         # Cluster is big enough: shrink
         removal_candidates = self.get_removal_candidates(cluster_current)
         object_remove = np.random.choice(removal_candidates)
-        sample_new.clusters.remove_object(z_id, object_remove)
+        if self.resample_source:
+            assert sample.source is not None
+            log_q_back_s = self.source_log_q_back(sample, [object_remove])
+        sample.clusters.remove_object(z_id, object_remove)
 
         # Transition probability when shrinking.
         q = 1 / len(removal_candidates)
         # Back-probability (growing)
-        cluster_new = sample_new.clusters.value[z_id]
-        occupied_new = sample_new.clusters.any_cluster()
+        cluster_new = sample.clusters.value[z_id]
+        occupied_new = sample.clusters.any_cluster()
         back_neighbours = get_neighbours(cluster_new, occupied_new, self.adjacency_matrix)
 
         # The back step could always be a non-connected grow step
@@ -1092,14 +1065,10 @@ class AlterCluster(_AlterCluster):
         log_q_back = np.log(q_back)
 
         if self.resample_source:
-            assert sample.source is not None
-            sample_new, log_q_s, log_q_back_s = self.propose_new_sources(
-                sample, sample_new, [object_remove]
-            )
-            log_q += log_q_s
+            log_q += self.propose_new_sources(sample, [object_remove])
             log_q_back += log_q_back_s
 
-        return sample_new, log_q, log_q_back
+        return sample, log_q, log_q_back
 
 
 class OperatorSchedule:
@@ -386,7 +386,6 @@ class ClusterMCMC(MCMC):
                     adjacency_matrix=self.data.network.adj_mat,
                     p_grow_connected=self.p_grow_connected,
                     model_by_chain=self.posterior_per_chain,
-                    features=self.features,
                     resample_source=self.model.sample_source,
                     sample_from_prior=self.sample_from_prior,
                 ),
@@ -395,7 +394,6 @@ class ClusterMCMC(MCMC):
                     adjacency_matrix=self.data.network.adj_mat,
                     p_grow_connected=self.p_grow_connected,
                     model_by_chain=self.posterior_per_chain,
-                    features=self.features,
                     resample_source=self.model.sample_source,
                     sample_from_prior=self.sample_from_prior,
                 ),
@@ -427,6 +425,7 @@ class ClusterMCMC(MCMC):
                     model_by_chain=self.posterior_per_chain,
                     applicable_states=self.applicable_states,
                     sample_from_prior=self.sample_from_prior,
+                    all_groups=operators_config.confounding_effects_all_groups,
                 )
 
         else:
@@ -2,8 +2,8 @@ from __future__ import annotations
 from collections import OrderedDict
 from copy import copy, deepcopy
 from contextlib import contextmanager
-from functools import lru_cache
-from typing import Optional, Generic, TypeVar, Type
+from functools import partial
+from typing import Optional, Generic, TypeVar, Type, Iterator, Iterable, Any
 
 from numpy.typing import NDArray
 import numpy as np
@@ -14,29 +14,109 @@ from sbayes.load_data import Confounder
 S = TypeVar('S')
 Value = TypeVar('Value', NDArray, float)
 DType = TypeVar('DType', bool, float, int)
-VersionType = TypeVar('VersionType', tuple, int)
+
+
+class UndoLog:
+
+    """Record of the changes made to a sample during a transaction (see
+    `Sample.begin_transaction`). Parameters and calculation nodes record their state
+    before they are modified: either the previous values of their attributes or the
+    items of an array that are about to be overwritten in place. A rollback restores
+    the records in reverse order."""
+
+    def __init__(self):
+        self.entries = []
+        self.recorded_once = set()
+
+    def record_attributes(self, obj: Any, *names: str):
+        """Record the current value of the attributes `names` of `obj`."""
+        attributes = {name: getattr(obj, name) for name in names}
+        self.entries.append(partial(restore_attributes, obj, attributes))
+
+    def record_items(self, container: NDArray | list, index):
+        """Record the items of an array (or list) at `index`, before they are overwritten."""
+        items = copy(container[index])
+        self.entries.append(partial(restore_items, container, index, items))
+
+    def record_attributes_once(self, obj: Any, *names: str) -> bool:
+        """Record the attributes `names` of `obj`, unless they were already recorded in
+        this transaction. Returns whether they were recorded."""
+        if id(obj) in self.recorded_once:
+            return False
+        self.recorded_once.add(id(obj))
+        self.record_attributes(obj, *names)
+        return True
+
+    def rollback(self):
+        for restore in reversed(self.entries):
+            restore()
+        self.entries = []
+        self.recorded_once = set()
+
+
+def restore_attributes(obj: Any, attributes: dict[str, Any]):
+    for name, value in attributes.items():
+        setattr(obj, name, value)
+
+
+def restore_items(container: NDArray | list, index, items: NDArray | list):
+    if isinstance(container, np.ndarray) and not container.flags.writeable:
+        container.flags.writeable = True
+        container[index] = items
+        container.flags.writeable = False
+    else:
+        container[index] = items
 
 
 class Parameter(Generic[Value]):
 
     _value: Value
     version: PositiveInt
+    dependents: list[tuple[CalculationNode, str]]
+    """The calculation nodes using this parameter as an input (and the input keys)."""
+
+    undo_log: Optional[UndoLog] = None
+    """The undo log of the open transaction of the sample (None outside transactions)."""
+
+    UNDO_ATTRIBUTES = ('_value', 'version')
+    """Attributes that are recorded before the parameter is modified in a transaction."""
 
     def __init__(self, value: Value):
         self._value = value
         self.version = 0
+        self.dependents = []
 
     @property
     def value(self) -> Value:
         return self._value
 
     def set_value(self, new_value: Value):
+        self.record_state()
         self._value = new_value
         self.version += 1
+        self.notify_dependents()
+
+    def notify_dependents(self, groups: Optional[Iterable[int]] = None):
+        """Mark all dependent calculation nodes as outdated (only the given `groups` of a
+        GroupedParameters input, or all groups if None)."""
+        for node, key in self.dependents:
+            node.mark_changed(key, groups)
+
+    def record_state(self):
+        """Record the state of the parameter in the undo log of an open transaction."""
+        if self.undo_log is not None:
+            self.undo_log.record_attributes(self, *self.UNDO_ATTRIBUTES)
+
+    def record_items(self, array: NDArray, index):
+        """Record the items of `array` at `index` in the undo log of an open transaction."""
+        if self.undo_log is not None:
+            self.undo_log.record_items(array, index)
 
 
 class ArrayParameter(Parameter[NDArray[DType]]):
 
+    UNDO_ATTRIBUTES = ('_value', 'version', 'shared')
+
     def __init__(self, value: NDArray[DType], shared=False):
         super().__init__(value)
         self._value.flags.writeable = False
@@ -52,16 +132,27 @@ class ArrayParameter(Parameter[NDArray[DType]]):
         self.shared = False
 
     def set_items(self, keys, values):
+        self.record_state()
         if self.shared:
             self.resolve_sharing()
+        self.record_items(self._value, keys)
 
         self._value.flags.writeable = True
         self._value[keys] = values
         self._value.flags.writeable = False
         self.version += 1
+        self.notify_dependents(self.changed_groups(keys))
+
+    def changed_groups(self, keys) -> Optional[Iterable[int]]:
+        """The groups changed by `set_items(keys, ...)` (None for all groups)."""
+        return None
 
     @contextmanager
     def edit(self) -> NDArray[DType]:
+        self.record_state()
+        if self.undo_log is not None:
+            # The edited items are unknown: keep the recorded array and edit a copy
+            self.shared = True
         if self.shared:
             self.resolve_sharing()
 
@@ -69,34 +160,40 @@ class ArrayParameter(Parameter[NDArray[DType]]):
         yield self.value
         self._value.flags.writeable = False
         self.version += 1
+        self.notify_dependents()
 
     def copy(self: S) -> S:
         self.shared = True
-        return copy(self)
+        new_param = copy(self)
+        # The copy is used by the calculation nodes of a different sample
+        new_param.dependents = []
+        return new_param
 
     def resolve_sharing(self):
         self._value = self._value.copy()
         self.shared = False
 
+    def __setstate__(self, state: dict):
+        # Arrays restored from a pickle (e.g. when sent to a worker process) can be
+        # backed by read-only memory. Treat them as shared to copy them before editing.
+        self.__dict__.update(state)
+        self.shared = True
 
-class GroupedParameters(ArrayParameter):
-
-    group_versions: NDArray[int]
-
-    def __init__(self, value: NDArray[Value]):
-        super().__init__(value=value)
-        self.group_versions = np.zeros(self.n_groups)
 
-    def set_items(self, keys, values):
-        super().set_items(keys, values)
+class GroupedParameters(ArrayParameter):
 
-        # Update version of the changed group
-        if isinstance(keys, int):
-            self.group_versions[keys] = self.version
-        elif isinstance(keys, tuple):
-            self.group_versions[keys[0]] = self.version
+    def changed_groups(self, keys) -> Iterable[int]:
+        if isinstance(keys, tuple):
+            keys = keys[0]
+        if isinstance(keys, (int, np.integer)):
+            return keys,
+        elif isinstance(keys, slice):
+            return range(self.n_groups)[keys]
+        elif isinstance(keys, (list, np.ndarray)):
+            keys = np.asarray(keys)
+            return np.flatnonzero(keys) if keys.dtype == bool else keys
         else:
-            raise RuntimeError('`set_items` is not implemented for GroupedParameters. '
+            raise RuntimeError(f'`set_items` is not implemented for keys of type {type(keys)}. '
                                'Use `GroupedParameters.edit()` instead.')
 
     def set_group(self, i: int, values: NDArray[Value]):
@@ -109,24 +206,54 @@ class GroupedParameters(ArrayParameter):
 
     @contextmanager
     def edit_group(self, i) -> NDArray:
+        self.record_state()
         if self.shared:
             self.resolve_sharing()
+        self.record_items(self._value, i)
 
         self._value.flags.writeable = True
         yield self.value[i]
         self._value.flags.writeable = False
         self.version += 1
-        self.group_versions[i] = self.version
-
-    def resolve_sharing(self):
-        self.group_versions = self.group_versions.copy()
-        super().resolve_sharing()
+        self.notify_dependents((i,))
 
 
 class Clusters(GroupedParameters):
 
+    occupancy: NDArray[int]  # shape: (n_objects,)
+    """The number of clusters each object is assigned to (updated with every change)."""
+
+    UNDO_ATTRIBUTES = GroupedParameters.UNDO_ATTRIBUTES + ('occupancy',)
+
+    def __init__(self, value: NDArray[bool]):
+        super().__init__(value=value)
+        self.occupancy = np.count_nonzero(self._value, axis=0)
+
+    def set_value(self, new_value: NDArray[bool]):
+        super().set_value(new_value)
+        self.occupancy = np.count_nonzero(self._value, axis=0)
+
+    def set_items(self, keys, values):
+        super().set_items(keys, values)
+        self.occupancy = np.count_nonzero(self._value, axis=0)
+
+    @contextmanager
+    def edit(self) -> NDArray[bool]:
+        with super().edit() as value:
+            yield value
+        self.occupancy = np.count_nonzero(self._value, axis=0)
+
+    @contextmanager
+    def edit_group(self, i: int) -> NDArray[bool]:
+        with super().edit_group(i) as cluster:
+            cluster_old = cluster.copy()
+            yield cluster
+        changed = np.flatnonzero(cluster != cluster_old)
+        self.record_items(self.occupancy, changed)
+        self.occupancy[changed] += np.where(cluster[changed], 1, -1)
+
     # alias for edit_group
-    edit_cluster = GroupedParameters.edit_group
+    edit_cluster = edit_group
 
     @property
     def n_clusters(self):
@@ -137,32 +264,67 @@ class Clusters(GroupedParameters):
         return self.shape[1]
 
     def any_cluster(self):
-        return np.any(self._value, axis=0)
+        return self.occupancy > 0
 
     def add_object(self, i_cluster, i_object):
-        with self.edit_cluster(i_cluster) as c:
-            c[i_object] = True
+        self.set_membership(i_cluster, i_object, True)
 
     def remove_object(self, i_cluster, i_object):
-        with self.edit_cluster(i_cluster) as c:
-            c[i_object] = False
+        self.set_membership(i_cluster, i_object, False)
 
+    def set_membership(self, i_cluster: int, i_object: int, is_member: bool):
+        """Add or remove a single object, updating its occupancy count in O(1)."""
+        with super().edit_group(i_cluster) as c:
+            was_member = c[i_object]
+            c[i_object] = is_member
+        if was_member != is_member:
+            self.record_items(self.occupancy, i_object)
+            self.occupancy[i_object] += 1 if is_member else -1
 
-@lru_cache(maxsize=128)
-def outdated_group_version(shape: tuple[int]) -> NDArray[int]:
-    """To manually mark the calculation node as outdated we use a constant -1."""
-    return -np.ones(shape)
+    def resolve_sharing(self):
+        self.occupancy = self.occupancy.copy()
+        super().resolve_sharing()
 
 
 class CalculationNode(Generic[Value]):
 
     """Wrapper for cached calculated values (array or scalar). Keeps track of whether a
-     calculation node and its derived values are outdated."""
+    calculation node and its derived values are outdated.
+
+    Changes are pushed through the dependency graph: when a parameter changes, it marks
+    all dependent nodes (and recursively their dependents) as outdated and reports
+    which of its groups changed. Checking whether a node is outdated, or which groups of
+    an input changed since the last update, therefore does not require any computation.
+    """
 
     _value: Value
-    cached_version: VersionType
     inputs: OrderedDict[str, CalculationNode | Parameter]
-    cached_group_versions: dict[str, NDArray[int]]
+    dependents: list[tuple[CalculationNode, str]]
+
+    outdated: bool
+    """Whether any input changed since the last update."""
+
+    cleared: bool
+    """Whether the value has to be recomputed from scratch (e.g. after `clear()`)."""
+
+    changed_inputs: set[str]
+    """The keys of the inputs that changed since the last update."""
+
+    changed_groups: dict[str, Optional[set[int]]]
+    """The changed groups of each changed input since the last update (None: all groups)."""
+
+    shared: bool
+    """Whether the value is shared with a copy of the node (see `assign_from`) and has to
+    be copied before it is edited in place."""
+
+    undo_log: Optional[UndoLog] = None
+    """The undo log of the open transaction of the sample (None outside transactions)."""
+
+    UNDO_ATTRIBUTES = ('_value', 'shared')
+    """Attributes that are recorded before the node is modified in a transaction."""
+
+    CHANGE_ATTRIBUTES = ('outdated', 'cleared', 'changed_inputs', 'changed_groups')
+    """Attributes tracking the changes of the inputs (recorded once per transaction)."""
 
     def __init__(
         self,
@@ -170,75 +332,112 @@ class CalculationNode(Generic[Value]):
     ):
         self._value = value
         self.inputs = OrderedDict()
-        self.input_idx = OrderedDict()
-        self.cached_version = self.outdated_version()
-        self.cached_group_versions = {}
+        self.dependents = []
+        self.outdated = True
+        self.cleared = True
+        self.changed_inputs = set()
+        self.changed_groups = {}
+        self.shared = False
 
     def is_outdated(self) -> bool:
-        return self.cached_version != self.version
+        return self.outdated
 
     def ahead_of(self, input_key: str) -> bool:
-        i = self.input_idx[input_key]
-        return self.cached_version[i] != self.inputs[input_key].version
+        return self.cleared or input_key in self.changed_inputs
 
-    def what_changed(self, input_key: str | list[str], caching=True) -> set[bool]:
+    def what_changed(self, input_key: str | list[str], caching=True) -> set[int]:
+        """The groups of the input(s) `input_key` which changed since the last update. The
+        returned set must not be modified."""
         if isinstance(input_key, list):
             return set.union(*(self.what_changed(k, caching=caching) for k in input_key))
 
         inpt = self.inputs[input_key]
-        if isinstance(inpt, GroupedParameters):
-            if caching:
-                return set(np.nonzero(
-                    self.cached_group_versions[input_key] != inpt.group_versions
-                )[0])
-            else:
-                return set(range(inpt.n_groups))
-        else:
+        if not isinstance(inpt, GroupedParameters):
             raise ValueError('Can only track what changed for GroupedParameters')
 
+        if not caching or self.cleared:
+            return set(range(inpt.n_groups))
+        if input_key not in self.changed_inputs:
+            return set()
+        changed = self.changed_groups[input_key]
+        if changed is None:
+            return set(range(inpt.n_groups))
+        return changed
+
+    def mark_changed(self, input_key: str, groups: Optional[Iterable[int]] = None):
+        """Mark the node and its dependents as outdated after the input `input_key`
+        changed (only the given `groups` or all groups if None)."""
+        self.record_changes()
+        self.outdated = True
+        if input_key not in self.changed_inputs:
+            self.changed_inputs.add(input_key)
+            self.changed_groups[input_key] = None if groups is None else set(groups)
+        elif groups is None:
+            self.changed_groups[input_key] = None
+        elif self.changed_groups[input_key] is not None:
+            self.changed_groups[input_key].update(groups)
+
+        for node, key in self.dependents:
+            node.mark_changed(key)
+
     @property
     def value(self) -> Value:
         return self._value
 
     def update_value(self, new_value: Value):
+        self.record_state(rows=None)
         self._value = new_value
+        self.shared = False
         self.set_up_to_date()
 
     def set_up_to_date(self):
-        self.cached_version = self.version
-        for key, inpt in self.inputs.items():
-            if isinstance(inpt, GroupedParameters):
-                self.cached_group_versions[key] = inpt.group_versions.copy()
-                self.cached_group_versions[key].flags.writeable = False
+        self.record_changes()
+        self.outdated = False
+        self.cleared = False
+        # Replace (do not clear) the change records, since callers may still hold them
+        self.changed_inputs = set()
+        self.changed_groups = {}
 
     @contextmanager
-    def edit(self) -> NDArray:
+    def edit(self, rows: slice | NDArray[int] = slice(None)) -> NDArray:
+        """Edit the value in place. In a transaction, only the given `rows` of the
+        value are recorded, so callers that know which rows they will change can avoid
+        recording the whole array."""
+        if self.shared:
+            self.resolve_sharing()
+        self.record_state(rows=rows)
         # self._value.flags.writeable = True
         yield self.value
         # self._value.flags.writeable = False
         self.set_up_to_date()
 
-    def outdated_version(self) -> VersionType:
-        """To manually mark the calculation node as outdated we use a constant -1."""
-        return -1
+    def record_state(self, rows: slice | NDArray[int] | None = slice(None)):
+        """Record the state of the node in the undo log of an open transaction, before it
+        is modified. `rows` are the rows of the value that will be changed in place (None
+        if the value is replaced as a whole)."""
+        if self.undo_log is None:
+            return
+        self.undo_log.record_attributes(self, *self.UNDO_ATTRIBUTES)
+        self.record_changes()
+        if rows is not None:
+            self.undo_log.record_items(self._value, rows)
+
+    def record_changes(self):
+        """Record the change tracking attributes in the undo log of an open transaction.
+        They are edited in place, so the recorded state is kept intact by working on a
+        copy for the rest of the transaction."""
+        if self.undo_log is None:
+            return
+        if self.undo_log.record_attributes_once(self, *self.CHANGE_ATTRIBUTES):
+            self.changed_inputs = set(self.changed_inputs)
+            self.changed_groups = {k: None if g is None else set(g)
+                                   for k, g in self.changed_groups.items()}
 
     def add_input(self, key: str, inpt: CalculationNode | Parameter):
         """Add an input to this calculation node."""
-        self.input_idx[key] = len(self.inputs)
         self.inputs[key] = inpt
-        self.cached_version = self.outdated_version()
-        if isinstance(inpt, GroupedParameters):
-            self.clear_group_version(key)
-
-    def cached_version_by_input(self, input_key: str) -> tuple:
-        """Get the cached version number for a specific input."""
-        return self.cached_version[self.input_idx[input_key]]
-
-    @property
-    def version(self) -> VersionType:
-        """Calculate the current version number from the inputs."""
-        return tuple(inpt.version for inpt in self.inputs.values())
-        # return hash(tuple(i.version for i in self.inputs))
+        inpt.dependents.append((self, key))
+        self.clear()
 
     @property
     def shape(self) -> tuple[int]:
@@ -247,22 +446,24 @@ class CalculationNode(Generic[Value]):
 
     def clear(self):
         """Mark the calculation node as outdated."""
-        self.cached_version = self.outdated_version()
-        for key in self.cached_group_versions:
-            self.clear_group_version(key)
+        self.record_state(rows=None)
+        self.outdated = True
+        self.cleared = True
 
-    def clear_group_version(self, key: str):
-        """Mark the group versions of a specific input as outdated."""
-        shape = self.inputs[key].group_versions.shape
-        new_group_version = outdated_group_version(shape)
-        self.cached_group_versions[key] = new_group_version
-        new_group_version.flags.writeable = False
+    def resolve_sharing(self):
+        self._value = copy(self._value)
+        self.shared = False
 
     def assign_from(self, other: CalculationNode):
-        """Assign the calculation node's value and version nr from another calc node."""
-        self._value = copy(other._value)
-        self.cached_version = other.cached_version
-        self.cached_group_versions = {k: v for k, v in other.cached_group_versions.items()}
+        """Assign the calculation node's value and change records from another calc node.
+        The value is shared between both nodes until one of them edits it (copy-on-write)."""
+        self._value = other._value
+        self.shared = other.shared = True
+        self.outdated = other.outdated
+        self.cleared = other.cleared
+        self.changed_inputs = set(other.changed_inputs)
+        self.changed_groups = {k: None if g is None else set(g)
+                               for k, g in other.changed_groups.items()}
 
 
 class HasComponents(CalculationNode[NDArray[bool]]):
@@ -279,27 +480,183 @@ class HasComponents(CalculationNode[NDArray[bool]]):
         super().__init__(value=np.array(has_components).T)
 
         self.clusters = clusters
-        self.inputs['clusters'] = clusters
+        self.add_input('clusters', clusters)
 
     @property
     def value(self) -> Value:
         if not self.is_outdated():
             return self._value
         else:
-            self._value[:, 0] = self.inputs['clusters'].any_cluster()
-            self.cached_version = self.version
+            # Only update the objects that joined or left all clusters
+            in_cluster = self.inputs['clusters'].any_cluster()
+            changed = np.flatnonzero(in_cluster != self._value[:, 0])
+            if self.shared:
+                self.resolve_sharing()
+            self.record_state(rows=(changed, 0))
+            self._value[changed, 0] = in_cluster[changed]
+            self.set_up_to_date()
             return self._value
 
 
+class NormalizedWeights(CalculationNode[NDArray[float]]):
+
+    """Array calculation node with shape (n_objects, n_features, n_components), holding
+    the weights of each object, re-normalized to the components it belongs to.
+
+    The node keeps the `has_components` array it was normalized for, so that a change of
+    the clusters only re-normalizes the weights of objects that joined or left all
+    clusters.
+    """
+
+    has_components: Optional[NDArray[bool]]  # shape: (n_objects, n_components)
+
+    UNDO_ATTRIBUTES = CalculationNode.UNDO_ATTRIBUTES + ('has_components',)
+
+    def __init__(self, value: NDArray[float]):
+        super().__init__(value=value)
+        self.has_components = None
+
+    def assign_from(self, other: NormalizedWeights):
+        super().assign_from(other)
+        # `has_components` is replaced (never edited) on updates and can be shared
+        self.has_components = other.has_components
+
+
+class ObjectsNode(CalculationNode[NDArray[float]]):
+
+    """Array calculation node with one row per object (shape: (n_objects, ...)), which
+    is updated only for the objects affected by a change.
+
+    The node remembers the cluster of each object at the last update (`cluster_index`),
+    so that the objects that left a changed cluster can be found without scanning all
+    objects.
+    """
+
+    cluster_index: Optional[NDArray[int]]  # shape: (n_objects,)
+
+    UNDO_ATTRIBUTES = CalculationNode.UNDO_ATTRIBUTES + ('cluster_index',)
+
+    def __init__(self, value: NDArray[float]):
+        super().__init__(value=value)
+        self.cluster_index = None
+
+    def assign_from(self, other: ObjectsNode):
+        super().assign_from(other)
+        # The cluster index is replaced (never edited) on updates and can be shared
+        self.cluster_index = other.cluster_index
+
+
+class ObservationLikelihoods(ObjectsNode):
+
+    """Array calculation node with shape (n_objects, n_features), holding the likelihood
+    of each observation.
+
+    To update the total log-likelihood incrementally, the node also keeps the
+    log-likelihood of each object (summed over all features) and a running total. The
+    total is re-summed exactly every `RESUM_INTERVAL` incremental updates to bound the
+    accumulated floating-point error.
+    """
+
+    object_log_lhs: NDArray[float]  # shape: (n_objects,)
+    log_lh: float
+    n_incremental_updates: int
+
+    RESUM_INTERVAL = 1000
+
+    UNDO_ATTRIBUTES = ObjectsNode.UNDO_ATTRIBUTES + ('log_lh', 'n_incremental_updates')
+
+    def __init__(self, value: NDArray[float]):
+        super().__init__(value=value)
+        self.object_log_lhs = np.zeros(value.shape[0])
+        self.log_lh = 0.0
+        self.n_incremental_updates = 0
+
+    def record_state(self, rows: slice | NDArray[int] | None = slice(None)):
+        super().record_state(rows=rows)
+        if self.undo_log is not None and rows is not None:
+            self.undo_log.record_items(self.object_log_lhs, rows)
+
+    def update_log_lh(self, rows: slice | NDArray[int]):
+        """Update the log-likelihood of the objects in `rows` (from the current value)
+        and the running total."""
+        object_log_lhs = np.sum(np.log(self._value[rows]), axis=-1)
+        if isinstance(rows, slice) or self.n_incremental_updates >= self.RESUM_INTERVAL:
+            incremental = False
+        else:
+            # Differences of infinite log-likelihoods are undefined (nan)
+            with np.errstate(invalid="ignore"):
+                self.log_lh += np.sum(object_log_lhs) - np.sum(self.object_log_lhs[rows])
+            incremental = np.isfinite(self.log_lh)
+
+        self.object_log_lhs[rows] = object_log_lhs
+        if incremental:
+            self.n_incremental_updates += 1
+        else:
+            self.log_lh = np.sum(self.object_log_lhs)
+            self.n_incremental_updates = 0
+
+    def assign_from(self, other: ObservationLikelihoods):
+        super().assign_from(other)
+        self.object_log_lhs = other.object_log_lhs.copy()
+        self.log_lh = other.log_lh
+        self.n_incremental_updates = other.n_incremental_updates
+
+
+class StateCounts(CalculationNode[NDArray[int]]):
+
+    """Array calculation node with shape (n_groups, n_features, n_states), counting how
+    often each state is observed in the objects of a group (a cluster or a confounder
+    group) and attributed to the corresponding mixture component by the `source`.
+
+    To update the counts incrementally, the node keeps a snapshot of the observations it
+    counted: the group of each object and whether each observation was attributed to
+    the component. The snapshot is shared between copies of a sample and only copied
+    before it is edited.
+    """
+
+    counted_groups: Optional[NDArray[int]]   # shape: (n_objects,)
+    counted_source: Optional[NDArray[bool]]  # shape: (n_objects, n_features)
+
+    UNDO_ATTRIBUTES = CalculationNode.UNDO_ATTRIBUTES + (
+        'counted_groups', 'counted_source', 'shared_snapshot'
+    )
+
+    def __init__(self, value: NDArray[int]):
+        super().__init__(value=value)
+        self.counted_groups = None
+        self.counted_source = None
+        self.shared_snapshot = False
+
+    @contextmanager
+    def edit_snapshot(self) -> tuple[NDArray[int], NDArray[bool]]:
+        self.record_state(rows=None)
+        if self.undo_log is not None:
+            # Keep the recorded snapshot intact and edit a copy
+            self.shared_snapshot = True
+        if self.shared_snapshot:
+            self.counted_groups = self.counted_groups.copy()
+            self.counted_source = self.counted_source.copy()
+            self.shared_snapshot = False
+        yield self.counted_groups, self.counted_source
+
+    def assign_from(self, other: StateCounts):
+        super().assign_from(other)
+        self.counted_groups = other.counted_groups
+        self.counted_source = other.counted_source
+        self.shared_snapshot = other.shared_snapshot = True
+
+
 class ModelCache:
 
     likelihood: CalculationNode[float]
-    component_likelihoods: CalculationNode[NDArray[float]]
-    weights_normalized: CalculationNode[NDArray[float]]
+    component_likelihoods: ObjectsNode
+    weights_normalized: NormalizedWeights
+    observation_lhs: ObservationLikelihoods
 
     prior: CalculationNode[float]
     source_prior: CalculationNode[float]
-    geo_prior: CalculationNode[float]
+    geo_prior: CalculationNode[NDArray[float]]
+    geo_prior_trees: CalculationNode[list]
     cluster_size_prior: CalculationNode[float]
     cluster_effect_prior: CalculationNode[float]
     confounding_effects_prior: dict[str, CalculationNode[float]]
@@ -307,14 +664,22 @@ class ModelCache:
 
     has_components: CalculationNode[bool]
 
+    cluster_state_counts: StateCounts
+    confounder_state_counts: dict[str, StateCounts]
+
     def __init__(self, sample: Sample, ):
-        self.component_likelihoods = CalculationNode(
+        self.component_likelihoods = ObjectsNode(
             value=np.empty((sample.n_objects, sample.n_features, sample.n_components))
         )
-        self.weights_normalized = CalculationNode(
+        self.weights_normalized = NormalizedWeights(
             value=np.empty((sample.n_objects, sample.n_features, sample.n_components))
         )
-        self.geo_prior = CalculationNode(value=0.0)
+        self.observation_lhs = ObservationLikelihoods(
+            value=np.empty((sample.n_objects, sample.n_features))
+        )
+        self.geo_prior = CalculationNode(value=np.zeros(sample.n_clusters))
+        # Minimum spanning trees (immutable objects) of each cluster used in the geo-prior
+        self.geo_prior_trees = CalculationNode(value=[None] * sample.n_clusters)
         self.cluster_size_prior = CalculationNode(value=0.0)
         self.cluster_effect_prior = CalculationNode(value=0.0)
         self.confounding_effects_prior = {
@@ -328,6 +693,8 @@ class ModelCache:
 
         self.component_likelihoods.add_input('clusters', sample.clusters)
         self.cluster_size_prior.add_input('clusters', sample.clusters)
+        self.geo_prior.add_input('clusters', sample.clusters)
+        self.geo_prior_trees.add_input('clusters', sample.clusters)
         self.weights_normalized.add_input('has_components', self.has_components)
 
         self.component_likelihoods.add_input('cluster_effect', sample.cluster_effect)
@@ -340,11 +707,34 @@ class ModelCache:
         self.weights_prior.add_input('weights', sample.weights)
         self.weights_normalized.add_input('weights', sample.weights)
 
+        # The observation likelihoods depend on the same parameters as the component
+        # likelihoods and the normalized weights (or the source)
+        for key, inpt in self.component_likelihoods.inputs.items():
+            self.observation_lhs.add_input(key, inpt)
+        self.observation_lhs.add_input('weights', sample.weights)
+
         # Differences between Gibbs/Non-Gibbs models:
         if sample.source is not None:
             self.source_prior = CalculationNode(value=0.0)
             self.source_prior.add_input('weights_normalized', self.weights_normalized)
             self.source_prior.add_input('source', sample.source)
+            self.observation_lhs.add_input('source', sample.source)
+
+            # Sufficient statistics for the Gibbs updates of cluster and confounding effects
+            self.cluster_state_counts = StateCounts(
+                value=np.zeros((sample.n_clusters, sample.n_features, sample.n_states), dtype=int)
+            )
+            self.cluster_state_counts.add_input('clusters', sample.clusters)
+            self.cluster_state_counts.add_input('source', sample.source)
+            self.confounder_state_counts = {}
+            for conf in sample.confounders:
+                self.confounder_state_counts[conf] = StateCounts(
+                    value=np.zeros((sample.n_groups(conf), sample.n_features, sample.n_states), dtype=int)
+                )
+                self.confounder_state_counts[conf].add_input('source', sample.source)
+        else:
+            self.cluster_state_counts = None
+            self.confounder_state_counts = {}
 
     @property
     def cluster_likelihoods(self) -> NDArray[float]:
@@ -357,24 +747,53 @@ class ModelCache:
     def clear(self):
         self.component_likelihoods.clear()
         self.weights_normalized.clear()
+        self.observation_lhs.clear()
         self.geo_prior.clear()
+        self.geo_prior_trees.clear()
         self.cluster_size_prior.clear()
         self.cluster_effect_prior.clear()
         self.weights_prior.clear()
         self.has_components.clear()
         for conf_eff in self.confounding_effects_prior.values():
             conf_eff.clear()
+        if self.cluster_state_counts is not None:
+            self.cluster_state_counts.clear()
+        for counts in self.confounder_state_counts.values():
+            counts.clear()
+
+    def nodes(self) -> Iterator[CalculationNode]:
+        """Iterate over all calculation nodes in the cache."""
+        yield self.component_likelihoods
+        yield self.weights_normalized
+        yield self.observation_lhs
+        yield self.geo_prior
+        yield self.geo_prior_trees
+        yield self.cluster_size_prior
+        yield self.cluster_effect_prior
+        yield self.weights_prior
+        yield self.has_components
+        yield from self.confounding_effects_prior.values()
+        if self.cluster_state_counts is not None:
+            yield self.source_prior
+            yield self.cluster_state_counts
+        yield from self.confounder_state_counts.values()
 
     def copy(self: S, new_sample: Sample) -> S:
         new_cache = ModelCache(new_sample)
         new_cache.component_likelihoods.assign_from(self.component_likelihoods)
         new_cache.weights_normalized.assign_from(self.weights_normalized)
+        new_cache.observation_lhs.assign_from(self.observation_lhs)
         new_cache.geo_prior.assign_from(self.geo_prior)
+        new_cache.geo_prior_trees.assign_from(self.geo_prior_trees)
         new_cache.cluster_size_prior.assign_from(self.cluster_size_prior)
         new_cache.cluster_effect_prior.assign_from(self.cluster_effect_prior)
         new_cache.weights_prior.assign_from(self.weights_prior)
         for conf, conf_eff_prior in new_cache.confounding_effects_prior.items():
             conf_eff_prior.assign_from(self.confounding_effects_prior[conf])
+        if new_sample.source is not None:
+            new_cache.cluster_state_counts.assign_from(self.cluster_state_counts)
+            for conf, counts in new_cache.confounder_state_counts.items():
+                counts.assign_from(self.confounder_state_counts[conf])
 
         # new_cache.has_components
         return new_cache
@@ -382,6 +801,9 @@ class ModelCache:
 
 class Sample:
 
+    undo_log: Optional[UndoLog] = None
+    """The undo log of the open transaction (None outside transactions)."""
+
     def __init__(
         self,
         clusters: Clusters,                                 # shape: (n_clusters, n_objects)
@@ -389,7 +811,7 @@ class Sample:
         cluster_effect: GroupedParameters[float],           # shape: (n_clusters, n_features, n_states)
         confounding_effects: dict[str, GroupedParameters],  # shape per conf:  (n_groups, n_features, n_states)
         confounders: dict[str, Confounder],
-        source: Optional[ArrayParameter[bool]] = None,      # shape: (n_objects, n_features, n_components)
+        source: Optional[GroupedParameters[bool]] = None,   # shape: (n_objects, n_features, n_components)
         chain: int = 0,
         _other_cache: ModelCache = None,
         _i_step: int = 0
@@ -433,12 +855,13 @@ class Sample:
             cluster_effect=GroupedParameters(cluster_effect),
             confounding_effects={k: GroupedParameters(v) for k, v in confounding_effects.items()},
             confounders=confounders,
-            source=None if source is None else ArrayParameter(source),
+            source=None if source is None else GroupedParameters(source),
             chain=chain,
         )
 
     def copy(self: S) -> S:
-        return Sample(
+        assert self.undo_log is None, 'A sample can not be copied during a transaction.'
+        new_sample = Sample(
             chain=self.chain,
             #
             # clusters=deepcopy(self._clusters),
@@ -457,10 +880,54 @@ class Sample:
             _other_cache=self.cache,
             _i_step=self.i_step,
         )
+        new_sample.last_lh = self.last_lh
+        new_sample.last_prior = self.last_prior
+        if self.observation_lhs is not None:
+            # The cached observation likelihoods are edited in place
+            new_sample.observation_lhs = self.observation_lhs.copy()
+        return new_sample
 
     def everything_changed(self):
         self.cache.clear()
 
+    """ transactions """
+
+    def begin_transaction(self):
+        """Start recording all changes of the parameters and the cache, so that they can
+        be undone by `rollback()` or kept by `commit()`. This allows to propose a new
+        sample by modifying the current one in place, instead of working on a copy."""
+        assert self.undo_log is None, 'The sample is already in a transaction.'
+        self.undo_log = UndoLog()
+        self.undo_log.record_attributes(self, 'last_lh', 'last_prior', 'observation_lhs')
+        for obj in self.tracked_objects():
+            obj.undo_log = self.undo_log
+
+    def commit(self):
+        """Keep all changes since `begin_transaction()`."""
+        self.end_transaction()
+
+    def rollback(self):
+        """Undo all changes since `begin_transaction()`."""
+        assert self.undo_log is not None, 'The sample is not in a transaction.'
+        self.undo_log.rollback()
+        self.end_transaction()
+
+    def end_transaction(self):
+        for obj in self.tracked_objects():
+            obj.undo_log = None
+        self.undo_log = None
+
+    def tracked_objects(self) -> Iterator[Parameter | CalculationNode]:
+        """Iterate over all parameters and calculation nodes that record their changes
+        in a transaction."""
+        yield self._clusters
+        yield self._weights
+        yield self._cluster_effect
+        yield from self._confounding_effects.values()
+        if self._source is not None:
+            yield self._source
+        yield from self.cache.nodes()
+
     """ properties to make parameters read-only """
 
     @property
@@ -480,7 +947,7 @@ class Sample:
         return self._confounding_effects
 
     @property
-    def source(self) -> ArrayParameter:
+    def source(self) -> GroupedParameters:
         return self._source
 
     """ shape properties """
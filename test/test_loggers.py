@@ -0,0 +1,103 @@
+import os
+import tempfile
+import numpy as np
+import tables
+import unittest
+
+from sbayes.sampling.loggers import AsyncSampleWriter, LikelihoodLogger
+from sbayes.sampling.state import Sample
+
+
+class RecordingLogger:
+
+    """Minimal stand-in for a ResultsLogger that remembers the logged clusters."""
+
+    def __init__(self, fail_at: int = None):
+        self.file = None
+        self.fail_at = fail_at
+        self.logged_steps = []
+        self.logged_clusters = []
+
+    def write_sample(self, sample: Sample):
+        if sample.i_step == self.fail_at:
+            raise ValueError("Failed to write sample.")
+        self.file = "open"
+        self.logged_steps.append(sample.i_step)
+        self.logged_clusters.append(sample.clusters.value.copy())
+
+    def close(self):
+        self.file = None
+
+
+def create_sample() -> Sample:
+    return Sample.from_numpy_arrays(
+        clusters=np.zeros((2, 10), dtype=bool),
+        weights=np.full((3, 2), 0.5),
+        cluster_effect=np.full((2, 3, 2), 0.5),
+        confounding_effects={},
+        confounders={},
+    )
+
+
+class TestAsyncSampleWriter(unittest.TestCase):
+
+    def test_snapshots_in_order(self):
+        logger = RecordingLogger()
+        writer = AsyncSampleWriter([logger], max_queue_size=2)
+
+        sample = create_sample()
+        for i_step in range(20):
+            sample.i_step = i_step
+            # Changes of the sample after it is enqueued must not affect the logged snapshot
+            sample.clusters.set_items((0, i_step % 10), True)
+            writer.write_sample(sample)
+            sample.clusters.set_items((0, i_step % 10), False)
+        writer.close()
+
+        self.assertEqual(logger.logged_steps, list(range(20)))
+        for i_step, clusters in enumerate(logger.logged_clusters):
+            self.assertEqual(np.count_nonzero(clusters), 1)
+            self.assertTrue(clusters[0, i_step % 10])
+        self.assertIsNone(logger.file)
+
+    def test_error_is_raised(self):
+        writer = AsyncSampleWriter([RecordingLogger(fail_at=3)])
+        sample = create_sample()
+        with self.assertRaises(RuntimeError):
+            for i_step in range(10):
+                sample.i_step = i_step
+                writer.write_sample(sample)
+            writer.close()
+
+
+class DummyModel:
+
+    def __copy__(self):
+        return self
+
+
+class TestLikelihoodLogger(unittest.TestCase):
+
+    def test_thinning_and_buffering(self):
+        sample = create_sample()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "likelihood.h5")
+            logger = LikelihoodLogger(path, None, DummyModel(), precision="float16",
+                                      thinning=2, buffer_size=3, chunk_shape=(10, 5))
+            observation_lhs = np.random.random((11, sample.n_objects * sample.n_features))
+            for lh in observation_lhs:
+                sample.observation_lhs = lh
+                logger.write_sample(sample)
+            logger.close()
+
+            with tables.open_file(path) as f:
+                logged = f.root.likelihood.read()
+                self.assertEqual(f.root.likelihood.chunkshape, (10, 5))
+                self.assertEqual(f.root.likelihood.attrs.thinning, 2)
+
+        self.assertEqual(logged.dtype, np.float16)
+        np.testing.assert_allclose(logged, observation_lhs[::2], rtol=1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
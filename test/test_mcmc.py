@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import unittest
+import random
+
+import numpy as np
+from numpy.typing import NDArray
+
+from sbayes.sampling.mcmc import MCMC, MCMCStats, OperatorStats, get_temperature_ladder
+from sbayes.sampling.operators import Operator
+
+
+class ToySample:
+    """A sample with a single discrete state, which supports the transactions used by
+    `MCMC.step` to undo rejected proposals."""
+
+    def __init__(self, state: int, chain: int = 0):
+        self.state = state
+        self.chain = chain
+        self.i_step = 0
+        self._backup = None
+
+    def begin_transaction(self):
+        self._backup = self.state
+
+    def commit(self):
+        self._backup = None
+
+    def rollback(self):
+        self.state = self._backup
+        self._backup = None
+
+
+class IndependenceOperator(Operator):
+    """Propose a new state from a fixed (non-uniform) distribution `q`."""
+
+    CLUSTER_OPERATOR = True
+
+    def __init__(self, q: NDArray[float], cluster_operator: bool = True, **kwargs):
+        super().__init__(weight=1.0, **kwargs)
+        self.q = q
+        self.CLUSTER_OPERATOR = cluster_operator
+
+    def _propose(self, sample: ToySample, **kwargs) -> tuple[ToySample, float, float]:
+        log_q_back = np.log(self.q[sample.state])
+        sample.state = np.random.choice(len(self.q), p=self.q)
+        log_q = np.log(self.q[sample.state])
+        return sample, log_q, log_q_back
+
+
+class GibbsOperator(Operator):
+    """Sample a new state from the (unheated) posterior `p`, independently of the current state."""
+
+    GIBBS = True
+
+    def __init__(self, p: NDArray[float], **kwargs):
+        super().__init__(weight=1.0, **kwargs)
+        self.p = p
+
+    def _propose(self, sample: ToySample, **kwargs) -> tuple[ToySample, float, float]:
+        sample.state = np.random.choice(len(self.p), p=self.p)
+        return sample, self.Q_GIBBS, self.Q_BACK_GIBBS
+
+
+class ToyMCMC(MCMC):
+    """An MCMC sampler on a small discrete state space, where the (log) cluster prior,
+    the remaining prior and the likelihood of each state are given as arrays."""
+
+    def __init__(
+        self,
+        operator: Operator,
+        cluster_prior: NDArray[float],
+        other_prior: NDArray[float],
+        likelihood: NDArray[float],
+        temperature: NDArray[float] = np.ones(1),
+        delayed_acceptance: bool = False,
+    ):
+        self.cluster_priors = cluster_prior
+        self.priors = cluster_prior + other_prior
+        self.likelihoods = likelihood
+        self.n_likelihood_evaluations = 0
+
+        self.n_chains = len(temperature)
+        self.chain_idx = list(range(self.n_chains))
+        self.temperature = np.array(temperature, dtype=float)
+        self.delayed_acceptance = delayed_acceptance
+        self.callable_operators = {"toy_operator": operator}
+        self.statistics = MCMCStats(
+            operator_stats={"toy_operator": OperatorStats("toy_operator")},
+            swap_attempts=[0] * (self.n_chains - 1),
+            swap_accepts=[0] * (self.n_chains - 1),
+        )
+        self._ll = np.full(self.n_chains, -np.inf)
+        self._prior = np.full(self.n_chains, -np.inf)
+
+        self.mc3 = self.n_chains > 1
+        self.swap_period = 5
+        self.chain_swaps = 1
+        self.sample_loggers = []
+        self.n_processes = 1
+        self.chain_workers = None
+        self.checkpoint_interval = None
+
+    def prior(self, sample, chain):
+        return self.priors[sample.state]
+
+    def cluster_prior(self, sample, chain):
+        return self.cluster_priors[sample.state]
+
+    def likelihood(self, sample, chain):
+        self.n_likelihood_evaluations += 1
+        return self.likelihoods[sample.state]
+
+    def generate_initial_sample(self, c=0):
+        return ToySample(0, chain=c)
+
+    def get_operators(self, operators):
+        return self.callable_operators
+
+    def target_distribution(self, temperature: float = 1.0) -> NDArray[float]:
+        """The exact stationary distribution for a chain at the given temperature."""
+        log_p = self.likelihoods / temperature + self.priors
+        p = np.exp(log_p - log_p.max())
+        return p / p.sum()
+
+    def sample_state_frequencies(self, n_steps: int, c: int = 0) -> NDArray[float]:
+        sample = self.generate_initial_sample(c)
+        self._ll[c] = self.likelihood(sample, c)
+        self._prior[c] = self.prior(sample, c)
+        counts = np.zeros(len(self.priors))
+        for _ in range(n_steps):
+            sample = self.step(sample, c)
+            counts[sample.state] += 1
+        return counts / n_steps
+
+
+class TestDelayedAcceptance(unittest.TestCase):
+
+    """Test whether delayed acceptance MCMC samples from the same distribution as the
+    standard Metropolis-Hastings step, while evaluating the likelihood less often."""
+
+    N_STEPS = 20000
+    CLUSTER_PRIOR = np.log([0.05, 0.4, 0.1, 0.3, 0.15])
+    OTHER_PRIOR = np.log([0.3, 0.1, 0.2, 0.2, 0.2])
+    LIKELIHOOD = np.log([0.4, 0.05, 0.2, 0.15, 0.2])
+    PROPOSAL = np.array([0.1, 0.2, 0.3, 0.2, 0.2])
+
+    def setUp(self):
+        random.seed(1)
+        np.random.seed(1)
+
+    def get_mcmc(self, delayed_acceptance: bool, cluster_operator: bool = True) -> ToyMCMC:
+        return ToyMCMC(
+            operator=IndependenceOperator(self.PROPOSAL, cluster_operator=cluster_operator),
+            cluster_prior=self.CLUSTER_PRIOR,
+            other_prior=self.OTHER_PRIOR,
+            likelihood=self.LIKELIHOOD,
+            delayed_acceptance=delayed_acceptance,
+        )
+
+    def test_stationary_distribution(self):
+        for delayed_acceptance in [False, True]:
+            mcmc = self.get_mcmc(delayed_acceptance)
+            freq = mcmc.sample_state_frequencies(self.N_STEPS)
+            np.testing.assert_allclose(freq, mcmc.target_distribution(), atol=0.015)
+
+    def test_first_stage_screening(self):
+        mcmc_da = self.get_mcmc(delayed_acceptance=True)
+        mcmc_da.sample_state_frequencies(self.N_STEPS)
+        self.assertLess(mcmc_da.n_likelihood_evaluations, 0.9 * self.N_STEPS)
+
+        # Only cluster operators are screened on the cluster priors
+        mcmc_no_cluster_op = self.get_mcmc(delayed_acceptance=True, cluster_operator=False)
+        mcmc_no_cluster_op.sample_state_frequencies(self.N_STEPS)
+        self.assertEqual(mcmc_no_cluster_op.n_likelihood_evaluations, self.N_STEPS + 1)
+
+
+class TestMC3(unittest.TestCase):
+
+    """Test the heated chains and the temperature swaps of Metropolis-coupled MCMC."""
+
+    N_STEPS = 20000
+    PRIOR = np.log([0.1, 0.2, 0.3, 0.4])
+    LIKELIHOOD = np.log([0.5, 0.1, 0.1, 0.3])
+
+    def setUp(self):
+        random.seed(1)
+        np.random.seed(1)
+
+    def get_mcmc(self, temperature: list[float], operator: Operator = None) -> ToyMCMC:
+        if operator is None:
+            operator = GibbsOperator(np.full(len(self.PRIOR), 1 / len(self.PRIOR)))
+        return ToyMCMC(
+            operator=operator,
+            cluster_prior=np.zeros(len(self.PRIOR)),
+            other_prior=self.PRIOR,
+            likelihood=self.LIKELIHOOD,
+            temperature=np.array(temperature),
+        )
+
+    def test_temperature_ladder(self):
+        np.testing.assert_allclose(get_temperature_ladder(1, 0.1), [1.0])
+        np.testing.assert_allclose(get_temperature_ladder(4, 0.1), [1.0, 1.1, 1.2, 1.3])
+        np.testing.assert_allclose(get_temperature_ladder(4, 0.1, exponential=True),
+                                   [1.0, 1.1, 1.21, 1.331])
+
+    def test_swap_chains(self):
+        mcmc = self.get_mcmc(temperature=[1.0, 2.0])
+
+        # A swap which increases the likelihood of the cold chain is always accepted
+        mcmc._ll[:] = [-10.0, -5.0]
+        mcmc.swap_chains()
+        np.testing.assert_array_equal(mcmc.temperature, [2.0, 1.0])
+        self.assertEqual(mcmc.cold_chain, 1)
+        self.assertEqual(mcmc.statistics.swap_attempts, [1])
+        self.assertEqual(mcmc.statistics.swap_accepts, [1])
+
+        # Otherwise, the swap is accepted with probability exp((1/T1 - 1/T2) * (ll2 - ll1))
+        n_attempts = 10000
+        for _ in range(n_attempts):
+            mcmc.temperature[:] = [1.0, 2.0]
+            mcmc._ll[:] = [-5.0, -7.0]
+            mcmc.swap_chains()
+        self.assertEqual(mcmc.statistics.swap_attempts, [1 + n_attempts])
+        acceptance_rate = (mcmc.statistics.swap_accepts[0] - 1) / n_attempts
+        self.assertAlmostEqual(acceptance_rate, np.exp(0.5 * -2.0), delta=0.02)
+
+    def test_heated_gibbs_acceptance(self):
+        """Gibbs proposals from the unheated posterior are always accepted in the cold
+        chain, but corrected by a MH-step in heated chains."""
+        cold_posterior = self.get_mcmc(temperature=[1.0]).target_distribution()
+        gibbs_operator = GibbsOperator(cold_posterior)
+
+        mcmc = self.get_mcmc(temperature=[1.0], operator=gibbs_operator)
+        freq = mcmc.sample_state_frequencies(self.N_STEPS)
+        self.assertEqual(mcmc.statistics.operator_stats["toy_operator"].rejects, 0)
+        np.testing.assert_allclose(freq, cold_posterior, atol=0.015)
+
+        mcmc = self.get_mcmc(temperature=[3.0], operator=gibbs_operator)
+        freq = mcmc.sample_state_frequencies(self.N_STEPS)
+        self.assertGreater(mcmc.statistics.operator_stats["toy_operator"].rejects, 0)
+        np.testing.assert_allclose(freq, mcmc.target_distribution(temperature=3.0), atol=0.015)
+
+    def test_only_cold_chain_logged(self):
+        mcmc = self.get_mcmc(temperature=[1.0, 1.5, 2.0])
+        logged_chains = []
+        cold_chains = []
+
+        class ChainLogger:
+            def write_sample(self, sample):
+                logged_chains.append(sample.chain)
+                cold_chains.append(mcmc.cold_chain)
+
+            def close(self):
+                pass
+
+        mcmc.sample_loggers = [ChainLogger()]
+        mcmc.generate_samples(n_steps=400, n_samples=40)
+
+        self.assertEqual(len(logged_chains), 40)
+        self.assertEqual(logged_chains, cold_chains)
+
+        # The chains swapped temperatures, so that different chains were logged
+        self.assertGreater(len(set(logged_chains)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
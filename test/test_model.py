@@ -4,11 +4,16 @@ import unittest
 import numpy as np
 import numpy.testing
 from numpy.typing import NDArray
+import scipy.stats as stats
+from scipy.sparse.csgraph import minimum_spanning_tree, csgraph_from_dense
 
-from sbayes.model import Likelihood, ModelShapes, SourcePrior
+from sbayes.model import Likelihood, ModelShapes, SourcePrior, lookup_state_probs, count_group_states
+from sbayes.model.prior import (Prior, GeoPrior, SpanningTree, compute_cost_based_geo_prior,
+                                compute_group_effect_prior, dirichlet_log_normalizer)
 from sbayes.sampling.state import Sample
 from sbayes.util import log_multinom
 from sbayes.load_data import Data, Objects, Features, Confounder
+from sbayes.config.config import GeoPriorConfig, PriorConfig
 
 
 def binary_encoding(data, n_categories=None) -> np.array:
@@ -93,6 +98,29 @@ def dummy_family_confounder(families: NDArray[bool]) -> Confounder:
     )
 
 
+def dummy_data_with_families(n_objects: int, n_features: int, n_states: int) -> Data:
+    """Random features (10% missing values) with a universal confounder and two families,
+    covering the first 10 and the next 10 objects (the remaining objects have no family)."""
+    values = generate_features((n_objects, n_features), n_states)
+    values[np.random.random((n_objects, n_features)) < 0.1] = False  # Missing values
+    features = dummy_features_from_values(values)
+    families = np.zeros((2, n_objects), dtype=bool)
+    families[0, :10] = True
+    families[1, 10:20] = True
+    confounders = {
+        "universal": dummy_universal_confounder(n_objects),
+        "family": dummy_family_confounder(families),
+    }
+    return Data(objects=dummy_objects(n_objects), features=features, confounders=confounders)
+
+
+def dummy_disjoint_clusters(n_clusters: int, n_objects: int) -> NDArray[bool]:
+    """Disjoint clusters, leaving some objects outside of all clusters."""
+    clusters = np.zeros((n_clusters + 1, n_objects), dtype=bool)
+    clusters[np.random.randint(n_clusters + 1, size=n_objects), np.arange(n_objects)] = True
+    return clusters[:n_clusters]
+
+
 class TestLikelihood(unittest.TestCase):
 
     """Test correctness of the model likelihood."""
@@ -200,6 +228,296 @@ class TestLikelihood(unittest.TestCase):
         likelihood_sbayes = Likelihood(data=data, shapes=shapes)(sample, caching=False)
         np.testing.assert_almost_equal(likelihood_sbayes, np.log(lh))
 
+    def test_state_index_lookup(self):
+        n_objects = 20
+        n_features = 4
+        n_states = 5
+        n_groups = 3
+
+        values = generate_features((n_objects, n_features), n_states)
+        values[np.random.random((n_objects, n_features)) < 0.2] = False  # Missing values
+        features = dummy_features_from_values(values)
+        assert np.all((features.state_index < 0) == ~values.any(axis=-1))
+
+        probs = np.random.dirichlet(np.ones(n_states), size=(n_groups, n_features))
+        group_index = np.random.randint(n_groups, size=n_objects)
+        lh_onehot = np.einsum('ijk,ijk->ij', values, probs[group_index])
+        lh_lookup = lookup_state_probs(probs, group_index, features.state_index)
+        np.testing.assert_array_equal(lh_lookup, lh_onehot)
+
+        mask = np.random.random((n_objects, n_features)) < 0.5
+        counts = count_group_states(features.state_index, group_index, mask, n_groups, n_states)
+        for g in range(n_groups):
+            in_g = (group_index == g)
+            expected = np.sum(values[in_g] & mask[in_g, :, np.newaxis], axis=0)
+            np.testing.assert_array_equal(counts[g], expected)
+
+    def test_state_count_caching(self):
+        n_objects = 30
+        n_features = 4
+        n_states = 3
+        n_clusters = 2
+
+        data = dummy_data_with_families(n_objects, n_features, n_states)
+        features = data.features
+        confounders = data.confounders
+        families = confounders["family"].group_assignment
+        n_families = len(families)
+        likelihood = Likelihood(data=data, shapes=None)
+
+        n_components = 1 + len(confounders)
+        source = np.eye(n_components, dtype=bool)[
+            np.random.randint(n_components, size=(n_objects, n_features))
+        ]
+        sample = Sample.from_numpy_arrays(
+            clusters=dummy_disjoint_clusters(n_clusters, n_objects),
+            weights=np.full((n_features, n_components), 1 / n_components),
+            cluster_effect=np.full((n_clusters, n_features, n_states), 1 / n_states),
+            confounding_effects={
+                "universal": np.full((1, n_features, n_states), 1 / n_states),
+                "family": np.full((n_families, n_features, n_states), 1 / n_states),
+            },
+            confounders=confounders,
+            source=source,
+        )
+
+        for i_step in range(30):
+            # Update the counts, then change the source of a few objects and the clusters
+            likelihood.update_cluster_state_counts(sample)
+            likelihood.update_confounder_state_counts(sample, "family")
+            sample = sample.copy()
+
+            objects = np.random.choice(n_objects, size=3, replace=False)
+            new_source = np.eye(n_components, dtype=bool)[
+                np.random.randint(n_components, size=(3, n_features))
+            ]
+            sample.source.set_items(objects, new_source)
+            i_cluster = np.random.randint(n_clusters)
+            i_object = np.random.randint(n_objects)
+            if sample.clusters.value[i_cluster, i_object]:
+                sample.clusters.remove_object(i_cluster, i_object)
+            elif not sample.clusters.any_cluster()[i_object]:
+                sample.clusters.add_object(i_cluster, i_object)
+
+            cluster_counts = likelihood.update_cluster_state_counts(sample)
+            family_counts = likelihood.update_confounder_state_counts(sample, "family")
+            for i in range(n_clusters):
+                from_cluster = sample.source.value[..., 0] & sample.clusters.value[i, :, None]
+                expected = np.sum(features.values & from_cluster[..., None], axis=0)
+                np.testing.assert_array_equal(cluster_counts[i], expected)
+            for i in range(n_families):
+                from_family = sample.source.value[..., 2] & families[i, :, None]
+                expected = np.sum(features.values & from_family[..., None], axis=0)
+                np.testing.assert_array_equal(family_counts[i], expected)
+
+    def test_cluster_contributions(self):
+        n_objects = 30
+        n_features = 4
+        n_states = 3
+        n_clusters = 3
+
+        data = dummy_data_with_families(n_objects, n_features, n_states)
+        confounders = data.confounders
+        likelihood = Likelihood(data=data, shapes=None)
+
+        clusters = dummy_disjoint_clusters(n_clusters, n_objects)
+        cluster_effect = np.random.dirichlet(np.ones(n_states), size=(n_clusters, n_features))
+        confounding_effects = {
+            "universal": np.random.dirichlet(np.ones(n_states), size=(1, n_features)),
+            "family": np.random.dirichlet(np.ones(n_states), size=(2, n_features)),
+        }
+        weights = np.random.dirichlet(np.ones(3), size=n_features)
+        sample = Sample.from_numpy_arrays(
+            clusters=clusters,
+            weights=weights,
+            cluster_effect=cluster_effect,
+            confounding_effects=confounding_effects,
+            confounders=confounders,
+        )
+        lh_contributions = likelihood.get_cluster_contributions(sample)
+
+        # Compare to the likelihood of a model containing only one cluster
+        for i in range(n_clusters):
+            sample_i = Sample.from_numpy_arrays(
+                clusters=clusters[[i]],
+                weights=weights,
+                cluster_effect=cluster_effect[[i]],
+                confounding_effects=confounding_effects,
+                confounders=confounders,
+            )
+            self.assertAlmostEqual(lh_contributions[i], likelihood(sample_i, caching=False))
+
+        # The same for the prior, for each type of cluster size prior
+        shapes = ModelShapes(
+            n_clusters=n_clusters,
+            n_sites=n_objects,
+            n_features=n_features,
+            n_states=n_states,
+            states_per_feature=data.features.states,
+        )
+        for size_prior_type in ["uniform_area", "uniform_size", "quadratic"]:
+            prior_config = PriorConfig(
+                objects_per_cluster={"type": size_prior_type},
+                geo={"type": "cost_based", "rate": 0.5},
+                weights={"type": "uniform"},
+                cluster_effect={"type": "uniform"},
+                confounding_effects={
+                    "universal": {"<ALL>": {"type": "uniform"}},
+                    "family": {"fam_0": {"type": "uniform"}, "fam_1": {"type": "uniform"}},
+                },
+            )
+            prior = Prior(shapes=shapes, config=prior_config, data=data, sample_source=False)
+            prior_contributions = prior.get_cluster_contributions(sample)
+            for i in range(n_clusters):
+                sample_i = Sample.from_numpy_arrays(
+                    clusters=clusters[[i]],
+                    weights=weights,
+                    cluster_effect=cluster_effect[[i]],
+                    confounding_effects=confounding_effects,
+                    confounders=confounders,
+                )
+                self.assertAlmostEqual(prior_contributions[i], prior(sample_i, caching=False))
+
+    def test_incremental_log_likelihood(self):
+        n_objects = 30
+        n_features = 4
+        n_states = 3
+        n_clusters = 2
+
+        data = dummy_data_with_families(n_objects, n_features, n_states)
+        confounders = data.confounders
+        families = confounders["family"].group_assignment
+        likelihood = Likelihood(data=data, shapes=None)
+
+        n_components = 1 + len(confounders)
+        clusters = dummy_disjoint_clusters(n_clusters, n_objects)
+
+        # Objects can only be assigned to components they belong to
+        has_components = np.array([clusters.any(axis=0), np.ones(n_objects, dtype=bool),
+                                   families.any(axis=0)]).T
+
+        def random_source(objects: NDArray[int]) -> NDArray[bool]:
+            p = has_components[objects, np.newaxis, :] * np.ones((1, n_features, 1))
+            p /= p.sum(axis=-1, keepdims=True)
+            choice = (np.random.random(p.shape[:2] + (1,)) > np.cumsum(p, axis=-1)).sum(axis=-1)
+            return np.eye(n_components, dtype=bool)[choice]
+
+        for with_source in (False, True):
+            sample = Sample.from_numpy_arrays(
+                clusters=clusters.copy(),
+                weights=np.random.dirichlet(np.ones(n_components), size=n_features),
+                cluster_effect=np.random.dirichlet(np.ones(n_states), size=(n_clusters, n_features)),
+                confounding_effects={
+                    "universal": np.random.dirichlet(np.ones(n_states), size=(1, n_features)),
+                    "family": np.random.dirichlet(np.ones(n_states), size=(2, n_features)),
+                },
+                confounders=confounders,
+                source=random_source(np.arange(n_objects)) if with_source else None,
+            )
+
+            for i_step in range(40):
+                # Change a random part of the sample
+                change = i_step % 4
+                if change == 0 and not with_source:
+                    # Grow or shrink a cluster (the source is fixed to the initial clusters)
+                    i_cluster = np.random.randint(n_clusters)
+                    i_object = np.random.randint(n_objects)
+                    if sample.clusters.value[i_cluster, i_object]:
+                        sample.clusters.remove_object(i_cluster, i_object)
+                    elif not sample.clusters.any_cluster()[i_object]:
+                        sample.clusters.add_object(i_cluster, i_object)
+                elif change == 1:
+                    sample.cluster_effect.set_group(
+                        np.random.randint(n_clusters),
+                        np.random.dirichlet(np.ones(n_states), size=n_features)
+                    )
+                elif change == 2:
+                    with sample.confounding_effects["family"].edit_group(1) as effect:
+                        effect[...] = np.random.dirichlet(np.ones(n_states), size=n_features)
+                elif with_source:
+                    objects = np.random.choice(n_objects, size=3, replace=False)
+                    sample.source.set_items(objects, random_source(objects))
+                else:
+                    sample.weights.set_value(np.random.dirichlet(np.ones(n_components), size=n_features))
+
+                # The incrementally updated likelihood matches a full computation
+                log_lh = likelihood(sample)
+                log_lh_full = likelihood(Sample.from_numpy_arrays(
+                    clusters=sample.clusters.value,
+                    weights=sample.weights.value,
+                    cluster_effect=sample.cluster_effect.value,
+                    confounding_effects={k: v.value for k, v in sample.confounding_effects.items()},
+                    confounders=confounders,
+                    source=None if sample.source is None else sample.source.value,
+                ))
+                self.assertTrue(np.isfinite(log_lh_full))
+                self.assertAlmostEqual(log_lh, log_lh_full)
+
+    def test_transaction_rollback(self):
+        n_objects = 30
+        n_features = 4
+        n_states = 3
+        n_clusters = 2
+
+        data = dummy_data_with_families(n_objects, n_features, n_states)
+        confounders = data.confounders
+        likelihood = Likelihood(data=data, shapes=None)
+
+        sample = Sample.from_numpy_arrays(
+            clusters=dummy_disjoint_clusters(n_clusters, n_objects),
+            weights=np.random.dirichlet(np.ones(3), size=n_features),
+            cluster_effect=np.random.dirichlet(np.ones(n_states), size=(n_clusters, n_features)),
+            confounding_effects={
+                "universal": np.random.dirichlet(np.ones(n_states), size=(1, n_features)),
+                "family": np.random.dirichlet(np.ones(n_states), size=(2, n_features)),
+            },
+            confounders=confounders,
+        )
+
+        def recompute_likelihood(s: Sample) -> float:
+            return likelihood(Sample.from_numpy_arrays(
+                clusters=s.clusters.value,
+                weights=s.weights.value,
+                cluster_effect=s.cluster_effect.value,
+                confounding_effects={k: v.value for k, v in s.confounding_effects.items()},
+                confounders=confounders,
+            ))
+
+        for i_step in range(30):
+            log_lh = likelihood(sample)
+            clusters_before = sample.clusters.value.copy()
+            cluster_effect_before = sample.cluster_effect.value.copy()
+            weights_before = sample.weights.value.copy()
+
+            # Modify the sample in place and update the cache
+            sample.begin_transaction()
+            i_cluster = np.random.randint(n_clusters)
+            i_object = np.random.randint(n_objects)
+            if sample.clusters.value[i_cluster, i_object]:
+                sample.clusters.remove_object(i_cluster, i_object)
+            elif not sample.clusters.any_cluster()[i_object]:
+                sample.clusters.add_object(i_cluster, i_object)
+            sample.cluster_effect.set_group(
+                i_cluster, np.random.dirichlet(np.ones(n_states), size=n_features)
+            )
+            sample.weights.set_items(0, np.random.dirichlet(np.ones(3)))
+            log_lh_new = likelihood(sample)
+            self.assertAlmostEqual(log_lh_new, recompute_likelihood(sample))
+
+            if i_step % 2 == 0:
+                sample.commit()
+                log_lh = log_lh_new
+            else:
+                # Rolling back restores the parameters and the cached likelihoods
+                sample.rollback()
+                np.testing.assert_array_equal(sample.clusters.value, clusters_before)
+                np.testing.assert_array_equal(sample.cluster_effect.value, cluster_effect_before)
+                np.testing.assert_array_equal(sample.weights.value, weights_before)
+                self.assertFalse(sample.cache.component_likelihoods.is_outdated())
+
+            self.assertEqual(likelihood(sample), log_lh)
+            self.assertAlmostEqual(log_lh, recompute_likelihood(sample))
+
 
 # def test_family_cluster_overlap(self):
     #     n_objects = 10
@@ -300,5 +618,112 @@ class TestSizePrior(unittest.TestCase):
             assert logp == -log_multinom(n_sites, sizes)
 
 
+class TestDirichletPrior(unittest.TestCase):
+
+    def test_vectorized_logpdf(self):
+        n_groups = 4
+        n_features = 10
+        n_states = 5
+        applicable_states = np.random.random((n_features, n_states)) < 0.7
+        applicable_states[:, :2] = True
+        concentration = np.where(applicable_states, np.random.gamma(2., size=(n_groups, n_features, n_states)), 0.)
+
+        group_effects = np.zeros((n_groups, n_features, n_states))
+        expected = np.zeros(n_groups)
+        for g in range(n_groups):
+            for f in range(n_features):
+                states = applicable_states[f]
+                group_effects[g, f, states] = np.random.dirichlet(np.ones(np.count_nonzero(states)))
+                expected[g] += stats.dirichlet.logpdf(group_effects[g, f, states], concentration[g, f, states])
+
+        log_prior = compute_group_effect_prior(group_effects, concentration, applicable_states)
+        np.testing.assert_allclose(log_prior, expected)
+
+        # Using precomputed normalizing constants gives the same result
+        log_normalizer = [dirichlet_log_normalizer(c, applicable_states) for c in concentration]
+        log_prior = compute_group_effect_prior(group_effects, concentration, applicable_states, log_normalizer)
+        np.testing.assert_allclose(log_prior, expected)
+
+
+class TestGeoPrior(unittest.TestCase):
+
+    """Test the caching of the cost-based geo-prior."""
+
+    def test_caching(self):
+        n_objects = 30
+        n_clusters = 3
+        n_features = 2
+        n_states = 3
+        cost_matrix = np.random.random((n_objects, n_objects))
+        cost_matrix = cost_matrix + cost_matrix.T
+        np.fill_diagonal(cost_matrix, 0.)
+
+        universal = dummy_universal_confounder(n_objects)
+        config = GeoPriorConfig(type="cost_based", rate=0.5, aggregation="mean")
+        geo_prior = GeoPrior(config=config, cost_matrix=cost_matrix)
+
+        clusters = np.zeros((n_clusters, n_objects), dtype=bool)
+        for i in range(n_clusters):
+            clusters[i, 10*i: 10*i + 5] = True
+        sample = Sample.from_numpy_arrays(
+            clusters=clusters,
+            weights=broadcast_weights([0.5, 0.5], n_features),
+            cluster_effect=np.full((n_clusters, n_features, n_states), 1/n_states),
+            confounding_effects={"universal": np.full((1, n_features, n_states), 1/n_states)},
+            confounders={universal.name: universal},
+        )
+
+        for i_step in range(20):
+            # Grow or shrink a random cluster by one object
+            i_cluster = np.random.randint(n_clusters)
+            cluster = sample.clusters.value[i_cluster]
+            if cluster.sum() > 2 and np.random.random() < 0.5:
+                sample.clusters.remove_object(i_cluster, np.random.choice(np.flatnonzero(cluster)))
+            else:
+                free = ~sample.clusters.any_cluster()
+                sample.clusters.add_object(i_cluster, np.random.choice(np.flatnonzero(free)))
+
+            expected = compute_cost_based_geo_prior(
+                clusters=sample.clusters.value,
+                cost_mat=cost_matrix,
+                aggregator=np.mean,
+                probability_function=geo_prior.probability_function,
+            )
+            np.testing.assert_almost_equal(geo_prior(sample), expected.sum())
+            np.testing.assert_almost_equal(sample.cache.geo_prior.value, expected)
+            self.assertEqual(geo_prior(sample), geo_prior(sample, caching=False))
+
+    def test_spanning_tree_updates(self):
+        n_objects = 40
+        locations = np.random.random((n_objects, 2))
+        cost_matrix = np.linalg.norm(locations[:, None] - locations[None, :], axis=-1)
+        # Rounding creates ties and a few objects share the same location (zero costs)
+        cost_matrix = np.round(cost_matrix, 1)
+        cost_matrix[:4, :4] = 0.
+
+        cluster = np.zeros(n_objects, dtype=bool)
+        cluster[:10] = True
+        tree = SpanningTree.from_cluster(cluster, cost_matrix)
+        for i_step in range(200):
+            i = np.random.randint(n_objects)
+            if cluster[i] and cluster.sum() <= 2:
+                continue
+            cluster = cluster.copy()
+            cluster[i] = ~cluster[i]
+            tree = tree.update(cluster, cost_matrix)
+
+            # The tree has to span the cluster and be minimal
+            self.assertEqual(len(tree.edges), cluster.sum() - 1)
+            self.assertTrue(np.all(cluster[tree.edges]))
+            cost_matrix_z = cost_matrix[cluster][:, cluster]
+            mst = minimum_spanning_tree(csgraph_from_dense(cost_matrix_z, null_value=np.inf))
+            np.testing.assert_almost_equal(tree.aggregate(np.sum), mst.sum())
+
+            # Aggregates must exactly match a tree computed from scratch
+            new_tree = SpanningTree.from_cluster(cluster, cost_matrix)
+            for aggregator in (np.sum, np.mean, np.max):
+                self.assertEqual(tree.aggregate(aggregator), new_tree.aggregate(aggregator))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -5,6 +5,8 @@ import unittest
 import random
 import math
 from copy import deepcopy
+from collections import OrderedDict
+from types import SimpleNamespace
 from abc import abstractmethod, ABC
 from typing import Generic, TypeVar
 
@@ -13,9 +15,17 @@ from numpy.typing import NDArray
 import scipy.stats as stats
 from scipy.stats import kstest
 
-from sbayes.model import Model
-from sbayes.sampling.operators import Operator, AlterCluster
+from sbayes.model import Model, ModelShapes
+from sbayes.model.prior import ConfoundingEffectsPrior
+from sbayes.sampling.operators import (
+    Operator,
+    AlterCluster,
+    GibbsSampleSource,
+    GibbsSampleConfoundingEffects,
+)
 from sbayes.sampling.state import Sample, Clusters
+from sbayes.load_data import Confounder
+from sbayes.config.config import DirichletPriorConfig
 
 Value = TypeVar("Value")
 
@@ -24,6 +34,9 @@ class DummySample(Sample):
     """This dummy subclass of Sample allows initializing without setting all parameters."""
 
     chain = 0
+    last_lh = None
+    last_prior = None
+    observation_lhs = None
 
     def __init__(self):
         pass
@@ -31,6 +44,9 @@ class DummySample(Sample):
     def copy(self):
         return deepcopy(self)
 
+    def tracked_objects(self):
+        yield self._clusters
+
 
 class DummyModel(Model):
 
@@ -119,12 +135,14 @@ class AbstractOperatorTest(ABC, Generic[Value]):
 
     @staticmethod
     def mcmc_step(sample: Sample, operator: Operator) -> Sample:
+        sample.begin_transaction()
         new_sample, log_q, log_q_back = operator.function(sample)
         p_accept = math.exp(log_q_back - log_q)
         if random.random() < p_accept:
-            return new_sample
+            new_sample.commit()
         else:
-            return sample
+            new_sample.rollback()
+        return new_sample
 
 
 class ClusterOperatorTest(AbstractOperatorTest[NDArray[bool]], unittest.TestCase):
@@ -188,5 +206,112 @@ class ClusterOperatorTest(AbstractOperatorTest[NDArray[bool]], unittest.TestCase
         assert p_value_flat > 0.01, p_value_flat
 
 
+class GibbsFlagTest(unittest.TestCase):
+
+    def test_source_operator_gibbs_flag(self):
+        """The source operator is only a Gibbs operator (always accepted, without undo
+        log) when it does not return a hastings factor."""
+        gibbs = GibbsSampleSource(weight=0.0, model_by_chain={}, as_gibbs=True)
+        non_gibbs = GibbsSampleSource(weight=0.0, model_by_chain={}, as_gibbs=False)
+        self.assertTrue(gibbs.GIBBS)
+        self.assertFalse(non_gibbs.GIBBS)
+        self.assertTrue(GibbsSampleSource.GIBBS)
+
+
+class GibbsSampleConfoundingEffectsTest(unittest.TestCase):
+
+    N_OBJECTS = 6
+    N_GROUPS = 3
+    STATES = np.array([[True, True, True], [True, True, False], [True, True, True]])
+
+    def setUp(self):
+        np.random.seed(1)
+        n_features, n_states = self.STATES.shape
+        group_names = [f"fam_{i}" for i in range(self.N_GROUPS)]
+        self.confounder = Confounder(
+            name="family",
+            group_assignment=np.repeat(np.eye(self.N_GROUPS, dtype=bool), 2, axis=1),
+            group_names=group_names,
+        )
+        feature_names = OrderedDict(
+            (f"f{f}", [f"s{s}" for s in range(n_states) if self.STATES[f, s]])
+            for f in range(n_features)
+        )
+        dirichlet_config = DirichletPriorConfig(
+            type="dirichlet",
+            parameters={f: {s: 2.0 for s in states} for f, states in feature_names.items()},
+        )
+        shapes = ModelShapes(
+            n_clusters=1,
+            n_sites=self.N_OBJECTS,
+            n_features=n_features,
+            n_states=n_states,
+            states_per_feature=self.STATES,
+        )
+        self.prior = ConfoundingEffectsPrior(
+            config={
+                "fam_0": DirichletPriorConfig(type="uniform"),
+                "fam_1": dirichlet_config,
+                "fam_2": dirichlet_config,
+            },
+            shapes=shapes,
+            feature_names=feature_names,
+            conf="family",
+        )
+
+    def get_sample(self) -> Sample:
+        n_features, n_states = self.STATES.shape
+        effects = self.STATES / self.STATES.sum(axis=1, keepdims=True)
+        return Sample.from_numpy_arrays(
+            clusters=np.zeros((1, self.N_OBJECTS), dtype=bool),
+            weights=np.full((n_features, 3), 1 / 3),
+            cluster_effect=effects[np.newaxis],
+            confounding_effects={"family": np.repeat(effects[np.newaxis], self.N_GROUPS, axis=0)},
+            confounders={"family": self.confounder},
+        )
+
+    def get_operator(self, all_groups: bool) -> GibbsSampleConfoundingEffects:
+        model = SimpleNamespace(prior=SimpleNamespace(
+            prior_confounding_effects={"family": self.prior}
+        ))
+        return GibbsSampleConfoundingEffects(
+            weight=1.0,
+            confounder="family",
+            source_index=2,
+            model_by_chain={0: model},
+            applicable_states=self.STATES,
+            sample_from_prior=True,
+            all_groups=all_groups,
+        )
+
+    def test_single_group(self):
+        sample = self.get_sample()
+        self.prior(sample)
+        old_effects = sample.confounding_effects["family"].value.copy()
+        self.get_operator(all_groups=False).function(sample)
+
+        new_effects = sample.confounding_effects["family"].value
+        changed = np.any(new_effects != old_effects, axis=(1, 2))
+        self.assertEqual(np.count_nonzero(changed), 1)
+        self.assertEqual(self.prior(sample), self.prior(sample, caching=False))
+
+    def test_all_groups(self):
+        sample = self.get_sample()
+        self.prior(sample)
+        operator = self.get_operator(all_groups=True)
+        for _ in range(5):
+            old_effects = sample.confounding_effects["family"].value.copy()
+            operator.function(sample)
+            new_effects = sample.confounding_effects["family"].value
+
+            # All groups are resampled and remain valid probability vectors
+            self.assertTrue(np.all(np.any(new_effects != old_effects, axis=(1, 2))))
+            np.testing.assert_allclose(new_effects.sum(axis=-1), 1.0)
+            self.assertTrue(np.all(new_effects[:, ~self.STATES] == 0.0))
+
+            # The cached Dirichlet prior is updated for all groups
+            self.assertAlmostEqual(self.prior(sample), self.prior(sample, caching=False))
+
+
 if __name__ == "__main__":
     unittest.main()
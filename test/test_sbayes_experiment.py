@@ -1,9 +1,17 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from copy import deepcopy
+from pathlib import Path
+import multiprocessing
+import shutil
 import unittest
 
-from sbayes.cli import main as sbayes_main
+import numpy as np
+
+from sbayes.cli import main as sbayes_main, run_experiment
+from sbayes.config.config import SBayesConfig
+from sbayes.load_data import Data, get_data_cache_path
+from sbayes.results import Results
 from sbayes.simulation import main as simulation_main
 
 
@@ -63,6 +71,148 @@ class TestExperiment(unittest.TestCase):
         )
         print("Sample prior passed\n")
 
+    @staticmethod
+    def test_parallel_chains():
+        """Test whether running the warm-up chains in worker processes is running without errors."""
+        custom_settings = deepcopy(TestExperiment.CUSTOM_SETTINGS)
+        custom_settings["mcmc"]["processes"] = 2
+        run_experiment(
+            config="experiments/mobility_behaviour/config.json",
+            custom_settings=custom_settings,
+            experiment_name="test_mobility_run_parallel",
+        )
+        print("Parallel chains passed\n")
+
+    @staticmethod
+    def test_parallel_chains_spawn():
+        """Test whether the worker processes can be started with the `spawn` start method
+        (the default on macOS), which requires pickling everything sent to the workers."""
+        custom_settings = deepcopy(TestExperiment.CUSTOM_SETTINGS)
+        custom_settings["mcmc"]["processes"] = 2
+        custom_settings["results"] = {"async_writer": True}
+        start_method = multiprocessing.get_start_method()
+        multiprocessing.set_start_method("spawn", force=True)
+        try:
+            run_experiment(
+                config="experiments/mobility_behaviour/config.json",
+                custom_settings=custom_settings,
+                experiment_name="test_mobility_run_parallel_spawn",
+            )
+        finally:
+            multiprocessing.set_start_method(start_method, force=True)
+        print("Parallel chains (spawn) passed\n")
+
+    @staticmethod
+    def test_tempered_chains_mc3():
+        """Test whether Metropolis-coupled MCMC (MC3) is running without errors."""
+        custom_settings = deepcopy(TestExperiment.CUSTOM_SETTINGS)
+        custom_settings["mcmc"]["mc3"] = {"activate": True, "chains": 3, "swap_interval": 10}
+        run_experiment(
+            config="experiments/mobility_behaviour/config.json",
+            custom_settings=custom_settings,
+            experiment_name="test_mobility_run_mc3",
+        )
+        print("MC3 passed\n")
+
+    @staticmethod
+    def test_two_stage_delayed_acceptance():
+        """Test whether the delayed acceptance MCMC is running without errors."""
+        custom_settings = deepcopy(TestExperiment.CUSTOM_SETTINGS)
+        custom_settings["mcmc"]["delayed_acceptance"] = True
+        custom_settings["mcmc"]["mc3"] = {"activate": True, "chains": 2, "swap_interval": 10}
+        run_experiment(
+            config="experiments/mobility_behaviour/config.json",
+            custom_settings=custom_settings,
+            experiment_name="test_mobility_run_delayed_acceptance",
+        )
+        print("Delayed acceptance passed\n")
+
+    @staticmethod
+    def test_samples_hdf5():
+        """Test whether samples written in the HDF5 format can be read as results."""
+        custom_settings = deepcopy(TestExperiment.CUSTOM_SETTINGS)
+        custom_settings["results"] = {"sample_format": "hdf5"}
+        run_experiment(
+            config="experiments/mobility_behaviour/config.json",
+            custom_settings=custom_settings,
+            experiment_name="test_mobility_run_hdf5",
+        )
+        samples_path = Path("experiments/mobility_behaviour/results/test_mobility_run_hdf5/K2/samples_K2_0.h5")
+        results = Results.from_hdf5(samples_path, burn_in=0.0)
+        assert results.n_samples == 20
+        assert results.n_clusters == 2
+        np.testing.assert_allclose(results.posterior, results.likelihood + results.prior)
+        print("HDF5 samples passed\n")
+
+    @staticmethod
+    def test_samples_lazy():
+        """Test whether lazily loaded results match the eagerly loaded results."""
+        custom_settings = deepcopy(TestExperiment.CUSTOM_SETTINGS)
+        custom_settings["results"] = {"clusters_encoding": "packed"}
+        run_experiment(
+            config="experiments/mobility_behaviour/config.json",
+            custom_settings=custom_settings,
+            experiment_name="test_mobility_run_lazy",
+        )
+        results_path = Path("experiments/mobility_behaviour/results/test_mobility_run_lazy/K2")
+        clusters_path = results_path / "clusters_K2_0.bin"
+        stats_path = results_path / "stats_K2_0.txt"
+        results = Results.from_csv_files(clusters_path, stats_path, burn_in=0.2)
+        lazy_results = Results.from_csv_files(clusters_path, stats_path, burn_in=0.2, lazy=True)
+
+        np.testing.assert_array_equal(lazy_results.posterior, results.posterior)
+        np.testing.assert_array_equal(lazy_results.clusters, results.clusters)
+        for w in results.weights:
+            np.testing.assert_array_equal(lazy_results.weights[w], results.weights[w])
+        assert lazy_results.parameters.equals(results.parameters)
+        print("Lazy results passed\n")
+
+    @staticmethod
+    def test_samples_resume():
+        """Test whether resuming a run from its last checkpoint reproduces the same samples."""
+        custom_settings = deepcopy(TestExperiment.CUSTOM_SETTINGS)
+        custom_settings["mcmc"]["checkpoint_interval"] = 5
+        kwargs = dict(
+            config="experiments/mobility_behaviour/config.json",
+            custom_settings=custom_settings,
+            experiment_name="test_mobility_run_resume",
+        )
+        results_path = Path("experiments/mobility_behaviour/results/test_mobility_run_resume/K2")
+
+        run_experiment(**kwargs)
+        assert (results_path / "checkpoint_K2_0.pkl").exists()
+        stats = (results_path / "stats_K2_0.txt").read_text()
+        clusters = (results_path / "clusters_K2_0.txt").read_text()
+
+        # Resuming truncates the files at the last checkpoint and re-runs the remaining steps
+        run_experiment(**kwargs, resume=True)
+        assert (results_path / "stats_K2_0.txt").read_text() == stats
+        assert (results_path / "clusters_K2_0.txt").read_text() == clusters
+        print("Resume passed\n")
+
+    @staticmethod
+    def test_simulated_data_cache():
+        """Test whether the preprocessed data read from the cache matches the original."""
+        config = SBayesConfig.from_config_file(
+            "experiments/mobility_behaviour/config.json",
+            custom_settings={"data": {"cache": True}},
+        )
+        cache_path = get_data_cache_path(config)
+        try:
+            data = Data.from_config(config)
+            assert cache_path.exists()
+            cached_data = Data.from_config(config)
+
+            np.testing.assert_array_equal(cached_data.features.values, data.features.values)
+            np.testing.assert_array_equal(cached_data.objects.locations, data.objects.locations)
+            np.testing.assert_array_equal(cached_data.geo_cost_matrix, data.geo_cost_matrix)
+            assert (cached_data.network.adj_mat != data.network.adj_mat).nnz == 0
+            for conf, cached_conf in zip(data.confounders.values(), cached_data.confounders.values()):
+                np.testing.assert_array_equal(cached_conf.group_assignment, conf.group_assignment)
+        finally:
+            shutil.rmtree(cache_path.parent, ignore_errors=True)
+        print("Data cache passed\n")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,7 @@
 import numpy as np
 import unittest
 
-from sbayes.sampling.state import CalculationNode, GroupedParameters
+from sbayes.sampling.state import CalculationNode, Clusters, GroupedParameters, UndoLog
 
 
 class TestArrayParameter(unittest.TestCase):
@@ -45,6 +45,142 @@ class TestArrayParameter(unittest.TestCase):
         self.assertEqual(self.param.value[1, 2], 1000)
         self.assertEqual(self.param.version, 1)
 
+    def test_change_propagation(self):
+        self.calc.add_input('param', self.param)
+        downstream = CalculationNode(0.0)
+        downstream.add_input('calc', self.calc)
+        self.calc.set_up_to_date()
+        downstream.set_up_to_date()
+
+        # Changes are pushed to all dependent nodes
+        self.param.set_items((1, 2), 1000)
+        with self.param.edit_group(2) as group:
+            group[:] = 1000
+        self.assertTrue(self.calc.is_outdated())
+        self.assertTrue(downstream.is_outdated())
+        self.assertEqual(self.calc.what_changed('param'), {1, 2})
+
+        self.calc.set_up_to_date()
+        self.assertFalse(self.calc.is_outdated())
+        self.assertEqual(self.calc.what_changed('param'), set())
+        self.assertEqual(self.calc.what_changed('param', caching=False), {0, 1, 2})
+
+        # Copies of a parameter do not notify the nodes of the original
+        self.param.copy().set_items(0, 1000)
+        self.assertFalse(self.calc.is_outdated())
+        with self.param.edit() as value:
+            value[0, 0] = 1000
+        self.assertEqual(self.calc.what_changed('param'), {0, 1, 2})
+
+    def test_rollback(self):
+        initial_value = self.param.value.copy()
+        self.calc.add_input('param', self.param)
+        self.calc.set_up_to_date()
+        self.param.undo_log = self.calc.undo_log = UndoLog()
+
+        # Change the parameter in all possible ways
+        self.param.set_items((1, 2), 1000)
+        with self.param.edit() as value:
+            value[0, 0] = 1000
+        with self.param.edit_group(2) as group:
+            group[:] = 1000
+        new_value = self.param.value.copy()
+        new_value[1, 1] = 1000
+        self.param.set_value(new_value)
+
+        # Rolling back restores the value and version numbers
+        self.param.undo_log.rollback()
+        np.testing.assert_array_equal(self.param.value, initial_value)
+        self.assertEqual(self.param.version, 0)
+        self.assertFalse(self.calc.is_outdated())
+        self.assertEqual(self.calc.what_changed('param'), set())
+        self.assertFalse(self.param.value.flags.writeable)
+
+
+class TestClusters(unittest.TestCase):
+
+    def setUp(self) -> None:
+        clusters = np.zeros((3, 10), dtype=bool)
+        clusters[0, :3] = True
+        clusters[1, 2:5] = True
+        self.clusters = Clusters(clusters)
+
+    def assert_occupancy(self):
+        np.testing.assert_array_equal(self.clusters.occupancy, self.clusters.value.sum(axis=0))
+        np.testing.assert_array_equal(self.clusters.any_cluster(), self.clusters.value.any(axis=0))
+
+    def test_occupancy(self):
+        self.assert_occupancy()
+
+        # Copies share the occupancy until one of them is changed
+        other = self.clusters.copy()
+        self.clusters.add_object(2, 9)
+        self.clusters.add_object(2, 9)
+        self.clusters.remove_object(0, 2)
+        self.clusters.remove_object(0, 7)
+        self.assert_occupancy()
+        np.testing.assert_array_equal(other.occupancy, other.value.sum(axis=0))
+
+        with self.clusters.edit_cluster(1) as c:
+            c[:] = ~c
+        self.assert_occupancy()
+        self.clusters.set_items((2, slice(None)), True)
+        self.assert_occupancy()
+
+    def test_rollback(self):
+        initial_occupancy = self.clusters.occupancy.copy()
+        self.clusters.undo_log = UndoLog()
+        self.clusters.add_object(2, 9)
+        self.clusters.remove_object(1, 3)
+        with self.clusters.edit_cluster(0) as c:
+            c[5:] = True
+        self.clusters.undo_log.rollback()
+        np.testing.assert_array_equal(self.clusters.occupancy, initial_occupancy)
+
+
+class TestCalculationNode(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.node = CalculationNode(np.arange(6.0).reshape((3, 2)))
+        self.node.set_up_to_date()
+        self.copy = CalculationNode(np.empty((3, 2)))
+        self.copy.assign_from(self.node)
+
+    def test_copy_on_write(self):
+        # The copy shares the value until one of the nodes is edited
+        self.assertTrue(np.shares_memory(self.copy.value, self.node.value))
+        self.assertFalse(self.copy.is_outdated())
+
+        with self.node.edit(rows=1) as value:
+            value[1] = 1000.
+        self.assertFalse(np.shares_memory(self.copy.value, self.node.value))
+        np.testing.assert_array_equal(self.copy.value, np.arange(6.0).reshape((3, 2)))
+
+        # The copy can still be edited (and copies the value, which is still shared)
+        with self.copy.edit() as value:
+            value[0] = -1.
+        self.assertEqual(self.node.value[0, 0], 0.)
+
+    def test_rollback(self):
+        initial_value = self.node.value.copy()
+
+        # Replace the shared value and roll back
+        self.node.undo_log = UndoLog()
+        self.node.update_value(np.zeros((3, 2)))
+        self.node.undo_log.rollback()
+        np.testing.assert_array_equal(self.node.value, initial_value)
+
+        # The restored value is still shared, so it is copied before it is edited
+        self.node.undo_log = UndoLog()
+        with self.node.edit(rows=2) as value:
+            value[2] = 1000.
+        np.testing.assert_array_equal(self.copy.value, initial_value)
+
+        # Rolling back the edit restores the value of the node
+        self.node.undo_log.rollback()
+        self.node.undo_log = None
+        np.testing.assert_array_equal(self.node.value, initial_value)
+
 
 if __name__ == '__main__':
     unittest.main()
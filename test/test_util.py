@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
+import tempfile
+import zlib
 import numpy as np
 import unittest
 
-from sbayes.util import log_multinom
+from sbayes.util import log_multinom, sample_dirichlet, get_best_permutation, get_permutations, \
+    format_cluster_columns, format_packed_clusters_header, pack_clusters
+from sbayes.results import Results
+from sbayes.preprocessing import compute_distance_matrix
 from scipy.special import binom
 
 log_binom = lambda n, k: np.log(binom(n, k))
@@ -52,6 +58,85 @@ class TestUtil(unittest.TestCase):
         K = 3
         ...
 
+    def test_sample_dirichlet(self):
+        # Three features with different sets of applicable states
+        alpha = np.array([[1., 2., 3.], [4., 1., 0.], [0.5, 0., 0.5]])
+        applicable = alpha > 0
+        samples = sample_dirichlet(np.repeat(alpha[np.newaxis], 20000, axis=0), applicable)
+
+        np.testing.assert_allclose(samples.sum(axis=-1), 1.0)
+        self.assertTrue(np.all(samples[:, ~applicable] == 0.0))
+
+        # The mean of a Dirichlet distribution is the normalized concentration
+        expected_mean = alpha / alpha.sum(axis=-1, keepdims=True)
+        np.testing.assert_allclose(samples.mean(axis=0), expected_mean, atol=0.01)
+
+    def test_best_permutation_vs_bruteforce(self):
+        for _ in range(50):
+            n_clusters = np.random.randint(2, 6)
+            clusters = np.random.random((n_clusters, 30)) < 0.3
+            prev_cluster_sum = np.random.randint(0, 20, size=(n_clusters, 30))
+
+            def agreement(p):
+                return np.sum(prev_cluster_sum * clusters[p, :])
+
+            best = max(get_permutations(n_clusters), key=agreement)
+            permutation = get_best_permutation(clusters, prev_cluster_sum)
+
+            self.assertEqual(sorted(permutation), list(range(n_clusters)))
+            # Ties may be broken differently, but the agreement must be optimal
+            self.assertEqual(agreement(permutation), agreement(best))
+
+    def test_cluster_encodings(self):
+        clusters = np.random.random((3, 50, 21)) < 0.3  # shape: (n_clusters, n_samples, n_sites)
+        samples = clusters.transpose((1, 0, 2))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            txt_path = os.path.join(tmp_dir, "clusters.txt")
+            with open(txt_path, "w") as f:
+                for s in samples:
+                    f.write(format_cluster_columns(s) + "\n")
+
+            bin_path = os.path.join(tmp_dir, "clusters.bin")
+            with open(bin_path, "wb") as f:
+                f.write(format_packed_clusters_header(3, 21, compressed=False))
+                for s in samples:
+                    f.write(pack_clusters(s))
+
+            zlib_path = os.path.join(tmp_dir, "clusters_zlib.bin")
+            with open(zlib_path, "wb") as f:
+                f.write(format_packed_clusters_header(3, 21, compressed=True))
+                f.write(zlib.compress(b"".join(map(pack_clusters, samples))))
+
+            for path in [txt_path, bin_path, zlib_path]:
+                np.testing.assert_array_equal(Results.read_clusters(path), clusters)
+                np.testing.assert_array_equal(Results.read_clusters(path, first_sample=10),
+                                              clusters[:, 10:])
+
+            # Lines of irregular length can not be memory-mapped, but are still supported
+            with open(txt_path, "a") as f:
+                f.write("\n")
+            np.testing.assert_array_equal(Results.read_clusters(txt_path), clusters)
+
+    def test_distance_matrix_blocks(self):
+        locations = np.column_stack([np.random.uniform(-180, 180, 50), np.random.uniform(-80, 80, 50)])
+        for geodesic in [False, True]:
+            dist_mat = compute_distance_matrix(locations, geodesic=geodesic)
+            np.testing.assert_array_equal(dist_mat, dist_mat.T)
+            np.testing.assert_array_equal(np.diag(dist_mat), 0.)
+
+            # The result does not depend on the partitioning into blocks
+            for block_size in [1, 7, 50, 120]:
+                blocked = compute_distance_matrix(locations, geodesic=geodesic, block_size=block_size)
+                np.testing.assert_allclose(blocked, dist_mat, rtol=1e-12)
+
+            dist_mat_32 = compute_distance_matrix(locations, geodesic=geodesic, dtype=np.float32)
+            self.assertEqual(dist_mat_32.dtype, np.float32)
+            np.testing.assert_allclose(dist_mat_32, dist_mat, rtol=1e-6)
+
+        euclidean = np.linalg.norm(locations[:, None] - locations, axis=-1)
+        np.testing.assert_allclose(compute_distance_matrix(locations), euclidean)
+
 
 if __name__ == '__main__':
     unittest.main()